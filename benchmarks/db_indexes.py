@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Benchmark the hot ingredient and order queries on SQLite, with and without
+the indexes from mixmind/migrations/3c1f9a2b7d40_query_path_indexes.py
+
+Builds a synthetic inventory in memory (no app or flask needed), prints the
+query plan and the mean time of each query before and after indexing:
+
+    python benchmarks/db_indexes.py --rows 100000
+"""
+import argparse
+import random
+import sqlite3
+import time
+import uuid
+
+CATEGORIES = 'Spirit Liqueur Vermouth Bitters Syrup Juice Mixer Wine Beer Dry Ice'.split()
+TYPES = ['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum',
+        'sweet vermouth', 'dry vermouth', 'cognac', 'tequila', 'campari', 'angostura bitters',
+        'simple syrup', 'lime juice', 'lemon juice', 'soda water', 'champagne', 'triple sec']
+
+SCHEMA = """
+CREATE TABLE ingredient (
+    uuid CHAR(32),
+    bar_id INTEGER NOT NULL,
+    "Category" VARCHAR(8),
+    "Type" VARCHAR(100) NOT NULL,
+    "Kind" VARCHAR(255) NOT NULL,
+    "In_Stock" BOOLEAN,
+    "ABV" FLOAT, "Size_mL" FLOAT, "Price_Paid" FLOAT,
+    type_ VARCHAR(100),
+    "Size_oz" FLOAT, "Cost_per_mL" FLOAT, "Cost_per_cL" FLOAT, "Cost_per_oz" FLOAT,
+    PRIMARY KEY (bar_id, "Type", "Kind")
+);
+CREATE TABLE "order" (
+    id INTEGER PRIMARY KEY,
+    bar_id INTEGER, user_id INTEGER, bartender_id INTEGER,
+    timestamp DATETIME, confirmed DATETIME,
+    user_email VARCHAR(127), recipe_name VARCHAR(127), recipe_html TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX ix_ingredient_bar_type ON ingredient (bar_id, type_, "In_Stock");
+CREATE INDEX ix_ingredient_bar_category ON ingredient (bar_id, "Category", "Type");
+CREATE UNIQUE INDEX ix_ingredient_uuid ON ingredient (uuid);
+CREATE INDEX ix_order_bar_timestamp ON "order" (bar_id, timestamp);
+CREATE INDEX ix_order_user_email_timestamp ON "order" (user_email, timestamp);
+CREATE INDEX ix_order_user_timestamp ON "order" (user_id, timestamp);
+CREATE INDEX ix_order_bartender ON "order" (bartender_id);
+ANALYZE;
+"""
+
+# name -> (sql, params), shaped like the queries the app issues
+QUERIES = {
+    'slice_on_type': ("SELECT * FROM ingredient WHERE type_ = ? AND bar_id = ? AND \"In_Stock\" = 1",
+        ('dry gin', 7)),
+    'slice_on_type kind': ("SELECT * FROM ingredient WHERE type_ = ? AND \"Kind\" = ? AND bar_id = ? AND \"In_Stock\" = 1",
+        ('dry gin', 'dry gin 3', 7)),
+    'slice_on_type like': ("SELECT * FROM ingredient WHERE type_ LIKE ? AND bar_id = ? AND \"In_Stock\" = 1",
+        ('%rum%', 7)),
+    'slice_on_type bitters': ("SELECT * FROM ingredient WHERE \"Category\" = ? AND bar_id = ? AND \"In_Stock\" = 1",
+        ('Bitters', 7)),
+    'bar ingredients': ("SELECT * FROM ingredient WHERE bar_id = ? ORDER BY \"Category\", \"Type\"",
+        (7,)),
+    'query_by_iid': ("SELECT * FROM ingredient WHERE uuid = ?",
+        None), # filled in with a real uuid
+    'bar orders': ("SELECT * FROM \"order\" WHERE bar_id = ? ORDER BY timestamp DESC LIMIT 50",
+        (3,)),
+    'user orders': ("SELECT * FROM \"order\" WHERE user_email = ? ORDER BY timestamp DESC",
+        ('user42@example.com',)),
+}
+
+def populate(conn, rows, bars, users, seed=0):
+    rng = random.Random(seed)
+    per_bar = rows // bars
+    ingredients = []
+    for bar_id in range(1, bars+1):
+        for i in range(per_bar):
+            type_ = TYPES[i % len(TYPES)]
+            category = 'Bitters' if 'bitters' in type_ else rng.choice(CATEGORIES)
+            size = rng.choice([375.0, 750.0, 1000.0])
+            price = rng.uniform(10, 60)
+            ingredients.append((uuid.uuid4().hex, bar_id, category, type_.title(), '{} {}'.format(type_, i // len(TYPES)),
+                rng.random() > 0.2, rng.uniform(0, 50), size, price, type_,
+                size / 29.57, price / size, price / size * 10, price / size * 29.57))
+    conn.executemany("INSERT INTO ingredient VALUES ({})".format(','.join('?'*14)), ingredients)
+    orders = []
+    start = time.mktime((2018, 1, 1, 0, 0, 0, 0, 0, 0))
+    for i in range(rows):
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + i * 60))
+        user = rng.randrange(users)
+        orders.append((i+1, rng.randint(1, bars), user, rng.randrange(users), ts, ts,
+            'user{}@example.com'.format(user), 'Martini', '<p>Martini</p>'))
+    conn.executemany("INSERT INTO \"order\" VALUES ({})".format(','.join('?'*9)), orders)
+    conn.commit()
+    return ingredients[len(ingredients)//2][0]
+
+def time_query(conn, sql, params, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat
+
+def query_plan(conn, sql, params):
+    return '; '.join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+def run(conn, queries, repeat, label):
+    print("\n== {} ==".format(label))
+    results = {}
+    for name, (sql, params) in queries.items():
+        results[name] = time_query(conn, sql, params, repeat)
+        print("{:<24} {:>9.3f} ms  {}".format(name, results[name]*1000, query_plan(conn, sql, params)))
+    return results
+
+def get_parser():
+    p = argparse.ArgumentParser(description="Benchmark ingredient/order query plans on SQLite")
+    p.add_argument('--rows', type=int, default=100000, help="Number of ingredient rows, and of order rows")
+    p.add_argument('--bars', type=int, default=20, help="Number of bars to spread the rows over")
+    p.add_argument('--users', type=int, default=1000, help="Number of distinct customers placing orders")
+    p.add_argument('--repeat', type=int, default=20, help="Runs of each query to average over")
+    p.add_argument('--db', default=':memory:', help="SQLite database file")
+    return p
+
+def main():
+    args = get_parser().parse_args()
+    conn = sqlite3.connect(args.db)
+    conn.executescript(SCHEMA)
+    start = time.perf_counter()
+    some_uuid = populate(conn, args.rows, args.bars, args.users)
+    print("Populated {} ingredients and {} orders in {:.1f}s".format(args.rows, args.rows, time.perf_counter() - start))
+    queries = dict(QUERIES)
+    queries['query_by_iid'] = (queries['query_by_iid'][0], (some_uuid,))
+
+    before = run(conn, queries, args.repeat, "without indexes")
+    start = time.perf_counter()
+    conn.executescript(INDEXES)
+    print("\nCreated indexes in {:.1f}s".format(time.perf_counter() - start))
+    after = run(conn, queries, args.repeat, "with indexes")
+
+    print("\n== speedup ==")
+    for name in queries:
+        print("{:<24} {:>8.1f}x".format(name, before[name] / after[name]))
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,13 @@ SQLALCHEMY_POOL_RECYCLE = 280 # https://help.pythonanywhere.com/pages/UsingSQLAl
 MAIL_SERVER = 'smtp.gmail.com'
 MAIL_PORT = 587
 MAIL_USE_TLS = True
+MIXMIND_MAIL_SENDER_THREAD = True # send queued mail from a background thread in each server process, started on its first request
+MIXMIND_MAIL_MAX_ATTEMPTS = 6 # then the mail is kept as a dead letter
+MIXMIND_MAIL_RETRY_SECONDS = 30 # first retry delay, doubled after each failure
+MIXMIND_MAIL_POLL_SECONDS = 60 # how often the sender checks for retries that are due
+MIXMIND_SMTP_POOL_SIZE = 2 # logged in SMTP connections kept open per process
+MIXMIND_SMTP_MAX_IDLE = 120 # seconds, close pooled connections idle for longer
+MIXMIND_SMTP_CHECK_AFTER = 10 # seconds idle before a pooled connection is checked with NOOP
 
 # flask-security
 SECURITY_CONFIRMABLE   =  True
@@ -43,6 +50,14 @@ MIXMIND_DEFAULT_RECIPES = ["recipes_schubar.json", "IBA_all.json"]
 MIXMIND_DEFAULT_INGREDIENTS = ["ExampleBarstock.csv"]
 
 MIXMIND_DEFAULT_BAR_NAME = u"Home Bar"
+MIXMIND_INGREDIENTS_CLIENT_SIDE_MAX = 500 # larger inventories are paged on the server in the ingredients table
+MIXMIND_BAR_CONFIG_TTL = None # seconds, reload bar configs periodically when running multiple processes
+MIXMIND_JOB_WORKERS = 1 # background job threads per server process, started on its first request, 0 to only queue jobs here
+MIXMIND_JOB_STALE_SECONDS = 3600 # a running job not updated for this long may be resumed by another process
+MIXMIND_QUEUE_POLL_SECONDS = 2 # order queue streams check the database this often, for orders from other processes
+MIXMIND_QUEUE_STREAM_SECONDS = 300 # order queue streams end after this long, and the browser reconnects
+MIXMIND_MENU_DIR = "menus" # generated menus and their recipe tex fragments, under MIXMIND_DIR
+MIXMIND_MENU_TEX_ONLY = False # only generate the .tex of menus, for hosts without a TeX install
 
 # time
 TIMEZONE = 'US/Eastern'
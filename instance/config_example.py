@@ -30,6 +30,13 @@ PyA_URI = "mysql+mysqldb://{user}:{passw}@{host}/{user}${dbname}"
 if env == 'development':
     SQLALCHEMY_DATABASE_URI = "sqlite:///test.db"
 
+# the tests, in a throwaway database
+elif env == 'testing':
+    SQLALCHEMY_DATABASE_URI = "sqlite:///test_mixmind.db"
+    MIXMIND_DEFAULT_RECIPES = ["IBA_all.json"]
+    MIXMIND_MAIL_SENDER_THREAD = False # the tests send and run these themselves
+    MIXMIND_JOB_WORKERS = 0
+
 # PythonAnywhere environments
 elif env == 'development-PyA':
     SQLALCHEMY_DATABASE_URI = PyA_URI.format(user=PyA_USER, passw=PyA_PASS, host=PyA_HOST,
@@ -22,13 +22,17 @@ alembic.init_app(app)
 with app.app_context():
     init_db()
 
-from mixmind.notifier import mail
+from mixmind.notifier import mail, outbox
 mail.init_app(app)
+outbox.init_app(app)
 
 from mixmind.configuration_management import MixMindServer, get_bar_config
 with app.app_context():
     mms = MixMindServer(app)
 
+from mixmind.jobs import job_runner
+job_runner.init_app(app)
+
 from werkzeug.local import LocalProxy
 current_bar = LocalProxy(get_bar_config)
 
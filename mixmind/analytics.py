@@ -0,0 +1,138 @@
+""" Order analytics from rollups
+Every order bumps a row per grain (hour and day) in order_rollup, keyed by
+bar, recipe, and the bucket the order was placed in, and confirming it adds
+its time to confirm to the same rows. Reports sum over the buckets in a
+range, so their cost depends on the number of buckets, not of orders.
+"""
+import datetime
+from collections import defaultdict
+
+import click
+from sqlalchemy import and_, case, func
+from sqlalchemy.exc import IntegrityError
+
+from .database import db
+from .models import Order, OrderRollup
+from . import app
+from .logger import get_logger
+log = get_logger(__name__)
+
+GRAINS = ('hour', 'day')
+
+def bucket_start(timestamp, grain):
+    if grain == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def confirm_seconds(order):
+    return max(0.0, (order.confirmed - order.timestamp).total_seconds())
+
+def _bump(bar_id, recipe_name, grain, bucket, orders=0, seconds=None):
+    """ Add to one rollup row, creating it if need be """
+    key = and_(OrderRollup.bar_id == bar_id, OrderRollup.recipe_name == recipe_name,
+            OrderRollup.grain == grain, OrderRollup.bucket == bucket)
+    values = {OrderRollup.orders: OrderRollup.orders + orders}
+    if seconds is not None:
+        values.update({
+            OrderRollup.confirmed: OrderRollup.confirmed + 1,
+            OrderRollup.confirm_seconds: OrderRollup.confirm_seconds + seconds,
+            OrderRollup.min_confirm_seconds: case([(OrderRollup.min_confirm_seconds == None, seconds),
+                (OrderRollup.min_confirm_seconds > seconds, seconds)], else_=OrderRollup.min_confirm_seconds),
+            OrderRollup.max_confirm_seconds: case([(OrderRollup.max_confirm_seconds == None, seconds),
+                (OrderRollup.max_confirm_seconds < seconds, seconds)], else_=OrderRollup.max_confirm_seconds),
+            })
+    if db.session.query(OrderRollup).filter(key).update(values, synchronize_session=False):
+        return
+    row = OrderRollup(bar_id=bar_id, recipe_name=recipe_name, grain=grain, bucket=bucket, orders=orders,
+            confirmed=0 if seconds is None else 1, confirm_seconds=seconds or 0.0,
+            min_confirm_seconds=seconds, max_confirm_seconds=seconds)
+    try:
+        with db.session.begin_nested():
+            db.session.add(row)
+    except IntegrityError:
+        # created by a concurrent order in the meantime
+        db.session.query(OrderRollup).filter(key).update(values, synchronize_session=False)
+
+def record_order(order):
+    """ Count a new order, in the caller's transaction """
+    for grain in GRAINS:
+        _bump(order.bar_id, order.recipe_name, grain, bucket_start(order.timestamp, grain), orders=1)
+
+def record_confirm(order):
+    """ Add an order's time to confirm, in the caller's transaction """
+    seconds = confirm_seconds(order)
+    for grain in GRAINS:
+        _bump(order.bar_id, order.recipe_name, grain, bucket_start(order.timestamp, grain), seconds=seconds)
+
+def backfill(bar_id=None, batch=1000):
+    """ Rebuild the rollups from the orders, for one bar or all of them
+    :returns: number of orders counted
+    """
+    rows = defaultdict(lambda: {'orders': 0, 'confirmed': 0, 'confirm_seconds': 0.0,
+        'min_confirm_seconds': None, 'max_confirm_seconds': None})
+    query = db.session.query(Order.bar_id, Order.recipe_name, Order.timestamp, Order.confirmed)
+    if bar_id is not None:
+        query = query.filter(Order.bar_id == bar_id)
+    n_orders = 0
+    for order in query.yield_per(batch):
+        if order.bar_id is None or order.timestamp is None:
+            continue
+        n_orders += 1
+        seconds = confirm_seconds(order) if order.confirmed else None
+        for grain in GRAINS:
+            row = rows[(order.bar_id, order.recipe_name, grain, bucket_start(order.timestamp, grain))]
+            row['orders'] += 1
+            if seconds is not None:
+                row['confirmed'] += 1
+                row['confirm_seconds'] += seconds
+                row['min_confirm_seconds'] = seconds if row['min_confirm_seconds'] is None else min(row['min_confirm_seconds'], seconds)
+                row['max_confirm_seconds'] = seconds if row['max_confirm_seconds'] is None else max(row['max_confirm_seconds'], seconds)
+
+    delete = db.session.query(OrderRollup)
+    if bar_id is not None:
+        delete = delete.filter(OrderRollup.bar_id == bar_id)
+    delete.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(OrderRollup, [dict(bar_id=key[0], recipe_name=key[1], grain=key[2], bucket=key[3], **row)
+        for key, row in rows.items()])
+    db.session.commit()
+    return n_orders
+
+def _stats(orders, confirmed, seconds):
+    return {'orders': int(orders or 0), 'confirmed': int(confirmed or 0),
+            'mean_confirm_seconds': round(seconds / confirmed, 1) if confirmed else None}
+
+def recipe_stats(bar_id, since, until=None, limit=20):
+    """ Most ordered recipes at the bar in the range, from the day rollups """
+    query = db.session.query(OrderRollup.recipe_name, func.sum(OrderRollup.orders).label('orders'),
+            func.sum(OrderRollup.confirmed), func.sum(OrderRollup.confirm_seconds),
+            func.min(OrderRollup.min_confirm_seconds), func.max(OrderRollup.max_confirm_seconds)) \
+        .filter(OrderRollup.grain == 'day', OrderRollup.bucket >= bucket_start(since, 'day'))
+    if bar_id is not None:
+        query = query.filter(OrderRollup.bar_id == bar_id)
+    if until is not None:
+        query = query.filter(OrderRollup.bucket < until)
+    rows = query.group_by(OrderRollup.recipe_name).order_by(func.sum(OrderRollup.orders).desc(),
+            OrderRollup.recipe_name).limit(limit)
+    return [dict(recipe_name=name, min_confirm_seconds=fastest, max_confirm_seconds=slowest, **_stats(orders, confirmed, seconds))
+            for name, orders, confirmed, seconds, fastest, slowest in rows]
+
+def timeline(bar_id, since, until=None, grain='day'):
+    """ Orders and time to confirm per hour or day in the range, all recipes """
+    query = db.session.query(OrderRollup.bucket, func.sum(OrderRollup.orders),
+            func.sum(OrderRollup.confirmed), func.sum(OrderRollup.confirm_seconds)) \
+        .filter(OrderRollup.grain == grain, OrderRollup.bucket >= bucket_start(since, grain))
+    if bar_id is not None:
+        query = query.filter(OrderRollup.bar_id == bar_id)
+    if until is not None:
+        query = query.filter(OrderRollup.bucket < until)
+    rows = query.group_by(OrderRollup.bucket).order_by(OrderRollup.bucket)
+    return [dict(bucket=bucket.isoformat(), **_stats(orders, confirmed, seconds))
+            for bucket, orders, confirmed, seconds in rows]
+
+@app.cli.command('rollup-backfill')
+@click.option('--bar-id', type=int, default=None, help="Only rebuild this bar's rollups")
+def backfill_command(bar_id):
+    """ Rebuild the order rollups from the order history """
+    start = datetime.datetime.now()
+    n_orders = backfill(bar_id)
+    click.echo("Rolled up {} orders in {:.1f}s".format(n_orders, (datetime.datetime.now() - start).total_seconds()))
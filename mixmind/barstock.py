@@ -1,5 +1,5 @@
 import csv
-import string
+import io
 import itertools
 import codecs
 
@@ -9,12 +9,13 @@ try:
 except ImportError:
     has_pandas = False
 
-from sqlalchemy import and_
+from sqlalchemy import and_, select, literal, func
 from sqlalchemy.exc import SQLAlchemyError
 
 from . import util
 from .database import db
-from .ingredient import Categories, Ingredient, display_name_mappings
+from .ingredient import Categories, Ingredient, IngredientTombstone, display_name_mappings
+from .models import Bar
 from .logger import get_logger
 log = get_logger(__name__)
 
@@ -55,9 +56,82 @@ def _update_computed_fields(row):
     except ZeroDivisionError:
         log.warning("Ingredient missing size field: {}".format(row))
 
+def stock_version(bar_id):
+    return db.session.query(Bar.stock_version).filter(Bar.id == bar_id).scalar() or 0
+
+def next_stock_version(bar_id):
+    """ Bump and return the bar's stock version, as part of the current
+    transaction so changes are numbered in commit order
+    """
+    Bar.query.filter_by(id=bar_id).update({Bar.stock_version: func.coalesce(Bar.stock_version, 0) + 1},
+            synchronize_session=False)
+    return stock_version(bar_id)
+
+def mark_changed(ingredient, version=None):
+    """ Call before committing any change to an ingredient
+    :param int version: from next_stock_version, to number a batch of changes together
+    """
+    ingredient.change_seq = version or next_stock_version(ingredient.bar_id)
+
+def mark_deleted(ingredient, version=None):
+    """ Call before committing the deletion of an ingredient """
+    db.session.add(IngredientTombstone(bar_id=ingredient.bar_id, uuid=ingredient.uuid,
+        change_seq=version or next_stock_version(ingredient.bar_id)))
+
+EDITABLE_FIELDS = "Category,Type,Kind,In_Stock,ABV,Size_mL,Size_oz,Price_Paid".split(',')
+
+def edit_ingredient(ingredient, field, value):
+    """ Coerce the value for the field and apply it, updating the computed
+    fields, but without committing
+    :param string value: as sent by the ingredient table, the toggle switches
+        send their current state 'on'/'off' which is toggled here
+    :raises ValueError: with a message for the user if the edit is invalid
+    """
+    if field not in EDITABLE_FIELDS:
+        raise ValueError("'{}' is not allowed to be edited via the API".format(field))
+    if value is None or value == '':
+        raise ValueError("'value' is a required parameter")
+    # TODO value constraints
+    if field == 'In_Stock':
+        try:
+            value = {'on': False, 'off': True}[value]
+        except KeyError:
+            raise ValueError("In_Stock must be 'on' or 'off'")
+    elif field == 'Category':
+        if value not in Categories:
+            raise ValueError("'{}' is not a valid Category".format(value))
+    else:
+        value = type(ingredient[field])(value)
+
+    # special handling
+    if field == 'Size_oz':
+        # convert to mL because that's how everything works
+        ingredient['Size_mL'] = util.convert_units(value, 'oz', 'mL')
+    else:
+        ingredient[field] = value
+    if field in ['Size_mL', 'Size_oz', 'Price_Paid', 'Type']:
+        _update_computed_fields(ingredient)
+
 class DataError(Exception):
     pass
 
+CSV_CHUNK_ROWS = 500
+ANY_SPIRIT = ['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum', 'genever', 'cognac', 'brandy', 'aquavit']
+
+def type_match(specifier):
+    """ How rows are matched to an ingredient specifier, handles several special cases
+    :returns: (match, value) where match is one of 'contains', 'in', 'category',
+        'equals' and the value is compared to the row's type_ (or Category)
+    """
+    type_ = specifier.ingredient.lower()
+    if type_ in ['rum', 'whiskey', 'whisky', 'tequila', 'vermouth']:
+        return 'contains', 'whisk' if type_ == 'whisky' else type_
+    elif type_ == 'any spirit':
+        return 'in', ANY_SPIRIT
+    elif type_ == 'bitters':
+        return 'category', 'Bitters'
+    return 'equals', type_
+
 class Barstock(object):
     pass
 
@@ -69,9 +143,14 @@ class Barstock_SQL(Barstock):
         if replace_existing is True, will replace the whole db for this bar
         bar_id is the active bar
         """
+        # the whole load is one change to the stock, committed at once
+        version = next_stock_version(bar_id)
         if replace_existing:
+            # one tombstone per row, all at the same version
+            db.session.execute(IngredientTombstone.__table__.insert().from_select(
+                ['bar_id', 'uuid', 'change_seq'],
+                select([Ingredient.bar_id, Ingredient.uuid, literal(version)]).where(Ingredient.bar_id == bar_id)))
             rows_deleted = Ingredient.query.filter_by(bar_id=bar_id).delete()
-            db.session.commit()
             log.info("Dropped {} rows for {} table".format(rows_deleted, Ingredient.__tablename__))
         for csv_file in csv_list:
             # utf-8-sig handles the BOM, /uffef
@@ -79,13 +158,18 @@ class Barstock_SQL(Barstock):
                 reader = csv.DictReader(fp)
                 for row in reader:
                     try:
-                        self.add_row(row, bar_id)
+                        with db.session.begin_nested():
+                            self.add_row(row, bar_id, version=version, commit=False)
                     except DataError as e:
                         log.warning(e)
+        db.session.commit()
 
-    def add_row(self, row, bar_id):
+    def add_row(self, row, bar_id, version=None, commit=True):
         """ where row is a dict of fields from the csv
-        returns the Model object for the updated/inserted row"""
+        returns the Model object for the updated/inserted row
+        :param int version: stock version of a batch of rows, see mark_changed
+        :param bool commit: False to leave committing the transaction to the caller
+        """
         if not row.get('Ingredient', row.get('Type')) or not row.get('Kind', row.get('Bottle')):
             log.debug("Primary key (Ingredient, Kind) missing, skipping ingredient: {}".format(row))
             return
@@ -100,12 +184,20 @@ class Barstock_SQL(Barstock):
                 for k, v in clean_row.items():
                     row[k] = v
                 _update_computed_fields(row)
-                db.session.commit()
+                mark_changed(row, version)
+                if commit:
+                    db.session.commit()
+                else:
+                    db.session.flush()
                 return row
             else: # insert
                 _update_computed_fields(ingredient)
+                mark_changed(ingredient, version)
                 db.session.add(ingredient)
-                db.session.commit()
+                if commit:
+                    db.session.commit()
+                else:
+                    db.session.flush()
                 return ingredient
         except SQLAlchemyError as err:
             msg = "{}: on row: {}".format(err, clean_row)
@@ -150,17 +242,15 @@ class Barstock_SQL(Barstock):
         """ Return query results for rows matching an ingredient specifier
         Handles several special cases
         """
-        type_ = specifier.ingredient.lower()
-        if type_ in ['rum', 'whiskey', 'whisky', 'tequila', 'vermouth']:
-            type_ = 'whisk' if type_ == 'whisky' else type_
-            filter_ = Ingredient.type_.like('%{}%'.format(type_))
-        elif type_ == 'any spirit':
-            spirits = ['dry gin', 'rye whiskey', 'bourbon whiskey', 'amber rum', 'dark rum', 'white rum', 'genever', 'cognac', 'brandy', 'aquavit']
-            filter_ = Ingredient.type_.in_(spirits)
-        elif type_ == 'bitters':
-            filter_ = Ingredient.Category == 'Bitters'
+        match, value = type_match(specifier)
+        if match == 'contains':
+            filter_ = Ingredient.type_.like('%{}%'.format(value))
+        elif match == 'in':
+            filter_ = Ingredient.type_.in_(value)
+        elif match == 'category':
+            filter_ = Ingredient.Category == value
         else:
-            filter_ = Ingredient.type_ == type_
+            filter_ = Ingredient.type_ == value
 
         if specifier.kind:
             filter_ = and_(filter_, Ingredient.Kind == specifier.kind)
@@ -168,13 +258,61 @@ class Barstock_SQL(Barstock):
         filter_ = and_(filter_, Ingredient.bar_id == self.bar_id, Ingredient.In_Stock == True)
         return Ingredient.query.filter(filter_).all()
 
+    def iter_csv(self, labels=None, chunk_rows=CSV_CHUNK_ROWS):
+        """ Yield this bar's ingredients as CSV text, a chunk of rows at a
+        time, streaming them from the database so memory use stays flat
+        :param list labels: CSV headings from display_name_mappings, e.g.
+            Ingredient._csv_labels for a file that can be uploaded again,
+            default is every column of the table
+        """
+        if labels:
+            attrs = [display_name_mappings[label]['k'] for label in labels]
+        else:
+            labels = attrs = list(Ingredient.__table__.columns.keys())
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        writer.writerow(labels)
+        for i, row in enumerate(self._export_rows(chunk_rows), 1):
+            writer.writerow([row[attr] for attr in attrs])
+            if i % chunk_rows == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    def _export_rows(self, chunk_rows):
+        query = Ingredient.query.filter_by(bar_id=self.bar_id).order_by(Ingredient.Category, Ingredient.Type)
+        return query.yield_per(chunk_rows)
+
     def to_csv(self):
-        cols = list(Ingredient.__table__.columns.keys())
-        result = [','.join(cols)]
-        for row in Ingredient.query.all():
-            result.append(','.join([str(row[col]) for col in cols]))
-        return '\n'.join(result)
+        return ''.join(self.iter_csv())
+
+
+class Barstock_Memory(Barstock_SQL):
+    """ Barstock over a list of Ingredient objects that aren't in the
+    database, to see what could be made with a stock before committing it
+    """
+    def __init__(self, bar_id, ingredients):
+        self.bar_id = bar_id
+        self.all_ingredients = list(ingredients) # exported, out of stock ones too
+        self.ingredients = [i for i in self.all_ingredients if i.In_Stock]
+
+    def slice_on_type(self, specifier):
+        match, value = type_match(specifier)
+        if match == 'contains':
+            rows = [i for i in self.ingredients if value in (i.type_ or '')]
+        elif match == 'in':
+            rows = [i for i in self.ingredients if i.type_ in value]
+        elif match == 'category':
+            rows = [i for i in self.ingredients if i.Category == value]
+        else:
+            rows = [i for i in self.ingredients if i.type_ == value]
+        if specifier.kind:
+            rows = [i for i in rows if i.Kind == specifier.kind]
+        return rows
 
+    def _export_rows(self, chunk_rows):
+        return sorted(self.all_ingredients, key=lambda i: (i.Category or '', i.Type or ''))
 
 class Barstock_DF(Barstock):
     """ Wrap up a csv of kind info with some helpful methods
@@ -259,7 +397,7 @@ class Barstock_DF(Barstock):
             df[col] = df[col].replace('[\$,]', '', regex=True).astype(float)
         df = df.fillna(0)
         _calculated_columns(df)
-        df['type'] = list(map(string.lower, df['Type']))
+        df['type'] = list(map(str.lower, df['Type']))
         df['Category'] = pd.Categorical(df['Category'], Categories)
 
         # drop out of stock items
@@ -6,12 +6,17 @@ TODO:
     - recipe library still technically needs synchronization
 """
 import os.path
-from collections import namedtuple
+import time
+import threading
+from collections import namedtuple, OrderedDict
 
-from flask import g, flash
+from flask import g, flash, current_app
 from flask_login import current_user
 
 from .recipe import DrinkRecipe
+from .library import RecipeLibrary, RecipeNameIndex
+from .similarity import SimilarityIndex
+from .search import TrigramIndex
 from .barstock import Barstock_SQL, Ingredient
 from .database import db
 from .models import Bar, User
@@ -66,70 +71,193 @@ class MixMindServer():
         recipe_files = get_recipe_files(app)
         log.info("STARTUP: Loading recipes from files: {}".format(recipe_files))
         self.base_recipes = load_recipe_json(recipe_files)
-        self._processed_recipes = {}
+        self._libraries = {}
+        self._lock = threading.RLock() # held while a bar's library is generated or replaced
+        # the base recipes only change with a restart, so their indexes are built once
+        self.similarity_index = SimilarityIndex(DrinkRecipe(name, recipe) for name, recipe in self.base_recipes.items())
+        self.recipe_names = RecipeNameIndex(self.base_recipes)
+        self._search_index = None
+
+    def library(self, bar):
+        """Allow lazy loading of the recipe library for a given bar"""
+        library = self._libraries.get(bar.id)
+        if library is None:
+            with self._lock:
+                if bar.id not in self._libraries:
+                    self.generate_recipes(bar)
+                library = self._libraries[bar.id]
+        return library
 
     def processed_recipes(self, bar):
-        """Allow lazy loading of the recipes for a given bar"""
-        if bar.id not in self._processed_recipes:
-            self.generate_recipes(bar)
-        return self._processed_recipes[bar.id]
+        return self.library(bar).recipes
+
+    def resolve_recipe_name(self, name):
+        """Exact name of the base recipe for a name in any case, or a slug, None if unknown"""
+        return self.recipe_names.resolve(name)
+
+    def recipe_slug(self, name):
+        return self.recipe_names.slug(name)
 
     def find_recipe(self, bar, name):
-        """Find specific recipe at bar"""
-        for recipe in self.processed_recipes(bar):
-            if recipe.name == name:
-                return recipe
-        return None
+        """Find specific recipe at bar, by name or slug"""
+        name = self.resolve_recipe_name(name)
+        if name is None:
+            return None
+        return self.library(bar).by_name.get(name)
 
     def generate_recipes(self, bar):
         log.info("Generating recipe library for {}".format(bar.cname))
         barstock = Barstock_SQL(bar.id)
-        self._processed_recipes[bar.id] = [DrinkRecipe(name, recipe).generate_examples(barstock, stats=True)
-                for name, recipe in list(self.base_recipes.items())]
+        self._libraries[bar.id] = RecipeLibrary([DrinkRecipe(name, recipe).generate_examples(barstock, stats=True)
+                for name, recipe in list(self.base_recipes.items())])
+
+    def search_index(self):
+        """Fuzzy text index of the base recipes, built on first use"""
+        if self._search_index is None:
+            self._search_index = TrigramIndex(DrinkRecipe(name, recipe) for name, recipe in self.base_recipes.items())
+        return self._search_index
+
+    def similar_recipes(self, bar, recipe_name, k=4, only_available=True):
+        """Recipes at the bar most like the given one, from the precomputed neighbours
+        :param int k: max number of results, up to similarity.NEIGHBOURS
+        :param bool only_available: skip recipes that can't be made at the bar
+        :returns: list of (DrinkRecipe, score) pairs, best first
+        """
+        if k > self.similarity_index.k:
+            raise ValueError("At most {} similar recipes are kept per recipe".format(self.similarity_index.k))
+        by_name = self.library(bar).by_name
+        similar = []
+        for name, score in self.similarity_index.similar(recipe_name):
+            recipe = by_name.get(name)
+            if recipe is None or (only_available and not recipe.can_make):
+                continue
+            similar.append((recipe, score))
+            if len(similar) >= k:
+                break
+        return similar
 
-    def regenerate_recipes(self, bar, ingredient=None, recipe_name=None):
+    def regenerate_recipes(self, bar, ingredient=None, recipe_name=None, ingredients=None, progress=None):
         """Regenerate the examples and statistics data for the recipes at the given bar
+        The regenerated recipes go in a new library that replaces the old one when
+        done, so requests reading the library meanwhile never see it half updated
         :param string ingredient: only updates recipes with the given ingredient
         :param string reipce_name: only updates the given recipe
+        :param set ingredients: only updates recipes with any of these ingredients, each recipe once
+        :param progress: called as progress(done, total) while recipes are regenerated
         """
         if ingredient:
-            log.info("Updating recipes containing {} for {}".format(ingredient, bar.cname))
-            [recipe.generate_examples(Barstock_SQL(bar.id), stats=True) for recipe in self.processed_recipes(bar)
-                            if recipe.contains_ingredient(ingredient)]
-        elif recipe_name:
-            recipe = find_recipe(bar, recipe_name)
-            if recipe is None:
-                log.info("Error: no recipe found matching name \"{}\"".format(recipe_name))
-            log.info("Updating recipe {} at {}".format(recipe, bar.cname))
-            recipe.generate_examples(Barstock_SQL(bar.id), stats=True)
-        else:
-            log.info("Regenerating recipe library for {}".format(bar.cname))
-            [recipe.generate_examples(Barstock_SQL(bar.id), stats=True) for recipe in self.processed_recipes(bar)]
+            ingredients = {ingredient}
+        with self._lock:
+            current = self.processed_recipes(bar)
+            if ingredients:
+                ingredients = {i for i in ingredients if i}
+                log.info("Updating recipes containing {} for {}".format(', '.join(sorted(ingredients)), bar.cname))
+                stale = {recipe.name for recipe in current if any(recipe.contains_ingredient(i) for i in ingredients)}
+            elif recipe_name:
+                name = self.resolve_recipe_name(recipe_name)
+                if name is None:
+                    log.info("Error: no recipe found matching name \"{}\"".format(recipe_name))
+                    return
+                log.info("Updating recipe {} at {}".format(name, bar.cname))
+                stale = {name}
+            else:
+                log.info("Regenerating recipe library for {}".format(bar.cname))
+                stale = {recipe.name for recipe in current}
+            barstock = Barstock_SQL(bar.id)
+            recipes = []
+            done = 0
+            for recipe in current:
+                if recipe.name in stale:
+                    if progress:
+                        progress(done, len(stale))
+                    done += 1
+                    recipe = DrinkRecipe(recipe.name, self.base_recipes[recipe.name]).generate_examples(barstock, stats=True)
+                recipes.append(recipe)
+            self._libraries[bar.id] = RecipeLibrary(recipes)
+
+UserInfo = namedtuple("UserInfo", "id,email,name")
+
+class BarConfig(namedtuple("BarConfig", "id,cname,name,tagline,owner,bartender,markup,prices,stats,examples,convert,prep_line,origin,info,variants,summarize,is_closed,is_public,is_default")):
+    """ Snapshot of a bar's settings, owner and bartender are UserInfo or None
+    """
+    __slots__ = ()
+    def is_owner(self, user):
+        return bool(self.owner) and user.is_authenticated and user.id == self.owner.id
+    def is_bartender(self, user):
+        return bool(self.bartender) and user.is_authenticated and user.id == self.bartender.id
+
+class BarConfigCache(object):
+    """ Process wide snapshot of every bar's config, so requests don't hit
+    the database to find out which bar they're at
 
-BarConfig = namedtuple("BarConfig", "id,cname,name,tagline,owner,bartender,markup,prices,stats,examples,convert,prep_line,origin,info,variants,summarize,is_closed,is_public")
+    Views that commit changes to a bar, its owner, or its bartender must call
+    invalidate(), the next request then reloads all bars in two queries.
+    Set MIXMIND_BAR_CONFIG_TTL (seconds) to also reload periodically, for
+    deployments with several worker processes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._loaded_version = None
+        self._loaded_at = 0
+        self.bars = OrderedDict() # id -> BarConfig
+        self.default_ids = []
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def load(self, ttl=None):
+        """ Return the current snapshot, reloading it if stale
+        :returns: (OrderedDict of id -> BarConfig, list of default bar ids)
+        """
+        with self._lock:
+            expired = ttl and time.time() - self._loaded_at > ttl
+            if self._loaded_version != self.version or expired:
+                self._reload()
+            return self.bars, self.default_ids
+
+    def _reload(self):
+        bars = Bar.query.order_by(Bar.id).all()
+        user_ids = {bar.owner_id for bar in bars} | {bar.bartender_on_duty for bar in bars}
+        user_ids.discard(None)
+        users = {user.id: UserInfo(user.id, user.email, user.get_name())
+                for user in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+        self.bars = OrderedDict()
+        for bar in bars:
+            bartender = users.get(bar.bartender_on_duty)
+            self.bars[bar.id] = BarConfig(id=bar.id, cname=bar.cname, name=bar.name,
+                tagline=bar.tagline, owner=users.get(bar.owner_id), bartender=bartender, markup=bar.markup,
+                prices=bar.prices, stats=bar.stats, examples=bar.examples, convert=bar.convert,
+                prep_line=bar.prep_line, origin=bar.origin, info=bar.info, variants=bar.variants,
+                summarize=bar.summarize, is_closed=not bartender, is_public=bar.is_public,
+                is_default=bar.is_default)
+        self.default_ids = [bar.id for bar in bars if bar.is_default]
+        self._loaded_version = self.version
+        self._loaded_at = time.time()
+        log.info("Loaded config for {} bars".format(len(self.bars)))
+
+bar_configs = BarConfigCache()
+
+def invalidate_bar_config():
+    """Call after committing changes to any bar"""
+    bar_configs.invalidate()
 
 def get_bar_config():
     """ For now, only one bar bay me "active" at a time
     """
-    if 'bar_list' not in g:
-        # HAX just putting it here for now to get initialized
-        g.bar_list = Bar.query.all()
     if 'current_bar' not in g:
+        bars, default_ids = bar_configs.load(current_app.config.get('MIXMIND_BAR_CONFIG_TTL'))
+        g.bar_list = list(bars.values())
         bar = None
         if current_user.is_authenticated and current_user.current_bar_id:
-            bar = Bar.query.filter_by(id=current_user.current_bar_id).one_or_none()
+            bar = bars.get(current_user.current_bar_id)
         if not bar:
-            default_list = Bar.query.filter_by(is_default=True).all()
-            if len(default_list) == 0:
+            if len(default_ids) == 0:
                 flash("No bars currently set to default!", 'danger')
                 raise RuntimeError("No bar set to default in the database - must be at least one.")
-            elif len(default_list) > 1:
+            elif len(default_ids) > 1:
                 flash("More than one bar is set to default, using first one", 'danger')
-            bar = default_list[0]
-        bartender = User.query.filter_by(id=bar.bartender_on_duty).one_or_none()
-        g.current_bar = BarConfig(id=bar.id, cname=bar.cname, name=bar.name,
-                tagline=bar.tagline, owner=bar.owner, bartender=bartender, markup=bar.markup,
-                prices=bar.prices, stats=bar.stats, examples=bar.examples, convert=bar.convert,
-                prep_line=bar.prep_line, origin=bar.origin, info=bar.info, variants=bar.variants,
-                summarize=bar.summarize, is_closed=not bartender, is_public=bar.is_public)
+            bar = bars[default_ids[0]]
+        g.current_bar = bar
     return g.current_bar
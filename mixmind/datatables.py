@@ -0,0 +1,61 @@
+""" Server side processing for DataTables
+Parses the paging, ordering, and search parameters DataTables sends with
+serverSide: true, and applies them to a query so only one page of rows is
+loaded from the database. https://datatables.net/manual/server-side
+"""
+from flask import jsonify
+from sqlalchemy import or_
+
+DEFAULT_LENGTH = 25
+MAX_LENGTH = 500
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+class DataTablesRequest(object):
+    """ One DataTables ajax request against a query
+
+    :param args: the request args
+    :param list columns: column expressions in the order of the table's
+        columns, None for columns that can't be sorted on
+    :param list searchable: column expressions to match the search box against
+    """
+    def __init__(self, args, columns, searchable=()):
+        self.columns = columns
+        self.searchable = searchable
+        self.draw = args.get('draw', 0, type=int)
+        self.start = max(0, args.get('start', 0, type=int))
+        length = args.get('length', DEFAULT_LENGTH, type=int)
+        self.length = MAX_LENGTH if length < 0 else min(length, MAX_LENGTH) # -1 is "All"
+        self.search = args.get('search[value]', '').strip()
+        self.order = []
+        i = 0
+        while 'order[{}][column]'.format(i) in args:
+            column = args.get('order[{}][column]'.format(i), -1, type=int)
+            if 0 <= column < len(columns) and columns[column] is not None:
+                descending = args.get('order[{}][dir]'.format(i)) == 'desc'
+                self.order.append(columns[column].desc() if descending else columns[column].asc())
+            i += 1
+
+    def page(self, query, tiebreak=None):
+        """ Apply the search, ordering, and paging to the query
+        :param tiebreak: column, or list of columns, that are unique together,
+            ordered by last so pages are stable
+        :returns: (rows, total count, count after search)
+        """
+        total = query.order_by(None).count()
+        filtered = total
+        if self.search and self.searchable:
+            pattern = '%{}%'.format(escape_like(self.search))
+            query = query.filter(or_(*(column.ilike(pattern, escape='\\') for column in self.searchable)))
+            filtered = query.order_by(None).count()
+        order = list(self.order)
+        if isinstance(tiebreak, (list, tuple)):
+            order.extend(tiebreak)
+        elif tiebreak is not None:
+            order.append(tiebreak)
+        rows = query.order_by(*order).offset(self.start).limit(self.length).all()
+        return rows, total, filtered
+
+    def response(self, data, total, filtered, **extra):
+        return jsonify(draw=self.draw, recordsTotal=total, recordsFiltered=filtered, data=data, **extra)
@@ -6,6 +6,9 @@ from pylatex import Document, Command, Section, Subsection, Subsubsection, MiniP
         FlushRight, FlushLeft, NewPage, \
         FootnoteText, SmallText, MediumText, LargeText, HugeText
 from pylatex.utils import italic, bold, NoEscape
+import hashlib
+import json
+import os
 import time
 
 from . import util
@@ -48,9 +51,19 @@ def superscript(item):
     return Superscript(arguments=item)
 
 
-def append_liquor_list(doc, df, own_page):
-    # TODO no interaction with dataframe?
-    kinds = df[df.Category.isin(['Spirit', 'Vermouth', 'Liqueur'])][['Kind', 'Type']]
+LIQUOR_CATEGORIES = ['Spirit', 'Vermouth', 'Liqueur']
+
+def liquor_rows(liquors):
+    """ (Kind, Type) pairs for the liquor list, from a barstock DataFrame or
+    already as pairs of the liquors in stock
+    """
+    if hasattr(liquors, 'Category'):
+        kinds = liquors[liquors.Category.isin(LIQUOR_CATEGORIES)][['Kind', 'Type']]
+        return list(zip(kinds.Kind, kinds.Type))
+    return list(liquors)
+
+def append_liquor_list(doc, liquors, own_page):
+    rows = liquor_rows(liquors)
     if own_page:
         log.info("Appending list as new page")
         doc.append(NewPage())
@@ -67,12 +80,12 @@ def append_liquor_list(doc, df, own_page):
 
     cols = add_paracols_environment(listing, 2, '8pt', sloppy=False)
     with cols.create(FlushRight()):
-        for item in kinds.Kind:
+        for item, _ in rows:
             cols.append(LargeText(item))
             cols.append(Command('\\'))
     cols.append(Command('switchcolumn'))
     with cols.create(FlushLeft()):
-        for item in kinds.Type:
+        for _, item in rows:
             cols.append(LargeText(italic(item)))
             cols.append(Command('\\'))
 
@@ -149,9 +162,53 @@ def setup_header_footer(doc, pdf_opts, display_opts):
     doc.change_document_style("schubarheaderfooter")
 
 
-def generate_recipes_pdf(recipes, pdf_opts, display_opts, ingredient_df):
+class FragmentCache(object):
+    """ The tex of each formatted recipe at a bar, kept as files in a directory per bar
+    Keyed by what the recipe's tex depends on, see fragment_key, so a menu
+    only rebuilds the recipes that changed since the last one
+    """
+    def __init__(self, directory, bar_id):
+        self.bar_id = bar_id
+        self.directory = os.path.join(directory, str(bar_id))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, "{}.tex".format(key))
+
+    def get(self, recipe, display_opts, stock_version):
+        path = self.path(fragment_key(self.bar_id, recipe, display_opts, stock_version))
+        try:
+            with open(path, encoding='utf-8') as fp:
+                return fp.read()
+        except OSError:
+            pass
+        tex = format_recipe(recipe, display_opts).dumps()
+        tmp = "{}.{}".format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            fp.write(tex)
+        os.replace(tmp, path)
+        return tex
+
+def options_digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def fragment_key(bar_id, recipe, display_opts, stock_version):
+    """ Hash of a recipe's formatting inputs, the examples and prices come from the bar's stock """
+    return options_digest(bar_id, recipe.name, recipe.recipe_dict, display_opts._asdict(), stock_version)
+
+def menu_key(bar_id, recipe_names, stock_version, pdf_opts, display_opts, tex_only=False):
+    """ Hash of everything a generated menu depends on, the output filename is left out """
+    pdf_fields = {field: value for field, value in pdf_opts._asdict().items() if field != 'pdf_filename'}
+    return options_digest(bar_id, list(recipe_names), stock_version, pdf_fields, display_opts._asdict(), tex_only)
+
+def generate_recipes_pdf(recipes, pdf_opts, display_opts, ingredient_df, fragments=None, stock_version=None, tex_only=False):
     """ Generate a .tex and .pef from the recipes given
     recipes is an ordered list of RecipeTuple namedtuples
+    ingredient_df is the barstock DataFrame, or (Kind, Type) pairs, for the liquor list
+    :param FragmentCache fragments: reuse the tex of recipes formatted before,
+        needs the stock_version of the bar the recipes were generated at
+    :param bool tex_only: only write the .tex, so no TeX install is needed
+    :returns: the generated filename
     """
 
     log.info("Generating {}.tex".format(pdf_opts.pdf_filename))
@@ -197,7 +254,10 @@ def generate_recipes_pdf(recipes, pdf_opts, display_opts, ingredient_df):
     # Columns setup and fill
     paracols = add_paracols_environment(doc, pdf_opts.ncols, colsep, sloppy=False)
     for i, recipe in enumerate(recipes, 1):
-        paracols.append(format_recipe(recipe, display_opts))
+        if fragments is not None:
+            paracols.append(NoEscape(fragments.get(recipe, display_opts, stock_version)))
+        else:
+            paracols.append(format_recipe(recipe, display_opts))
         switch = 'switchcolumn'
         if pdf_opts.align:
             switch += '*' if (i % pdf_opts.ncols) == 0 else ''
@@ -207,12 +267,19 @@ def generate_recipes_pdf(recipes, pdf_opts, display_opts, ingredient_df):
     if pdf_opts.liquor_list or pdf_opts.liquor_list_own_page:
         append_liquor_list(doc, ingredient_df, own_page=pdf_opts.liquor_list_own_page)
 
+    if tex_only:
+        doc.generate_tex(pdf_opts.pdf_filename)
+        log.info("Done")
+        return "{}.tex".format(pdf_opts.pdf_filename)
     log.info("Compiling {}.pdf".format(pdf_opts.pdf_filename))
     doc.generate_pdf(pdf_opts.pdf_filename, clean_tex=False)
     log.info("Done")
-    return True
+    return "{}.pdf".format(pdf_opts.pdf_filename)
 
-def filename_from_options(pdf_opts, display_opts, base_name='drinks'):
+def filename_from_options(pdf_opts, display_opts, base_name='drinks', digest=None):
+    """ Filename describing the options, with the start of the menu_key
+    digest when given, so different menus with the same options don't collide
+    """
     opts_tag = "{}c".format(pdf_opts.ncols)
     opts_tag += 'l' if pdf_opts.liquor_list else ''
     opts_tag += 'L' if pdf_opts.liquor_list_own_page else ''
@@ -225,5 +292,8 @@ def filename_from_options(pdf_opts, display_opts, base_name='drinks'):
     opts_tag += 'p' if display_opts.prep_line else ''
     opts_tag += 'v' if display_opts.variants else ''
     opts_tag += 'o' if display_opts.origin else ''
-    return '_'.join([base_name, opts_tag])
+    parts = [base_name, opts_tag]
+    if digest:
+        parts.append(digest[:12])
+    return '_'.join(parts)
 
@@ -29,7 +29,7 @@ class CSVField(Field):
             return ''
 
     def process_formdata(self, valuelist):
-        if valuelist[0]:
+        if valuelist and valuelist[0]:
             self.data = [x.strip().lower() for x in valuelist[0].split(',') if x.strip()]
         else:
             self.data = []
@@ -160,6 +160,7 @@ class DrinksForm(BaseForm):
     align = BooleanField("Align items", description="Align drink names across columns")
     title = TextField("Title", description="Title to use")
     tagline = TextField("Tagline", description="Tagline to use below the title")
+    tex_only = BooleanField("TeX only", description="Download the .tex source instead of compiling the pdf")
 
 
 class RecipeIngredientForm(BaseForm):
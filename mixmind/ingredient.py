@@ -4,7 +4,7 @@ import urllib.request, urllib.parse, urllib.error
 import copy
 import uuid
 
-from sqlalchemy import Boolean, DateTime, Column, Integer, ForeignKey, Enum, Float, Unicode
+from sqlalchemy import Boolean, DateTime, Column, Integer, ForeignKey, Enum, Float, Unicode, Index
 from sqlalchemy_utils import UUIDType
 
 from . import util
@@ -49,11 +49,26 @@ class Ingredient(db.Model):
     Cost_per_mL  = Column(Float(), default=0.0)
     Cost_per_cL  = Column(Float(), default=0.0)
     Cost_per_oz  = Column(Float(), default=0.0)
+    # bar's stock_version when this row last changed, for delta syncs
+    change_seq   = Column(Integer(), default=0)
 
-    def as_dict(self):
+    # matched to the lookups in Barstock_SQL.slice_on_type, the ingredient
+    # table ordering, and query_by_iid, see migrations/ when changing these
+    __table_args__ = (
+            Index('ix_ingredient_bar_type', 'bar_id', 'type_', 'In_Stock'),
+            Index('ix_ingredient_bar_category', 'bar_id', 'Category', 'Type'),
+            Index('ix_ingredient_uuid', 'uuid', unique=True),
+            Index('ix_ingredient_bar_change_seq', 'bar_id', 'change_seq'),
+            )
+
+    _dict_fields = 'Category Type Kind In_Stock ABV Size_mL Price_Paid Size_oz Cost_per_oz'.split(' ')
+
+    def as_dict(self, fields=None):
+        """ :param list fields: only include these fields, the iid is always included """
         data = {'iid': self.iid()}
-        for attr in 'Category Type Kind In_Stock ABV Size_mL Price_Paid Size_oz Cost_per_oz'.split(' '):
-            data[attr] = getattr(self, attr)
+        for attr in self._dict_fields:
+            if fields is None or attr in fields:
+                data[attr] = getattr(self, attr)
         return data
 
     _csv_labels = sorted([label for label, val in display_name_mappings.items() if val.get('csv')],
@@ -81,3 +96,19 @@ class Ingredient(db.Model):
     @classmethod
     def query_by_iid(cls, iid):
         return cls.query.filter_by(uuid=uuid.UUID(iid[len(cls._iid_prefix):])).one_or_none()
+
+
+class IngredientTombstone(db.Model):
+    """ Record of a deleted ingredient, so delta syncs can remove it too
+    """
+    id         = Column(Integer(), primary_key=True)
+    bar_id     = Column(Integer(), ForeignKey('bar.id'))
+    uuid       = Column(UUIDType())
+    change_seq = Column(Integer())
+
+    __table_args__ = (
+            Index('ix_ingredient_tombstone_bar_change_seq', 'bar_id', 'change_seq'),
+            )
+
+    def iid(self):
+        return "{}{}".format(Ingredient._iid_prefix, self.uuid)
@@ -0,0 +1,248 @@
+""" Background jobs for work too slow for a request, like big imports
+Jobs are rows in the job table, run by a thread pool in each app process.
+The table is what survives a restart: when a server process starts, jobs left running by a
+process that is gone are queued again and resume from their saved stage,
+or are failed once they have been tried MAX_ATTEMPTS times.
+
+Progress while a job runs is only kept in memory by the process running it,
+so reporting it never has to write to the database mid-transaction.
+"""
+import datetime
+import json
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .database import db
+from .models import Job, Bar
+from .barstock import Ingredient, stock_version
+from .stock_import import apply_import, load_pending, discard_pending
+from .formatted_menu import LIQUOR_CATEGORIES, FragmentCache, generate_recipes_pdf
+from .util import DisplayOptions, PdfOptions
+from . import mms
+from .logger import get_logger
+log = get_logger(__name__)
+
+MAX_ATTEMPTS = 3
+ACTIVE = ('queued', 'running')
+
+class JobError(Exception):
+    """ Raise from a job to fail it with a message for the user """
+    pass
+
+JOB_KINDS = {}
+def job_kind(name):
+    """ Register a function to run jobs of a kind, called as f(job, progress)
+    where progress(stage, done, total) reports how far along it is. Jobs may
+    be run again after a restart, from whatever job.stage was last committed
+    """
+    def register(f):
+        JOB_KINDS[name] = f
+        return f
+    return register
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+class JobRunner(object):
+    def __init__(self):
+        self.app = None
+        self.executor = None
+        self.worker = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.lock = threading.Lock()
+        self.progress = {} # job id -> (stage, done, total)
+
+    def init_app(self, app):
+        """ Jobs only run in processes serving requests, so the cli and
+        flask commands importing the app leave the queue alone
+        """
+        self.app = app
+        self.stale_after = datetime.timedelta(seconds=app.config.get('MIXMIND_JOB_STALE_SECONDS', 3600))
+        if app.config.get('MIXMIND_JOB_WORKERS', 1) > 0:
+            app.before_first_request(self.start)
+
+    def start(self):
+        """ Start the worker threads and pick up any unfinished jobs """
+        with self.lock:
+            if self.executor is not None:
+                return
+            self.executor = ThreadPoolExecutor(max_workers=self.app.config.get('MIXMIND_JOB_WORKERS', 1))
+        with self.app.app_context():
+            self.recover()
+
+    def submit(self, kind, bar_id, payload=None, user_id=None):
+        """ Queue a job
+        :returns: the new Job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError("Unknown job kind '{}'".format(kind))
+        now = utcnow()
+        job = Job(kind=kind, bar_id=bar_id, user_id=user_id, status='queued', attempts=0,
+                payload=json.dumps(payload), created=now, updated=now)
+        db.session.add(job)
+        db.session.commit()
+        if self.executor is not None:
+            self.executor.submit(self._run, job.id)
+        else:
+            log.info("Queued {} job {} for a server process to run".format(kind, job.id))
+        return job
+
+    def report(self, job_id, stage, done, total):
+        with self.lock:
+            self.progress[job_id] = (stage, done, total)
+
+    def status(self, job):
+        """ :returns: dict for the api, with progress if this process is running the job """
+        status = job.as_dict()
+        with self.lock:
+            stage, done, total = self.progress.get(job.id, (job.stage, None, None))
+        status.update(stage=stage, done=done, total=total)
+        return status
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            # claim it, another process may have recovered the same job
+            claimed = Job.query.filter_by(id=job_id, status='queued').update({'status': 'running',
+                'worker': self.worker, 'attempts': Job.attempts + 1, 'updated': utcnow()},
+                synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                return
+            job = Job.query.get(job_id)
+            log.info("Running {} job {} (attempt {})".format(job.kind, job.id, job.attempts))
+            try:
+                result = JOB_KINDS[job.kind](job, partial(self.report, job.id))
+            except Exception as e:
+                db.session.rollback()
+                if isinstance(e, JobError):
+                    message = str(e)
+                else:
+                    log.exception("{} job {} failed".format(job.kind, job_id))
+                    message = "{}: {}".format(e.__class__.__name__, e)
+                job = Job.query.get(job_id)
+                job.status = 'failed'
+                job.message = message[:255]
+            else:
+                job.status = 'done'
+                job.result = json.dumps(result)
+            job.updated = job.finished = utcnow()
+            db.session.commit()
+            with self.lock:
+                self.progress.pop(job_id, None)
+
+    def recover(self):
+        """ Requeue jobs whose process died, and start the queued ones """
+        now = utcnow()
+        for job in Job.query.filter(Job.status.in_(ACTIVE)):
+            if job.status == 'running':
+                if not self._orphaned(job, now):
+                    continue
+                if job.attempts >= MAX_ATTEMPTS:
+                    log.warning("Failing {} job {} after {} attempts".format(job.kind, job.id, job.attempts))
+                    job.status = 'failed'
+                    job.message = "Interrupted too many times"
+                    job.finished = now
+                else:
+                    log.info("Resuming {} job {} from {}".format(job.kind, job.id, job.stage or 'the start'))
+                    job.status = 'queued'
+                    job.message = "Resumed after a restart"
+                job.updated = now
+            elif job.kind not in JOB_KINDS:
+                job.status = 'failed'
+                job.message = "Unknown job kind"
+                job.updated = job.finished = now
+        db.session.commit()
+        for job in Job.query.filter_by(status='queued').order_by(Job.id):
+            self.executor.submit(self._run, job.id)
+
+    def _orphaned(self, job, now):
+        host, pid, _ = ((job.worker or '').split(':') + ['', ''])[:3]
+        if job.worker == self.worker:
+            return False
+        if host == socket.gethostname() and pid.isdigit():
+            if int(pid) == os.getpid():
+                return True # an earlier process with the same pid, e.g. in a container
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+        # another host, or a live process, only once it has gone quiet for long enough
+        return job.updated is None or now - job.updated > self.stale_after
+
+job_runner = JobRunner()
+
+def active_job(bar_id, kind=None):
+    """ :returns: the bar's oldest unfinished job, or None """
+    query = Job.query.filter(Job.bar_id == bar_id, Job.status.in_(ACTIVE))
+    if kind:
+        query = query.filter_by(kind=kind)
+    return query.order_by(Job.id).first()
+
+@job_kind('import')
+def run_import(job, progress):
+    """ Apply a confirmed ingredients upload, then regenerate the affected recipes
+    payload: the pending upload's token, replace_existing, and the stock_version
+    the preview was made at; the rows stay in the pending_import table
+    """
+    bar = Bar.query.get(job.bar_id)
+    payload = json.loads(job.payload)
+    if job.stage != 'regenerate':
+        if stock_version(bar.id) != payload['stock_version']:
+            raise JobError("The ingredients changed since the preview, please upload the file again")
+        pending = load_pending(payload['token'])
+        if pending is None or pending['bar_id'] != bar.id:
+            raise JobError("The upload expired, please upload the file again")
+        types = apply_import(bar.id, pending['rows'], payload['replace_existing'],
+                progress=partial(progress, 'import'), commit=False)
+        # committed along with the rows, so a resumed job won't apply them twice
+        discard_pending(payload['token'], commit=False)
+        job.stage = 'regenerate'
+        job.result = json.dumps(sorted(types))
+        db.session.commit()
+    else:
+        types = json.loads(job.result or '[]')
+    mms.regenerate_recipes(bar, ingredients=set(types), progress=partial(progress, 'regenerate'))
+    return {'filename': payload.get('filename'), 'ingredients': payload.get('n_rows'), 'types': sorted(types)}
+
+@job_kind('regenerate')
+def run_regenerate(job, progress):
+    """ Regenerate every recipe at the bar """
+    bar = Bar.query.get(job.bar_id)
+    mms.regenerate_recipes(bar, progress=partial(progress, 'regenerate'))
+    return {}
+
+def menu_dir(app):
+    return os.path.join(app.config['MIXMIND_DIR'], app.config.get('MIXMIND_MENU_DIR', 'menus'))
+
+@job_kind('menu')
+def run_menu(job, progress):
+    """ Generate a menu, or only its tex, into the menu cache
+    payload: recipe names in menu order, pdf_options, display_options, tex_only,
+        and the stock_version the recipes were selected at
+    """
+    bar = Bar.query.get(job.bar_id)
+    payload = json.loads(job.payload)
+    version = stock_version(bar.id)
+    if version != payload['stock_version']:
+        raise JobError("The ingredients changed since the menu was requested, please generate it again")
+    pdf_options = PdfOptions(**payload['pdf_options'])
+    display_options = DisplayOptions(**payload['display_options'])
+    by_name = mms.library(bar).by_name
+    recipes = [by_name[name] for name in payload['recipes'] if name in by_name]
+    liquors = [(i.Kind, i.Type) for i in Ingredient.query.filter(Ingredient.bar_id == bar.id,
+        Ingredient.In_Stock == True, Ingredient.Category.in_(LIQUOR_CATEGORIES)).order_by(Ingredient.Type, Ingredient.Kind)]
+
+    # format the recipes missing from the fragment cache first, to report progress
+    fragments = FragmentCache(os.path.join(menu_dir(job_runner.app), 'fragments'), bar.id)
+    for done, recipe in enumerate(recipes):
+        progress('format', done, len(recipes))
+        fragments.get(recipe, display_options, version)
+    progress('compile', None, None)
+    output = generate_recipes_pdf(recipes, pdf_options, display_options, liquors,
+            fragments=fragments, stock_version=version, tex_only=payload['tex_only'])
+    return {'output': output, 'download_name': payload['download_name'], 'recipes': len(recipes)}
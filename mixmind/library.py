@@ -0,0 +1,149 @@
+""" The processed recipe library for a bar
+Holds the bar's DrinkRecipes along with indexes over them that are kept up
+to date as the examples and stats are regenerated from the stock.
+"""
+import unicodedata
+from collections import Counter
+
+from .search import tokenize
+from .logger import get_logger
+log = get_logger(__name__)
+
+SORT_STATS = ('cost', 'abv', 'std_drinks')
+FACETS = ('style', 'glass', 'prep', 'ice', 'tag')
+
+def name_key(name):
+    """ Lookup key for a recipe name, so "MARTINEZ", "martinez " and
+    differently composed accents all find the same recipe
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+def slugify(name):
+    """ URL friendly form of a recipe name, e.g. "Piña Colada" -> "pina-colada"
+    """
+    return '-'.join(tokenize(name))
+
+class RecipeNameIndex(object):
+    """ Constant time lookup of recipes by name, normalized name, or slug
+    Every name gets a unique slug to use in canonical URLs
+    """
+    def __init__(self, names):
+        self.names = set()
+        self.keys = {} # name key -> name
+        self.slugs = {} # name -> slug
+        self.by_slug = {} # slug -> name
+        for name in sorted(names):
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def add(self, name):
+        self.names.add(name)
+        self.keys.setdefault(name_key(name), name)
+        slug = base = slugify(name) or 'recipe'
+        n = 1
+        while slug in self.by_slug and self.by_slug[slug] != name:
+            n += 1
+            slug = '{}-{}'.format(base, n)
+        self.slugs[name] = slug
+        self.by_slug[slug] = name
+
+    def resolve(self, text):
+        """ Return the exact recipe name for a name, a differently cased or
+        composed name, or a slug, or None if nothing matches
+        """
+        if text in self.names:
+            return text
+        name = self.keys.get(name_key(text))
+        if name is None:
+            name = self.by_slug.get(text) or self.by_slug.get(slugify(text))
+        return name
+
+    def slug(self, name):
+        return self.slugs[name]
+
+class RecipeLibrary(object):
+    """ Recipes processed against one bar's stock
+
+    Keeps presorted orders of the recipes for each sortable stat, so a
+    filtered subset can be sorted by rank lookup instead of comparing stats
+    """
+    def __init__(self, recipes):
+        self.recipes = recipes
+        self.version = 0
+        self.position = {recipe.name: i for i, recipe in enumerate(recipes)}
+        self.by_name = {recipe.name: recipe for recipe in recipes}
+        self.reindex()
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __iter__(self):
+        return iter(self.recipes)
+
+    def reindex(self):
+        """ Recompute the rank arrays, call after the examples or stats of any
+        recipe change
+        """
+        self.version += 1
+        self.orders = {} # stat -> positions sorted ascending, recipes without stats last
+        self.ranks = {} # stat -> position -> rank
+        for stat in SORT_STATS:
+            attr = 'avg_{}'.format(stat)
+            with_stats = [i for i, recipe in enumerate(self.recipes) if recipe.stats]
+            with_stats.sort(key=lambda i: getattr(self.recipes[i].stats, attr))
+            without = [i for i, recipe in enumerate(self.recipes) if not recipe.stats]
+            ranks = [0] * len(self.recipes)
+            for rank, i in enumerate(with_stats + without):
+                ranks[i] = rank
+            self.orders[stat] = (with_stats, without)
+            self.ranks[stat] = ranks
+
+    def sort(self, recipes, stat, reverse=False):
+        """ Sort a subset of this library's recipes by the given stat
+        Recipes without stats (can't be made) always come last
+        """
+        with_stats, without = self.orders[stat]
+        if len(recipes) * 4 > len(self.recipes):
+            # dense subset, cheaper to walk the presorted order once
+            wanted = {recipe.name for recipe in recipes}
+            ordered = [self.recipes[i] for i in (reversed(with_stats) if reverse else with_stats)
+                    if self.recipes[i].name in wanted]
+            return ordered + [self.recipes[i] for i in without if self.recipes[i].name in wanted]
+        ranks = self.ranks[stat]
+        n_with = len(with_stats)
+        def key(recipe):
+            rank = ranks[self.position[recipe.name]]
+            if reverse and rank < n_with:
+                return -rank - 1 # negative, still ahead of those without stats
+            return rank
+        return sorted(recipes, key=key)
+
+    @staticmethod
+    def facet_counts(recipes, choices=None):
+        """ Count the recipes each value of the filterable attributes would
+        match, with the same substring test as util.filter_on_attribute,
+        in one pass over the recipes
+        :param dict choices: attribute -> values to count, every value present by default
+        :returns: dict of attribute -> Counter of lowercased value
+        """
+        present = {facet: Counter() for facet in FACETS}
+        for recipe in recipes:
+            for facet in FACETS:
+                value = getattr(recipe, facet)
+                if value:
+                    present[facet][value.lower()] += 1
+        counts = {}
+        for facet in FACETS:
+            if choices is not None and facet in choices:
+                values = [value.lower() for value in choices[facet] if value]
+            else:
+                values = list(present[facet])
+            # a value counts every recipe whose value contains it, like the filter
+            counts[facet] = Counter({value: sum(n for other, n in present[facet].items() if value in other)
+                for value in values})
+        return counts
@@ -0,0 +1,53 @@
+"""Indexes for the ingredient and order query paths
+
+Revision ID: 3c1f9a2b7d40
+Revises:
+Create Date: 2026-10-19 06:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a2b7d40'
+down_revision = None
+branch_labels = ('default',)
+depends_on = None
+
+# table -> (name, columns, unique)
+INDEXES = {
+    'ingredient': [
+        ('ix_ingredient_bar_type', ['bar_id', 'type_', 'In_Stock'], False),
+        ('ix_ingredient_bar_category', ['bar_id', 'Category', 'Type'], False),
+        ('ix_ingredient_uuid', ['uuid'], True),
+    ],
+    'order': [
+        ('ix_order_bar_timestamp', ['bar_id', 'timestamp'], False),
+        ('ix_order_user_email_timestamp', ['user_email', 'timestamp'], False),
+        ('ix_order_user_timestamp', ['user_id', 'timestamp'], False),
+        ('ix_order_bartender', ['bartender_id'], False),
+    ],
+}
+
+
+def existing_indexes(table):
+    # databases made by db.create_all() since the models gained these already have them
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    for table, indexes in INDEXES.items():
+        existing = existing_indexes(table)
+        for name, columns, unique in indexes:
+            if name not in existing:
+                op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for table, indexes in INDEXES.items():
+        existing = existing_indexes(table)
+        for name, _, _ in indexes:
+            if name in existing:
+                op.drop_index(name, table_name=table)
@@ -0,0 +1,48 @@
+"""Job table for background imports and regenerations
+
+Revision ID: 5d8b3e6f2a17
+Revises: 7a2e4c9d1b85
+Create Date: 2026-10-19 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8b3e6f2a17'
+down_revision = '7a2e4c9d1b85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'job' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bar_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('kind', sa.String(length=31), nullable=True),
+        sa.Column('status', sa.String(length=15), nullable=True),
+        sa.Column('stage', sa.String(length=31), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('worker', sa.String(length=127), nullable=True),
+        sa.Column('message', sa.Unicode(length=255), nullable=True),
+        sa.Column('payload', sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'), nullable=True),
+        sa.Column('result', sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.Column('finished', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['bar_id'], ['bar.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_job_status', 'job', ['status'])
+    op.create_index('ix_job_bar_created', 'job', ['bar_id', 'created'])
+
+
+def downgrade():
+    op.drop_index('ix_job_bar_created', table_name='job')
+    op.drop_index('ix_job_status', table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,50 @@
+"""Stock versions and change tracking for ingredient delta syncs
+
+Revision ID: 7a2e4c9d1b85
+Revises: 3c1f9a2b7d40
+Create Date: 2026-10-19 07:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy_utils import UUIDType
+
+
+# revision identifiers, used by Alembic.
+revision = '7a2e4c9d1b85'
+down_revision = '3c1f9a2b7d40'
+branch_labels = None
+depends_on = None
+
+
+def existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'stock_version' not in existing_columns('bar'):
+        op.add_column('bar', sa.Column('stock_version', sa.Integer(), nullable=True, server_default='0'))
+    if 'change_seq' not in existing_columns('ingredient'):
+        op.add_column('ingredient', sa.Column('change_seq', sa.Integer(), nullable=True, server_default='0'))
+    if 'ix_ingredient_bar_change_seq' not in {index['name'] for index in inspector.get_indexes('ingredient')}:
+        op.create_index('ix_ingredient_bar_change_seq', 'ingredient', ['bar_id', 'change_seq'])
+    if 'ingredient_tombstone' not in inspector.get_table_names():
+        op.create_table('ingredient_tombstone',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('bar_id', sa.Integer(), nullable=True),
+            sa.Column('uuid', UUIDType(), nullable=True),
+            sa.Column('change_seq', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['bar_id'], ['bar.id']),
+            sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_ingredient_tombstone_bar_change_seq', 'ingredient_tombstone', ['bar_id', 'change_seq'])
+
+
+def downgrade():
+    op.drop_index('ix_ingredient_tombstone_bar_change_seq', table_name='ingredient_tombstone')
+    op.drop_table('ingredient_tombstone')
+    op.drop_index('ix_ingredient_bar_change_seq', table_name='ingredient')
+    with op.batch_alter_table('ingredient') as batch_op:
+        batch_op.drop_column('change_seq')
+    with op.batch_alter_table('bar') as batch_op:
+        batch_op.drop_column('stock_version')
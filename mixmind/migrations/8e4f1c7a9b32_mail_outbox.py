@@ -0,0 +1,40 @@
+"""Outbox table for emails sent in the background
+
+Revision ID: 8e4f1c7a9b32
+Revises: 5d8b3e6f2a17
+Create Date: 2026-10-19 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f1c7a9b32'
+down_revision = '5d8b3e6f2a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'outbox_mail' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('outbox_mail',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.Unicode(length=255), nullable=True),
+        sa.Column('recipient', sa.Unicode(length=127), nullable=True),
+        sa.Column('template', sa.String(length=63), nullable=True),
+        sa.Column('html', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=15), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('next_attempt', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Unicode(length=255), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('sent', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_outbox_mail_status_next_attempt', 'outbox_mail', ['status', 'next_attempt'])
+
+
+def downgrade():
+    op.drop_index('ix_outbox_mail_status_next_attempt', table_name='outbox_mail')
+    op.drop_table('outbox_mail')
@@ -0,0 +1,91 @@
+"""Deduplicated, compressed recipe snapshots for orders
+
+Moves order.recipe_html into recipe_snapshot, one zlib compressed row per
+distinct html keyed by its sha256, referenced by order.recipe_snapshot
+
+Revision ID: 9b6d2f4e8c51
+Revises: 8e4f1c7a9b32
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+import hashlib
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b6d2f4e8c51'
+down_revision = '8e4f1c7a9b32'
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+
+order_table = sa.table('order',
+    sa.column('id', sa.Integer()),
+    sa.column('recipe_html', sa.Text()),
+    sa.column('recipe_snapshot', sa.String(64)))
+snapshot_table = sa.table('recipe_snapshot',
+    sa.column('hash', sa.String(64)),
+    sa.column('data', sa.LargeBinary()),
+    sa.column('size', sa.Integer()))
+
+
+def existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'recipe_snapshot' not in sa.inspect(conn).get_table_names():
+        op.create_table('recipe_snapshot',
+            sa.Column('hash', sa.String(length=64), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=True),
+            sa.Column('size', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('hash'))
+    columns = existing_columns('order')
+    if 'recipe_snapshot' not in columns:
+        with op.batch_alter_table('order') as batch_op:
+            batch_op.add_column(sa.Column('recipe_snapshot', sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key('fk_order_recipe_snapshot', 'recipe_snapshot', ['recipe_snapshot'], ['hash'])
+    if 'recipe_html' not in columns:
+        return
+
+    # backfill in batches of orders, storing each distinct html once
+    stored = {row[0] for row in conn.execute(sa.select([snapshot_table.c.hash]))}
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select([order_table.c.id, order_table.c.recipe_html]).where(sa.and_(
+            order_table.c.id > last_id, order_table.c.recipe_snapshot == None)).order_by(order_table.c.id).limit(BATCH)).fetchall()
+        if not rows:
+            break
+        for order_id, html in rows:
+            last_id = order_id
+            if html is None:
+                continue
+            key = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            if key not in stored:
+                conn.execute(snapshot_table.insert().values(hash=key,
+                    data=zlib.compress(html.encode('utf-8'), 9), size=len(html)))
+                stored.add(key)
+            conn.execute(order_table.update().where(order_table.c.id == order_id).values(recipe_snapshot=key))
+
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.drop_column('recipe_html')
+
+
+def downgrade():
+    conn = op.get_bind()
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.add_column(sa.Column('recipe_html', sa.Text(), nullable=True))
+    snapshots = {key: zlib.decompress(data).decode('utf-8')
+            for key, data in conn.execute(sa.select([snapshot_table.c.hash, snapshot_table.c.data]))}
+    for order_id, key in conn.execute(sa.select([order_table.c.id, order_table.c.recipe_snapshot]).where(
+            order_table.c.recipe_snapshot != None)).fetchall():
+        conn.execute(order_table.update().where(order_table.c.id == order_id).values(recipe_html=snapshots.get(key)))
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.drop_constraint('fk_order_recipe_snapshot', type_='foreignkey')
+        batch_op.drop_column('recipe_snapshot')
+    op.drop_table('recipe_snapshot')
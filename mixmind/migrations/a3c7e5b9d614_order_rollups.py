@@ -0,0 +1,75 @@
+"""Order rollups per bar, recipe, and hour or day
+
+Filled from the existing orders here, `flask rollup-backfill` rebuilds them
+
+Revision ID: a3c7e5b9d614
+Revises: 9b6d2f4e8c51
+Create Date: 2026-10-19 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c7e5b9d614'
+down_revision = '9b6d2f4e8c51'
+branch_labels = None
+depends_on = None
+
+
+GRAINS = ('hour', 'day')
+
+def bucket_start(timestamp, grain):
+    if grain == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def upgrade():
+    bind = op.get_bind()
+    if 'order_rollup' not in sa.inspect(bind).get_table_names():
+        op.create_table('order_rollup',
+            sa.Column('bar_id', sa.Integer(), nullable=False),
+            sa.Column('recipe_name', sa.Unicode(length=127), nullable=False),
+            sa.Column('grain', sa.String(length=4), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('orders', sa.Integer(), nullable=True),
+            sa.Column('confirmed', sa.Integer(), nullable=True),
+            sa.Column('confirm_seconds', sa.Float(), nullable=True),
+            sa.Column('min_confirm_seconds', sa.Float(), nullable=True),
+            sa.Column('max_confirm_seconds', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['bar_id'], ['bar.id']),
+            sa.PrimaryKeyConstraint('bar_id', 'recipe_name', 'grain', 'bucket'))
+        op.create_index('ix_order_rollup_grain_bucket', 'order_rollup', ['grain', 'bucket'])
+
+    # roll up the existing orders, same as analytics.backfill, unless the table was filled already
+    rollup = sa.table('order_rollup', sa.column('bar_id', sa.Integer()), sa.column('recipe_name', sa.Unicode()),
+        sa.column('grain', sa.String()), sa.column('bucket', sa.DateTime()), sa.column('orders', sa.Integer()),
+        sa.column('confirmed', sa.Integer()), sa.column('confirm_seconds', sa.Float()),
+        sa.column('min_confirm_seconds', sa.Float()), sa.column('max_confirm_seconds', sa.Float()))
+    if bind.execute(sa.select([sa.func.count()]).select_from(rollup)).scalar():
+        return
+    order = sa.table('order', sa.column('bar_id', sa.Integer()), sa.column('recipe_name', sa.Unicode()),
+        sa.column('timestamp', sa.DateTime()), sa.column('confirmed', sa.DateTime()))
+    rows = {}
+    for bar_id, recipe_name, timestamp, confirmed in bind.execute(sa.select([order.c.bar_id, order.c.recipe_name,
+            order.c.timestamp, order.c.confirmed]).where(sa.and_(order.c.bar_id != None, order.c.timestamp != None))):
+        seconds = max(0.0, (confirmed - timestamp).total_seconds()) if confirmed else None
+        for grain in GRAINS:
+            key = (bar_id, recipe_name, grain, bucket_start(timestamp, grain))
+            row = rows.setdefault(key, {'orders': 0, 'confirmed': 0, 'confirm_seconds': 0.0,
+                'min_confirm_seconds': None, 'max_confirm_seconds': None})
+            row['orders'] += 1
+            if seconds is not None:
+                row['confirmed'] += 1
+                row['confirm_seconds'] += seconds
+                row['min_confirm_seconds'] = seconds if row['min_confirm_seconds'] is None else min(row['min_confirm_seconds'], seconds)
+                row['max_confirm_seconds'] = seconds if row['max_confirm_seconds'] is None else max(row['max_confirm_seconds'], seconds)
+    if rows:
+        op.bulk_insert(rollup, [dict(bar_id=key[0], recipe_name=key[1], grain=key[2], bucket=key[3], **row)
+            for key, row in rows.items()])
+
+
+def downgrade():
+    op.drop_index('ix_order_rollup_grain_bucket', table_name='order_rollup')
+    op.drop_table('order_rollup')
@@ -0,0 +1,38 @@
+"""Previewed ingredient uploads, shared by every worker
+
+Revision ID: c4e8a1f3b726
+Revises: a3c7e5b9d614
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f3b726'
+down_revision = 'a3c7e5b9d614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'pending_import' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('pending_import',
+        sa.Column('token', sa.String(length=32), nullable=False),
+        sa.Column('bar_id', sa.Integer(), nullable=True),
+        sa.Column('filename', sa.Unicode(length=255), nullable=True),
+        sa.Column('replace_existing', sa.Boolean(), nullable=True),
+        sa.Column('stock_version', sa.Integer(), nullable=True),
+        sa.Column('data', sa.LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql'), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['bar_id'], ['bar.id']),
+        sa.PrimaryKeyConstraint('token'))
+    op.create_index('ix_pending_import_created', 'pending_import', ['created'])
+
+
+def downgrade():
+    op.drop_index('ix_pending_import_created', table_name='pending_import')
+    op.drop_table('pending_import')
@@ -0,0 +1,31 @@
+"""Job payloads and results as MEDIUMTEXT on MySQL, TEXT stops at 64 KB
+
+Revision ID: d5f9b2a4c837
+Revises: c4e8a1f3b726
+Create Date: 2026-10-20 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f9b2a4c837'
+down_revision = 'c4e8a1f3b726'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for column in ('payload', 'result'):
+        op.alter_column('job', column, type_=mysql.MEDIUMTEXT(), existing_type=sa.Text(), existing_nullable=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for column in ('payload', 'result'):
+        op.alter_column('job', column, type_=sa.Text(), existing_type=mysql.MEDIUMTEXT(), existing_nullable=True)
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import zlib
+
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import Boolean, DateTime, Column, Integer, String, ForeignKey, Enum, Float, Text, Unicode
+from sqlalchemy import Boolean, DateTime, Column, Integer, String, ForeignKey, Enum, Float, Text, Unicode, Index, LargeBinary
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import IntegrityError
 
 import pendulum
 
@@ -9,6 +14,10 @@ from flask_security import UserMixin, RoleMixin
 from . import db
 from .util import VALID_UNITS
 
+# MySQL's TEXT and BLOB stop at 64 KB
+LongText = Text().with_variant(mysql.MEDIUMTEXT(), 'mysql')
+LongBinary = LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql')
+
 class RolesUsers(db.Model):
     id = Column(Integer(), primary_key=True)
     user_id = Column('user_id', Integer(), ForeignKey('user.id'))
@@ -71,7 +80,25 @@ class Order(db.Model):
     confirmed = Column(DateTime())
     user_email = Column(Unicode(length=127))
     recipe_name = Column(Unicode(length=127))
-    recipe_html = Column(Text())
+    recipe_snapshot = Column(String(64), ForeignKey('recipe_snapshot.hash'))
+    snapshot = relationship('RecipeSnapshot')
+
+    # orders are listed per bar, per user, and per bartender, newest first
+    __table_args__ = (
+            Index('ix_order_bar_timestamp', 'bar_id', 'timestamp'),
+            Index('ix_order_user_email_timestamp', 'user_email', 'timestamp'),
+            Index('ix_order_user_timestamp', 'user_id', 'timestamp'),
+            Index('ix_order_bartender', 'bartender_id'),
+            )
+
+    @property
+    def recipe_html(self):
+        """ The recipe as it was when ordered, see RecipeSnapshot """
+        return self.snapshot.html if self.snapshot else None
+
+    @recipe_html.setter
+    def recipe_html(self, html):
+        self.snapshot = RecipeSnapshot.store(html) if html is not None else None
 
     def where(self):
         bar = Bar.query.filter_by(id=self.bar_id).one_or_none()
@@ -85,6 +112,38 @@ class Order(db.Model):
         return "{} minutes, {} seconds".format(diff.minutes, diff.remaining_seconds)
 
 
+class RecipeSnapshot(db.Model):
+    """ Recipe html recorded with orders, compressed and stored once per
+    distinct content, keyed by its sha256
+    """
+    hash = Column(String(64), primary_key=True)
+    data = Column(LargeBinary()) # zlib compressed utf-8
+    size = Column(Integer()) # uncompressed length
+
+    @staticmethod
+    def key(html):
+        return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+    @property
+    def html(self):
+        return zlib.decompress(self.data).decode('utf-8')
+
+    @classmethod
+    def store(cls, html):
+        """ :returns: the snapshot for this html, added to the session if new """
+        key = cls.key(html)
+        snapshot = cls.query.get(key)
+        if snapshot is None:
+            snapshot = cls(hash=key, data=zlib.compress(html.encode('utf-8'), 9), size=len(html))
+            try:
+                with db.session.begin_nested():
+                    db.session.add(snapshot)
+            except IntegrityError:
+                # stored by a concurrent request in the meantime
+                snapshot = cls.query.get(key)
+        return snapshot
+
+
 class Bar(db.Model):
     id = Column(Integer(), primary_key=True)
     cname = Column(Unicode(length=63), unique=True) # unique name for finding the bar
@@ -97,6 +156,7 @@ class Bar(db.Model):
     owner = relationship('User', back_populates="owns", foreign_keys=[owner_id])
     ingredients = relationship('Ingredient') # one to many
     orders = relationship('Order') # one to many
+    stock_version = Column(Integer(), default=0) # bumped on every ingredient change
     # browse display settings
     markup     =  Column(Float(),    default=1.10)
     prices     =  Column(Boolean(),  default=True)
@@ -120,3 +180,81 @@ class Bartenders(db.Model):
     user_id = Column(Integer(), ForeignKey('user.id'))
     bar_id = Column(Integer(), ForeignKey('bar.id'))
 
+
+class Job(db.Model):
+    """ Background work for a bar, see jobs.py """
+    id = Column(Integer(), primary_key=True)
+    bar_id = Column(Integer(), ForeignKey('bar.id'))
+    user_id = Column(Integer(), ForeignKey('user.id'))
+    kind = Column(String(31))
+    status = Column(String(15), default='queued') # queued, running, done, failed
+    stage = Column(String(31)) # where a resumed job picks up, set by the job
+    attempts = Column(Integer(), default=0)
+    worker = Column(String(127)) # host:pid running it
+    message = Column(Unicode(length=255))
+    payload = Column(LongText) # json
+    result = Column(LongText) # json
+    created = Column(DateTime())
+    updated = Column(DateTime())
+    finished = Column(DateTime())
+
+    __table_args__ = (
+            Index('ix_job_status', 'status'),
+            Index('ix_job_bar_created', 'bar_id', 'created'),
+            )
+
+    def as_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'status': self.status, 'stage': self.stage,
+                'message': self.message, 'created': str(self.created), 'finished': str(self.finished) if self.finished else None}
+
+class OutboxMail(db.Model):
+    """ An email waiting to be sent, or kept after, see notifier.py """
+    id = Column(Integer(), primary_key=True)
+    subject = Column(Unicode(length=255))
+    recipient = Column(Unicode(length=127))
+    template = Column(String(63)) # what kind of mail, for the logs
+    html = Column(Text())
+    status = Column(String(15), default='pending') # pending, sending, sent, dead
+    attempts = Column(Integer(), default=0)
+    next_attempt = Column(DateTime()) # when it is due
+    last_error = Column(Unicode(length=255))
+    created = Column(DateTime())
+    sent = Column(DateTime())
+
+    __table_args__ = (
+            Index('ix_outbox_mail_status_next_attempt', 'status', 'next_attempt'),
+            )
+
+class OrderRollup(db.Model):
+    """ Order counts and time to confirm per bar, recipe, and hour or day,
+    kept up to date as orders are placed and confirmed, see analytics.py
+    """
+    bar_id = Column(Integer(), ForeignKey('bar.id'), primary_key=True)
+    recipe_name = Column(Unicode(length=127), primary_key=True)
+    grain = Column(String(4), primary_key=True) # hour, day
+    bucket = Column(DateTime(), primary_key=True) # utc start of the hour or day the orders were placed
+    orders = Column(Integer(), default=0)
+    confirmed = Column(Integer(), default=0)
+    confirm_seconds = Column(Float(), default=0.0) # total, for the mean
+    min_confirm_seconds = Column(Float())
+    max_confirm_seconds = Column(Float())
+
+    __table_args__ = (
+            Index('ix_order_rollup_grain_bucket', 'grain', 'bucket'),
+            )
+
+class PendingImport(db.Model):
+    """ A previewed ingredients upload, kept until the owner confirms or
+    discards it, in the database so any worker can pick it up
+    """
+    token = Column(String(32), primary_key=True)
+    bar_id = Column(Integer(), ForeignKey('bar.id'))
+    filename = Column(Unicode(length=255))
+    replace_existing = Column(Boolean())
+    stock_version = Column(Integer()) # the bar's when it was previewed
+    data = Column(LongBinary) # zlib compressed json list of rows
+    created = Column(DateTime())
+
+    __table_args__ = (
+            Index('ix_pending_import_created', 'created'),
+            )
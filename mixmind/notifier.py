@@ -1,38 +1,347 @@
 #!/usr/bin/env python
 """
 This implements a notification system via email
+
+Mail from requests goes through the outbox: enqueue_mail renders it and
+adds it to the outbox_mail table, and a background thread sends it, so no
+request waits on (or fails with) the SMTP server. Failed sends are retried
+with exponential backoff, and after MIXMIND_MAIL_MAX_ATTEMPTS the mail is
+dead-lettered, kept with status 'dead' for an admin to look at or retry.
+
+To try it without a real mail account, point MAIL_SERVER/MAIL_PORT at a
+local stand-in, e.g. `python -m aiosmtpd -n -l localhost:8025` with
+MAIL_SERVER = 'localhost', MAIL_PORT = 8025, MAIL_USE_TLS = False
 """
+import datetime
 import json
+import random
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 
-from flask import render_template
-from flask_mail import Mail, Message
+from sqlalchemy import event
+from flask import current_app, render_template
+from flask_mail import Mail, Message, sanitize_address, sanitize_addresses
 mail = Mail()
 
 from . import app
+from .database import db
+from .models import OutboxMail
 from .logger import get_logger
 log = get_logger(__name__)
 
+# a pooled connection that fails like this is just stale, worth one reconnect
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+class SMTPPool(object):
+    """ Logged in SMTP connections kept open between messages
+
+    Connections are health checked with NOOP before reuse if they have been
+    idle a while, closed once idle for too long, and replaced when they
+    turn out to be dead, so a send costs the handshake (connect, EHLO,
+    STARTTLS, login) only when there is no live connection to reuse.
+
+    :param int size: max idle connections kept
+    :param int max_idle: seconds before an idle connection is closed
+    :param int check_after: seconds idle before a connection is checked with NOOP
+    """
+    def __init__(self, host, port, use_tls=False, use_ssl=False, username=None, password=None,
+            size=2, max_idle=120, check_after=10, timeout=30):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = [] # (connection, time it was released), most recent last
+
+    @classmethod
+    def from_config(cls, config):
+        """ Pool for the Flask-Mail MAIL_* settings """
+        return cls(config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 25),
+                use_tls=config.get('MAIL_USE_TLS', False), use_ssl=config.get('MAIL_USE_SSL', False),
+                username=config.get('MAIL_USERNAME'), password=config.get('MAIL_PASSWORD'),
+                size=config.get('MIXMIND_SMTP_POOL_SIZE', 2), max_idle=config.get('MIXMIND_SMTP_MAX_IDLE', 120),
+                check_after=config.get('MIXMIND_SMTP_CHECK_AFTER', 10))
+
+    def connect(self):
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.use_tls:
+            conn.starttls()
+            conn.ehlo()
+        if self.username and self.password:
+            conn.login(self.username, self.password)
+        return conn
+
+    def acquire(self):
+        """ :returns: a live connection, reused if there is one """
+        now = time.time()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released = self.idle.pop()
+            idle_for = now - released
+            if idle_for > self.max_idle:
+                self.discard(conn)
+            elif idle_for < self.check_after or self.healthy(conn):
+                return conn
+            else:
+                self.discard(conn)
+        return self.connect()
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((conn, time.time()))
+                return
+        self.discard(conn)
+
+    def healthy(self, conn):
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def discard(self, conn):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            self.discard(conn)
+
+    def send_many(self, envelopes):
+        """ Send messages over one connection, reconnecting if it drops
+        :param envelopes: (from, [to, ...], message bytes or str) tuples
+        :returns: list with None, or the exception, for each message
+        """
+        results = []
+        conn = None
+        try:
+            for sender, recipients, message in envelopes:
+                for retry in (False, True):
+                    if conn is None:
+                        try:
+                            conn = self.acquire() if not retry else self.connect()
+                        except (smtplib.SMTPException, OSError) as e:
+                            results.append(e)
+                            break
+                    try:
+                        conn.sendmail(sender, recipients, message)
+                    except RECONNECT_ERRORS as e:
+                        conn.close()
+                        conn = None
+                        if retry:
+                            results.append(e)
+                    except (smtplib.SMTPException, OSError) as e:
+                        # refused by the server, the connection is still usable
+                        results.append(e)
+                        break
+                    else:
+                        results.append(None)
+                        break
+        finally:
+            if conn is not None:
+                self.release(conn)
+        return results
+
+    def sendmail(self, sender, recipients, message):
+        """ Send one message, raising what smtplib raises """
+        error = self.send_many([(sender, recipients, message)])[0]
+        if error is not None:
+            raise error
+
+smtp_pool = None
+
+def deliver(messages):
+    """ Send Flask-Mail Messages over a pooled connection
+    Falls back to Flask-Mail when sending is suppressed, e.g. when TESTING
+    :returns: list with None, or the exception, for each message
+    """
+    global smtp_pool
+    # Flask-Mail keeps its settings on the app's state, not on the Mail object
+    state = current_app.extensions['mail']
+    if state.suppress:
+        results = []
+        for msg in messages:
+            try:
+                state.send(msg)
+            except Exception as e:
+                results.append(e)
+            else:
+                results.append(None)
+        return results
+    if smtp_pool is None:
+        smtp_pool = SMTPPool.from_config(app.config)
+    return smtp_pool.send_many([(sanitize_address(msg.sender or state.default_sender),
+        list(sanitize_addresses(msg.send_to)), msg.as_bytes()) for msg in messages])
+
+def make_message(subject, recipient, html):
+    msg = Message(subject, sender=app.config.get('MAIL_USERNAME'), recipients=[recipient])
+    msg.html = html
+    return msg
+
+def render_mail(template, **context):
+    return render_template('email/{}.html'.format(template), **context)
+
 def send_mail(subject, recipient, template, **context):
-    """Send an email via the Flask-Mail extension.
+    """Send an email via the Flask-Mail extension, right away.
+    Prefer enqueue_mail from requests.
 
     :param subject: Email subject
     :param recipient: Email recipient
     :param template: The name of the email template
     :param context: The context to render the template with
     """
-    msg = Message(subject, sender=app.config.get('MAIL_USERNAME'), recipients=[recipient])
-
-    ctx = ('email', template)
-    msg.html = render_template('%s/%s.html' % ctx, **context)
-    try:
-        mail.send(msg)
-    except Exception as e:
-        log.error("{} sending {} email to {}: {}".format(e.__class__.__name__, template, recipient, e))
+    error = deliver([make_message(subject, recipient, render_mail(template, **context))])[0]
+    if error is not None:
+        log.error("{} sending {} email to {}: {}".format(error.__class__.__name__, template, recipient, error))
         return False
-    else:
-        return True
+    return True
+
+def enqueue_mail(subject, recipient, template, **context):
+    """Queue an email to be sent in the background, same parameters as send_mail
+    The mail is added to the current transaction, and sent once it's committed
+    :returns: the OutboxMail
+    """
+    return outbox.enqueue(subject, recipient, template, **context)
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+class MailOutbox(object):
+    """ Persistent queue of mail, with a sender thread per app process """
+    BATCH_SIZE = 20
+    SENDING_TIMEOUT = datetime.timedelta(minutes=10) # a claimed mail is retried after this
+    MAX_RETRY_DELAY = 60*60
+
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_attempts = app.config.get('MIXMIND_MAIL_MAX_ATTEMPTS', 6)
+        self.retry_seconds = app.config.get('MIXMIND_MAIL_RETRY_SECONDS', 30)
+        self.poll_seconds = app.config.get('MIXMIND_MAIL_POLL_SECONDS', 60)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        # like the job runner, only processes serving requests send, not the cli or flask commands
+        if app.config.get('MIXMIND_MAIL_SENDER_THREAD', True):
+            app.before_first_request(self.start)
+
+    def start(self):
+        """ Start the sender thread, once """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.wakeup.set() # send anything left from before a restart
+            self.thread = threading.Thread(target=self._run, name="mixmind-mail", daemon=True)
+            self.thread.start()
+
+    def enqueue(self, subject, recipient, template, **context):
+        now = utcnow()
+        item = OutboxMail(subject=subject, recipient=recipient, template=template,
+                html=render_mail(template, **context), status='pending', attempts=0,
+                next_attempt=now, created=now)
+        db.session.add(item)
+        db.session.info['outbox_mail'] = True
+        return item
+
+    def _after_commit(self, session):
+        if session.info.pop('outbox_mail', False):
+            self.wakeup.set()
+
+    def retry_delay(self, attempts):
+        """ Seconds until the next try, doubling each time with some jitter """
+        delay = min(self.retry_seconds * 2 ** (attempts - 1), self.MAX_RETRY_DELAY)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.poll_seconds)
+            self.wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.flush() == self.BATCH_SIZE:
+                        pass
+            except Exception:
+                log.exception("Mail outbox sender failed")
+
+    def flush(self, limit=BATCH_SIZE):
+        """ Try to send the mail that is due, needs an app context
+        :returns: number of mails tried
+        """
+        now = utcnow()
+        # a process that died mid-send leaves its claim, retry once it runs out
+        OutboxMail.query.filter(OutboxMail.status == 'sending', OutboxMail.next_attempt < now).update(
+                {'status': 'pending'}, synchronize_session=False)
+        db.session.commit()
+        due = [mail_id for mail_id, in db.session.query(OutboxMail.id).filter(
+            OutboxMail.status == 'pending', OutboxMail.next_attempt <= now).order_by(
+                OutboxMail.next_attempt, OutboxMail.id).limit(limit)]
+        # claim them all, then send them all over one connection
+        items = [item for item in (self.claim(mail_id) for mail_id in due) if item is not None]
+        if items:
+            errors = deliver([make_message(item.subject, item.recipient, item.html) for item in items])
+            for item, error in zip(items, errors):
+                self.record(item, error)
+            db.session.commit()
+        return len(due)
+
+    def claim(self, mail_id):
+        """ :returns: the mail to send, or None if another process got to it first """
+        claimed = OutboxMail.query.filter_by(id=mail_id, status='pending').update({'status': 'sending',
+            'next_attempt': utcnow() + self.SENDING_TIMEOUT}, synchronize_session=False)
+        db.session.commit()
+        return OutboxMail.query.get(mail_id) if claimed else None
+
+    def record(self, item, error):
+        """ Mark a mail sent, or schedule its retry, or dead-letter it """
+        item.attempts = (item.attempts or 0) + 1
+        if error is None:
+            item.status = 'sent'
+            item.sent = utcnow()
+            return
+        item.last_error = "{}: {}".format(error.__class__.__name__, error)[:255]
+        if item.attempts >= self.max_attempts:
+            log.error("Giving up on {} email {} to {} after {} attempts: {}".format(
+                item.template, item.id, item.recipient, item.attempts, item.last_error))
+            item.status = 'dead'
+        else:
+            delay = self.retry_delay(item.attempts)
+            log.warning("{} sending {} email {} to {}, retrying in {:.0f}s".format(
+                error.__class__.__name__, item.template, item.id, item.recipient, delay))
+            item.status = 'pending'
+            item.next_attempt = utcnow() + datetime.timedelta(seconds=delay)
+
+    def retry(self, mail_id):
+        """ Put a dead letter back in the queue
+        :returns: True if there was one
+        """
+        requeued = OutboxMail.query.filter_by(id=mail_id, status='dead').update({'status': 'pending',
+            'attempts': 0, 'next_attempt': utcnow()}, synchronize_session=False)
+        db.session.commit()
+        self.wakeup.set()
+        return bool(requeued)
+
+outbox = MailOutbox()
 
 # note this requires a secrets file to work
 required = ['sender_email', 'sender_pass', 'sender_name', 'target_email']
@@ -53,6 +362,10 @@ class Notifier():
         with open(message_template) as fp:
             self.message_template = fp.read()
 
+        # gmail, kept logged in between sends
+        self.pool = SMTPPool('smtp.gmail.com', 587, use_tls=True,
+                username=self.sender_email, password=self.sender_pass)
+
     def send(self, subject_line, message_fill, alt_target=None):
         """ message_fill should be a dict with keys
         matching fill fields in the base html template
@@ -69,16 +382,12 @@ class Notifier():
             body = body.replace(key, value)
         msg.set_payload(body)
 
-        # send via gmail
-        server = smtplib.SMTP('smtp.gmail.com',587)
-        server.ehlo()
-        server.starttls()
-        server.ehlo()
-        server.login(self.sender_email, self.sender_pass)
-        server.sendmail(self.sender_email, [target_email], msg.as_string())
-        server.close()
+        self.pool.sendmail(self.sender_email, [target_email], msg.as_string())
         return msg
 
+    def close(self):
+        self.pool.close()
+
 def test_main():
     n = Notifier('secrets.json', 'simpler_email_template.html')
     n.send("A customer has ordered - Martini",
@@ -0,0 +1,120 @@
+""" Live order events for the bartender queue
+Orders placed or confirmed in this process are published straight to the
+queue streams of that bar. Each stream also polls the database every few
+seconds, which picks up orders placed through other worker processes, and
+anything dropped because a slow client's queue was full.
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from .database import db
+from .models import Order
+from .logger import get_logger
+log = get_logger(__name__)
+
+MAX_QUEUED = 100 # events held for a slow stream, past that it relies on polling
+HEARTBEAT_SECONDS = 15 # keeps proxies from closing an idle stream
+
+class OrderEvents(object):
+    """ In-process publish/subscribe of order events, per bar """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set) # bar id -> queues
+
+    def subscribe(self, bar_id):
+        events = queue.Queue(maxsize=MAX_QUEUED)
+        with self.lock:
+            self.subscribers[bar_id].add(events)
+        return events
+
+    def unsubscribe(self, bar_id, events):
+        with self.lock:
+            self.subscribers[bar_id].discard(events)
+
+    def publish(self, bar_id, event, order_id, html=None):
+        """ :param str event: "order" for a new order, "confirmed" once it has been """
+        with self.lock:
+            subscribers = list(self.subscribers[bar_id])
+        for events in subscribers:
+            try:
+                events.put_nowait((event, order_id, html))
+            except queue.Full:
+                pass
+
+order_events = OrderEvents()
+
+def sse(event, data, event_id=None):
+    """ Format one Server-Sent Event """
+    lines = ["event: {}".format(event)]
+    if event_id is not None:
+        lines.append("id: {}".format(event_id))
+    lines.extend("data: {}".format(line) for line in json.dumps(data).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+def pending_orders(bar_id, limit=100):
+    """ Unconfirmed orders at the bar, oldest first """
+    return Order.query.filter(Order.bar_id == bar_id, Order.confirmed == None).order_by(
+            Order.id.desc()).limit(limit).all()[::-1]
+
+def order_stream(bar_id, render, poll_seconds=2, lifetime=300):
+    """ Generate the events for a bar's order queue
+    A stream starts with the ids of every order still waiting, then sends each
+    unconfirmed order it hasn't sent yet, whatever order they commit in, so a
+    reconnecting page catches up on everything it missed
+    :param render: called with an Order to get its html for the queue
+    :param int lifetime: seconds before the stream ends, the browser reconnects,
+        which lets sync workers be reused
+    """
+    events = order_events.subscribe(bar_id)
+    try:
+        waiting = [order_id for order_id, in db.session.query(Order.id).filter(
+            Order.bar_id == bar_id, Order.confirmed == None)]
+        db.session.rollback()
+        sent = set()
+        pending = set() # sent and not confirmed yet
+        yield "retry: 1000\n\n"
+        # so the page drops orders confirmed while it was disconnected
+        yield sse('pending', {'ids': waiting})
+        start = last_sent = next_poll = time.time()
+        while time.time() - start < lifetime:
+            try:
+                event, order_id, html = events.get(timeout=max(0, next_poll - time.time()))
+            except queue.Empty:
+                pass
+            else:
+                if event == 'order' and order_id not in sent:
+                    sent.add(order_id)
+                    pending.add(order_id)
+                    yield sse('order', {'id': order_id, 'html': html})
+                    last_sent = time.time()
+                elif event == 'confirmed' and order_id in pending:
+                    pending.discard(order_id)
+                    yield sse('confirmed', {'id': order_id})
+                    last_sent = time.time()
+                if time.time() < next_poll:
+                    continue
+
+            # poll for what other processes published, or this stream dropped
+            next_poll = time.time() + poll_seconds
+            unsent = Order.query.filter(Order.bar_id == bar_id, Order.confirmed == None)
+            if sent:
+                unsent = unsent.filter(~Order.id.in_(sent))
+            for order in unsent.order_by(Order.id):
+                sent.add(order.id)
+                pending.add(order.id)
+                yield sse('order', {'id': order.id, 'html': render(order)})
+                last_sent = time.time()
+            if pending:
+                for order_id, in db.session.query(Order.id).filter(Order.id.in_(pending), Order.confirmed != None):
+                    pending.discard(order_id)
+                    yield sse('confirmed', {'id': order_id})
+                    last_sent = time.time()
+            db.session.rollback() # end the transaction so the next poll sees new rows
+            if time.time() - last_sent > HEARTBEAT_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+    finally:
+        order_events.unsubscribe(bar_id, events)
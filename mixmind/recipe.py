@@ -105,6 +105,8 @@ class DrinkRecipe(object):
         example_kinds = barstock.get_all_kind_combinations((i.specifier for i in ingredients))
         del self.examples # need to make possible to run again
         self.examples = []
+        self.stats = None # otherwise calculate_stats keeps the old ones
+        self.max_cost = 0
         for kinds in example_kinds:
             # TODO refactor to generate IngredientSpecifiers for the kind lists
             example = DrinkRecipe.RecipeExample(); example.kinds = []
@@ -0,0 +1,152 @@
+""" Fuzzy full-text search over the recipe library
+Builds a trigram inverted index over the words in recipe names, info,
+ingredients, variants, and IBA descriptions. A query word matches any
+indexed word with enough trigrams in common, so typos still find results,
+and recipes are ranked by how well and where they matched.
+"""
+import re
+import unicodedata
+
+from .recipe import QuantizedIngredient
+from .logger import get_logger
+log = get_logger(__name__)
+
+# how much a match in each part of the recipe counts towards its rank
+FIELD_WEIGHTS = {
+        'name': 4.0,
+        'ingredients': 3.0,
+        'attributes': 1.5,
+        'variants': 1.0,
+        'info': 1.0,
+        'iba_info': 0.5,
+        }
+MIN_SIMILARITY = 0.45 # dice coefficient of trigram sets to count as a match
+PREFIX_SIMILARITY = 0.8 # partial words, e.g. "whisk" for "whiskey"
+TYPO_SIMILARITY = {1: 0.75, 2: 0.55} # by edit distance, for swapped letters that break trigrams
+
+_non_word = re.compile(r'[^\w]+')
+
+def normalize(text):
+    """ Casefold and strip accents and punctuation, e.g. "Crème de Cassis" -> "creme de cassis"
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _non_word.sub(' ', text.casefold()).strip()
+
+def tokenize(text):
+    return normalize(text).split()
+
+def trigrams(word):
+    padded = '${}$'.format(word)
+    return frozenset(padded[i:i+3] for i in range(len(padded) - 2))
+
+def edit_distance(a, b, limit=2):
+    """ Optimal string alignment distance, counting a swap of adjacent
+    letters as one edit. Returns limit+1 once the distance exceeds limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            row[j] = min(prev[j] + 1, row[j-1] + 1, prev[j-1] + cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                row[j] = min(row[j], prev2[j-2] + 1)
+        if min(row) > limit:
+            return limit + 1
+        prev2, prev = prev, row
+    return prev[-1]
+
+def recipe_fields(recipe):
+    """ Yield (field, text) pairs of the searchable text of a DrinkRecipe
+    """
+    yield 'name', recipe.name
+    for ingredient in recipe.ingredients:
+        if isinstance(ingredient, QuantizedIngredient):
+            yield 'ingredients', ingredient.specifier.ingredient
+            if ingredient.specifier.kind:
+                yield 'ingredients', ingredient.specifier.kind
+        else:
+            yield 'ingredients', ingredient.description
+    for attr in 'style glass prep ice tag'.split():
+        yield 'attributes', getattr(recipe, attr)
+    for variant in recipe.variants:
+        yield 'variants', variant
+    yield 'info', recipe.info
+    yield 'iba_info', recipe.iba_info
+
+class TrigramIndex(object):
+    """ Inverted index of word trigrams for a list of DrinkRecipes
+    """
+    def __init__(self, recipes):
+        self.names = [] # doc -> recipe name
+        self.word_docs = {} # word -> {doc: field weight}
+        self.word_grams = {} # word -> trigrams
+        self.gram_words = {} # trigram -> set of words
+        for recipe in recipes:
+            self._add(recipe)
+        log.info("Search index built: {} recipes, {} words, {} trigrams".format(
+            len(self.names), len(self.word_docs), len(self.gram_words)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, recipe):
+        doc = len(self.names)
+        self.names.append(recipe.name)
+        for field, text in recipe_fields(recipe):
+            weight = FIELD_WEIGHTS[field]
+            for word in tokenize(text or ''):
+                docs = self.word_docs.setdefault(word, {})
+                docs[doc] = max(docs.get(doc, 0.0), weight)
+                if word not in self.word_grams:
+                    grams = trigrams(word)
+                    self.word_grams[word] = grams
+                    for gram in grams:
+                        self.gram_words.setdefault(gram, set()).add(word)
+
+    def matching_words(self, token):
+        """ Return {word: similarity} for indexed words close enough to the token
+        """
+        grams = trigrams(token)
+        shared = {}
+        for gram in grams:
+            for word in self.gram_words.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        matches = {}
+        for word, count in shared.items():
+            similarity = 2.0 * count / (len(grams) + len(self.word_grams[word]))
+            if word == token:
+                similarity = 1.0
+            elif len(token) > 2 and word.startswith(token):
+                similarity = max(similarity, PREFIX_SIMILARITY)
+            elif similarity < MIN_SIMILARITY and count > 1 and len(token) > 3:
+                distance = edit_distance(token, word, limit=1 if len(token) < 7 else 2)
+                similarity = max(similarity, TYPO_SIMILARITY.get(distance, 0.0))
+            if similarity >= MIN_SIMILARITY:
+                matches[word] = similarity
+        return matches
+
+    def search(self, query, limit=None):
+        """ Return a list of (recipe name, score) best match first
+        Recipes matching more of the query words always rank higher
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = {}
+        coverage = {}
+        for token in set(tokens):
+            best = {}
+            for word, similarity in self.matching_words(token).items():
+                for doc, weight in self.word_docs[word].items():
+                    best[doc] = max(best.get(doc, 0.0), similarity * weight)
+            for doc, score in best.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+                coverage[doc] = coverage.get(doc, 0) + 1
+        ranked = sorted(scores, key=lambda doc: (coverage[doc], scores[doc]), reverse=True)
+        if limit:
+            ranked = ranked[:limit]
+        return [(self.names[doc], scores[doc]) for doc in ranked]
@@ -0,0 +1,98 @@
+""" Recipe similarity index for "drinks like this" suggestions
+Each recipe becomes a vector of ingredient proportions, plus a few lightly
+weighted style/glass/prep features. The top-k cosine neighbours of every
+recipe are precomputed, so a lookup at request time is O(k).
+"""
+import numpy as np
+
+from .logger import get_logger
+log = get_logger(__name__)
+
+NEIGHBOURS = 8 # stored per recipe, callers usually want fewer
+ATTRIBUTE_WEIGHT = 0.15 # relative to the ingredient proportions, which sum to 1
+LITERAL_AMOUNT = 0.5 # oz, stand-in for "one egg white" and friends
+BLOCK_SIZE = 512 # rows per matrix product when ranking
+
+def recipe_profile(recipe):
+    """ Return a dict of feature -> weight for a DrinkRecipe
+    Ingredient features are keyed on the type, e.g. "dry gin", and weighted
+    by the proportion of the drink's volume they make up
+    """
+    amounts = {}
+    for ingredient in recipe._get_quantized_ingredients():
+        try:
+            amount = ingredient.get_amount_as('oz', rounded=False, single_value=True)
+        except NotImplementedError:
+            amount = None
+        if amount is None:
+            amount = LITERAL_AMOUNT
+        type_ = ingredient.specifier.ingredient.lower()
+        amounts[type_] = amounts.get(type_, 0.0) + float(amount)
+    total = sum(amounts.values())
+    profile = {type_: amount / total for type_, amount in amounts.items()} if total else {}
+    for attr in 'style glass prep'.split():
+        value = getattr(recipe, attr)
+        if value:
+            profile['{}:{}'.format(attr, value.lower())] = ATTRIBUTE_WEIGHT
+    return profile
+
+class SimilarityIndex(object):
+    """ Cosine similarity over recipe profiles with precomputed neighbours
+    Built once from the base recipes, which only change with a restart
+    :param int k: neighbours kept per recipe, the most similar() returns
+    """
+    def __init__(self, recipes, k=NEIGHBOURS):
+        self.k = k
+        self.names = [] # row -> recipe name
+        self.rows = {} # recipe name -> row
+        profiles = []
+        features = {} # feature -> column
+        for recipe in recipes:
+            profile = recipe_profile(recipe)
+            self.rows[recipe.name] = len(self.names)
+            self.names.append(recipe.name)
+            profiles.append(profile)
+            for feature in profile:
+                features.setdefault(feature, len(features))
+        self.matrix = np.zeros((len(self.names), len(features)))
+        for row, profile in enumerate(profiles):
+            for feature, weight in profile.items():
+                self.matrix[row, features[feature]] = weight
+        norms = np.linalg.norm(self.matrix, axis=1)
+        norms[norms == 0] = 1.0
+        self.matrix /= norms[:, np.newaxis]
+        self.neighbours = [[] for _ in self.names] # row -> [(score, row), ...] best first
+        self._rank_rows(list(range(len(self.names))))
+        log.info("Similarity index built for {} recipes".format(len(self.names)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def similar(self, name, k=None):
+        """ Return up to k (name, score) pairs for the recipes most like
+        the named one, best first
+        :raises ValueError: if k is more than the neighbours kept per recipe
+        """
+        if k is not None and k > self.k:
+            raise ValueError("At most {} similar recipes are kept per recipe".format(self.k))
+        row = self.rows.get(name)
+        if row is None:
+            return []
+        return [(self.names[j], score) for score, j in self.neighbours[row][:k or self.k]]
+
+    def _rank_rows(self, rows):
+        """ Compute the neighbour lists for the given rows
+        """
+        n_rows = len(self.names)
+        k = min(self.k, n_rows - 1)
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block = rows[start:start+BLOCK_SIZE]
+            sims = self.matrix[block].dot(self.matrix.T)
+            sims[np.arange(len(block)), block] = 0.0 # never your own neighbour
+            if k < 1:
+                top = np.zeros((len(block), 0), dtype=int)
+            else:
+                top = np.argpartition(-sims, k-1, axis=1)[:, :k]
+            for i, row in enumerate(block):
+                candidates = top[i][np.argsort(-sims[i, top[i]])]
+                self.neighbours[row] = [(float(sims[i, j]), int(j)) for j in candidates if sims[i, j] > 0]
@@ -0,0 +1,49 @@
+/* Browse infinite scroll
+ * The first page of recipes is rendered with the page, the rest are fetched
+ * from /api/recipes when the "more" element scrolls into view.
+ * The cursor from each response carries the filters for the next page.
+ */
+var loading_recipes = false;
+
+function loadMoreRecipes() {
+    var more = $('#recipe-grid-more');
+    var cursor = more.data('cursor');
+    if (loading_recipes || !cursor) {
+        return;
+    }
+    loading_recipes = true;
+    $.getJSON("/api/recipes", { cursor: cursor })
+        .done(function(result) {
+            if (result.status == "success") {
+                var grid = $('#recipe-grid');
+                result.data.forEach(function(recipe) {
+                    grid.append('<div class="col-sm-6 col-lg-6 col-xl-4 mb-3">' + recipe.html + '</div>');
+                });
+                if (result.next_cursor) {
+                    more.data('cursor', result.next_cursor);
+                }
+                else {
+                    more.remove();
+                }
+            }
+            else {
+                console.log("Error: " + result.message);
+                more.remove();
+            }
+        })
+        .always(function() {
+            loading_recipes = false;
+        });
+};
+
+$(document).ready(function () {
+    var more = document.getElementById('recipe-grid-more');
+    if (more && 'IntersectionObserver' in window) {
+        var observer = new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting) {
+                loadMoreRecipes();
+            }
+        }, { rootMargin: '400px' });
+        observer.observe(more);
+    }
+});
@@ -0,0 +1,42 @@
+/* Admin dashboard tables
+ * Paged, sorted, and searched on the server, see /api/admin/users and
+ * /api/admin/orders, so the page only ever loads one page of rows.
+ */
+var dashboard_table_defaults = {
+    "serverSide": true,
+    "processing": true,
+    "searchDelay": 400,
+    "lengthMenu": [10, 25, 50, 100],
+    "pageLength": 25
+};
+
+$(document).ready( function () {
+    $("#user_table").DataTable($.extend({}, dashboard_table_defaults, {
+        "ajax": "/api/admin/users",
+        "order": [[0, "asc"]],
+        "columns": [
+            {data: "id"},
+            {data: "email"},
+            {data: "first_name"},
+            {data: "last_name"},
+            {data: "nickname"},
+            {data: "login_count"},
+            {data: "last_login_at"},
+            {data: "confirmed_at"},
+            {data: "roles", orderable: false},
+            {data: "orders", orderable: false}
+        ]
+    }));
+    $("#order_table").DataTable($.extend({}, dashboard_table_defaults, {
+        "ajax": "/api/admin/orders",
+        "order": [[1, "desc"]],
+        "columns": [
+            {data: "id"},
+            {data: "timestamp"},
+            {data: "confirmed"},
+            {data: "user_id"},
+            {data: "bar_id"},
+            {data: "recipe_name"}
+        ]
+    }));
+});
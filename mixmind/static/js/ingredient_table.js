@@ -50,10 +50,61 @@ var column_settings = [
         className: number_col_classes, render: $.fn.dataTable.render.number(',','.',3,"$ ")}
 ]
 
+/* Client side mode keeps a copy of the stock in localStorage, and on load
+ * only asks for the rows changed since that copy's version, unless the
+ * server answers with all of them because the copy can't be patched */
+function stockCacheKey() {
+    return "mixmind-ingredients-" + $("#barstock-table").data("bar-id");
+};
+
+function loadIngredients(data, callback, settings) {
+    var cached = null;
+    try {
+        cached = JSON.parse(window.localStorage.getItem(stockCacheKey()));
+    } catch (e) {}
+    var done = function(version, rows) {
+        try {
+            window.localStorage.setItem(stockCacheKey(), JSON.stringify({version: version, rows: rows}));
+        } catch (e) {}
+        callback({data: rows});
+    };
+    var full = function() {
+        $.getJSON("/api/ingredients").done(function(result) {
+            done(result.version, result.data);
+        });
+    };
+    if (!cached || cached.version === undefined) {
+        full();
+        return;
+    }
+    $.getJSON("/api/ingredients", { since: cached.version })
+        .done(function(result) {
+            if (result.status != "success") {
+                full();
+                return;
+            }
+            if (result.reset) {
+                done(result.version, result.data);
+                return;
+            }
+            var rows = {};
+            cached.rows.forEach(function(row) { rows[row.iid] = row; });
+            result.data.deleted.forEach(function(iid) { delete rows[iid]; });
+            result.data.changed.forEach(function(row) { rows[row.iid] = row; });
+            done(result.version, Object.keys(rows).map(function(iid) { return rows[iid]; }));
+        })
+        .fail(full);
+};
+
 var barstock_table;
 $(document).ready( function () {
+    // large inventories are searched, sorted, and paged by the server
+    var server_side = $("#barstock-table").data("server-side") === true;
     barstock_table = $("#barstock-table").DataTable( {
-        "ajax": "/api/ingredients",
+        "ajax": server_side ? "/api/ingredients" : loadIngredients,
+        "serverSide": server_side,
+        "processing": server_side,
+        "searchDelay": server_side ? 400 : 0,
         "paging": true,
         "lengthMenu":  [10, 20, 50, 100],
         "pageLength": 20,
@@ -0,0 +1,45 @@
+/* Follow a background job, like an ingredients import or a menu
+ * Polls /api/jobs/<id> and fills in the progress bar, then reloads the page
+ * once the job is done so the table and flashed messages are current, or
+ * for a menu, so the page sends the generated file.
+ */
+var JOB_POLL_MS = 1000;
+var JOB_STAGES = {"import": "Saving ingredients", "regenerate": "Updating recipes",
+    "format": "Formatting recipes", "compile": "Compiling"};
+
+function pollJob(panel) {
+    $.getJSON("/api/jobs/" + panel.data("job-id"))
+        .done(function(result) {
+            if (result.status != "success") {
+                panel.find(".job-message").text(result.message);
+                return;
+            }
+            var job = result.data;
+            var bar = panel.find(".progress-bar");
+            if (job.status == "done") {
+                bar.css("width", "100%").removeClass("progress-bar-animated").addClass("bg-success");
+                window.location.reload();
+                return;
+            }
+            if (job.status == "failed") {
+                bar.css("width", "100%").removeClass("progress-bar-animated progress-bar-striped").addClass("bg-danger");
+                panel.find(".job-message").text(job.message);
+                return;
+            }
+            if (job.total) {
+                bar.css("width", Math.round(100 * job.done / job.total) + "%");
+            }
+            panel.find(".job-message").text(JOB_STAGES[job.stage] || job.message || "Waiting to start");
+            setTimeout(function() { pollJob(panel); }, JOB_POLL_MS);
+        })
+        .fail(function() {
+            setTimeout(function() { pollJob(panel); }, JOB_POLL_MS * 5);
+        });
+};
+
+$(document).ready(function () {
+    var panel = $("#job-progress");
+    if (panel.length) {
+        pollJob(panel);
+    }
+});
@@ -0,0 +1,35 @@
+/* "Load more" for order tables
+ * Each button carries the cursor for the next page of its table, the rows
+ * come back rendered from /api/orders and are appended to the table body.
+ */
+function loadMoreOrders(button) {
+    var cursor = button.data('cursor');
+    if (!cursor || button.prop('disabled')) {
+        return;
+    }
+    button.prop('disabled', true);
+    $.getJSON("/api/orders", { cursor: cursor })
+        .done(function(result) {
+            if (result.status == "success") {
+                $(button.data('target')).append(result.data.html);
+                if (result.next_cursor) {
+                    button.data('cursor', result.next_cursor);
+                }
+                else {
+                    button.remove();
+                }
+            }
+            else {
+                console.log("Error: " + result.message);
+            }
+        })
+        .always(function() {
+            button.prop('disabled', false);
+        });
+};
+
+$(document).ready(function () {
+    $('.orders-more').on('click', function() {
+        loadMoreOrders($(this));
+    });
+});
@@ -0,0 +1,68 @@
+/* Bartender order queue
+ * New orders arrive over the /api/orders/stream event source and are added
+ * to the page, orders confirmed here or anywhere else are removed. Each
+ * (re)connect starts with the ids still waiting, to catch up on what was missed.
+ */
+function updateQueueEmpty() {
+    $("#queue-empty").toggleClass("d-none", $("#order-queue .queue-order").length > 0);
+};
+
+function removeQueueOrder(id) {
+    $("#queue-order-" + id).remove();
+    updateQueueEmpty();
+};
+
+function confirmQueueOrder(button) {
+    var card = button.closest(".queue-order");
+    button.prop("disabled", true);
+    $.post("/api/orders/" + card.data("order-id") + "/confirm")
+        .done(function(result) {
+            if (result.status == "success") {
+                removeQueueOrder(card.data("order-id"));
+            }
+            else {
+                alert(result.message);
+                button.prop("disabled", false);
+            }
+        })
+        .fail(function() {
+            button.prop("disabled", false);
+        });
+};
+
+function followOrders() {
+    var source = new EventSource("/api/orders/stream");
+    source.addEventListener("open", function() {
+        $("#queue-status").text("Live");
+    });
+    source.addEventListener("error", function() {
+        $("#queue-status").text("Reconnecting…");
+    });
+    source.addEventListener("pending", function(e) {
+        // sent on every (re)connect, drop what was confirmed in between
+        var ids = JSON.parse(e.data).ids;
+        $("#order-queue .queue-order").each(function() {
+            if (ids.indexOf($(this).data("order-id")) == -1) {
+                $(this).remove();
+            }
+        });
+        updateQueueEmpty();
+    });
+    source.addEventListener("order", function(e) {
+        var order = JSON.parse(e.data);
+        if ($("#queue-order-" + order.id).length == 0) {
+            $("#order-queue").append(order.html);
+            updateQueueEmpty();
+        }
+    });
+    source.addEventListener("confirmed", function(e) {
+        removeQueueOrder(JSON.parse(e.data).id);
+    });
+};
+
+$(document).ready(function () {
+    $("#order-queue").on("click", ".queue-confirm", function() {
+        confirmQueueOrder($(this));
+    });
+    followOrders();
+});
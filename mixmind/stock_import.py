@@ -0,0 +1,197 @@
+""" Preview and apply ingredient CSV uploads
+The upload is parsed as a stream and validated row by row, then diffed
+against the bar's current stock. The resulting plan shows what would be
+inserted, updated, and deleted, and which recipes would be gained or lost,
+computed with an in-memory barstock so the live library is left alone.
+"""
+import codecs
+import csv
+import datetime
+import json
+import uuid
+import zlib
+
+from .barstock import Barstock_Memory, _update_computed_fields, next_stock_version, mark_changed, mark_deleted
+from .database import db
+from .ingredient import Categories, Ingredient, display_name_mappings
+from .models import PendingImport, Job
+from .recipe import DrinkRecipe
+from .logger import get_logger
+log = get_logger(__name__)
+
+MAX_ERRORS = 50 # reported per upload, the rest are only counted
+PENDING_MAX_AGE = 60*60 # seconds an unconfirmed upload is kept
+COMPARED_FIELDS = 'Category Type Kind In_Stock ABV Size_mL Price_Paid'.split()
+
+def parse_csv(stream):
+    """ Validate an uploaded CSV a row at a time
+    :param stream: binary file-like object, e.g. the upload's stream
+    :returns: (rows, errors, n_errors) where rows is a dict of (Type, Kind)
+        -> clean row dict with model field names, later rows win
+    """
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    rows = {}
+    errors = []
+    n_errors = 0
+    def error(line, message):
+        nonlocal n_errors
+        n_errors += 1
+        if len(errors) < MAX_ERRORS:
+            errors.append("Line {}: {}".format(line, message))
+    try:
+        unknown = [field for field in reader.fieldnames or [] if field not in display_name_mappings]
+        if unknown:
+            error(1, "unknown columns ignored: {}".format(', '.join(unknown)))
+            n_errors -= 1 # not fatal
+        for row in reader:
+            line = reader.line_num
+            clean = {}
+            try:
+                for label, value in row.items():
+                    if label in display_name_mappings:
+                        mapping = display_name_mappings[label]
+                        clean[mapping['k']] = mapping['v'](value.strip() if isinstance(value, str) else value)
+            except (ValueError, TypeError) as e:
+                error(line, "invalid value: {}".format(e))
+                continue
+            if not clean.get('Type') or not clean.get('Kind'):
+                error(line, "Ingredient and Kind are required")
+                continue
+            if clean.get('Category') and clean['Category'] not in Categories:
+                error(line, "unknown Category '{}'".format(clean['Category']))
+                continue
+            rows[(clean['Type'], clean['Kind'])] = clean
+    except (UnicodeDecodeError, csv.Error) as e:
+        error(getattr(reader, 'line_num', 0), "could not read file: {}".format(e))
+    return rows, errors, n_errors
+
+def _differs(old, new):
+    if isinstance(old, float) or isinstance(new, float):
+        try:
+            return abs(float(old or 0) - float(new or 0)) > 1e-6
+        except (TypeError, ValueError):
+            return True
+    return old != new
+
+def plan_import(bar_id, rows, replace_existing, recipes):
+    """ Diff the uploaded rows against the bar's stock
+    :param dict rows: from parse_csv
+    :param recipes: the bar's current DrinkRecipes, only read
+    :returns: dict with inserts, updates, deletes, unchanged, gained, lost
+    """
+    current = {(i.Type, i.Kind): i for i in Ingredient.query.filter_by(bar_id=bar_id)}
+    inserts, updates, deletes = [], [], []
+    unchanged = 0
+    after = {} if replace_existing else {key: _copy(i) for key, i in current.items()}
+    for key, clean in rows.items():
+        existing = current.get(key)
+        if existing is None:
+            inserts.append(clean)
+        else:
+            changes = {field: (existing[field], value) for field, value in clean.items()
+                    if field in COMPARED_FIELDS and _differs(existing[field], value)}
+            if changes:
+                updates.append({'Type': key[0], 'Kind': key[1], 'changes': changes})
+            else:
+                unchanged += 1
+        row = _copy(existing) if existing is not None else Ingredient(bar_id=bar_id, In_Stock=True)
+        for field, value in clean.items():
+            row[field] = value
+        _update_computed_fields(row)
+        after[key] = row
+    if replace_existing:
+        deletes = [{'Type': key[0], 'Kind': key[1]} for key in current if key not in rows]
+
+    # recipes that can be made before and after, without touching the live library
+    barstock = Barstock_Memory(bar_id, after.values())
+    gained, lost = [], []
+    for recipe in recipes:
+        could = recipe.can_make
+        can = DrinkRecipe(recipe.name, recipe.recipe_dict).generate_examples(barstock).can_make
+        if can and not could:
+            gained.append(recipe.name)
+        elif could and not can:
+            lost.append(recipe.name)
+    return {'inserts': inserts, 'updates': updates, 'deletes': deletes, 'unchanged': unchanged,
+            'gained': sorted(gained), 'lost': sorted(lost)}
+
+def _copy(ingredient):
+    """ Detached copy of an Ingredient for the in-memory barstock """
+    row = Ingredient(bar_id=ingredient.bar_id)
+    for column in Ingredient.__table__.columns.keys():
+        row[column] = ingredient[column]
+    return row
+
+def apply_import(bar_id, rows, replace_existing, progress=None, commit=True):
+    """ Apply the uploaded rows in one transaction
+    :param progress: called as progress(done, total) as rows are applied
+    :param bool commit: False to leave committing the transaction to the caller
+    :returns: set of the ingredient types affected, for regenerating recipes
+    """
+    version = next_stock_version(bar_id)
+    current = {(i.Type, i.Kind): i for i in Ingredient.query.filter_by(bar_id=bar_id)}
+    types = set()
+    if replace_existing:
+        for key, ingredient in current.items():
+            if key not in rows:
+                types.add(ingredient.type_)
+                mark_deleted(ingredient, version)
+                db.session.delete(ingredient)
+    for done, (key, clean) in enumerate(rows.items()):
+        if progress:
+            progress(done, len(rows))
+        ingredient = current.get(key)
+        if ingredient is None:
+            ingredient = Ingredient(bar_id=bar_id, uuid=uuid.uuid4(), **clean)
+            db.session.add(ingredient)
+        else:
+            types.add(ingredient.type_)
+            for field, value in clean.items():
+                ingredient[field] = value
+        _update_computed_fields(ingredient)
+        mark_changed(ingredient, version)
+        types.add(ingredient.type_)
+    if commit:
+        db.session.commit()
+    return types
+
+def save_pending(bar_id, rows, replace_existing, filename, stock_version):
+    """ Keep a previewed upload until the owner confirms it
+    :returns: token identifying the upload
+    """
+    _prune_pending()
+    token = uuid.uuid4().hex
+    db.session.add(PendingImport(token=token, bar_id=bar_id, filename=filename, replace_existing=replace_existing,
+        stock_version=stock_version, created=datetime.datetime.utcnow(),
+        data=zlib.compress(json.dumps(list(rows.values())).encode('utf-8'))))
+    db.session.commit()
+    return token
+
+def load_pending(token):
+    """ :returns: the saved upload, with rows keyed again, or None """
+    try:
+        uuid.UUID(hex=token)
+    except (ValueError, TypeError):
+        return None
+    pending = PendingImport.query.get(token)
+    if pending is None:
+        return None
+    rows = json.loads(zlib.decompress(pending.data).decode('utf-8'))
+    return {'bar_id': pending.bar_id, 'replace_existing': pending.replace_existing, 'filename': pending.filename,
+            'stock_version': pending.stock_version, 'rows': {(row['Type'], row['Kind']): row for row in rows}}
+
+def discard_pending(token, commit=True):
+    """ :param bool commit: False to leave committing the transaction to the caller """
+    PendingImport.query.filter_by(token=token).delete(synchronize_session=False)
+    if commit:
+        db.session.commit()
+
+def _prune_pending():
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=PENDING_MAX_AGE)
+    # uploads still waiting on an import job are kept however old they are
+    queued = Job.query.filter(Job.kind == 'import', Job.status.in_(('queued', 'running'))).with_entities(Job.payload)
+    keep = [json.loads(payload).get('token') for payload, in queued]
+    expired = PendingImport.query.filter(PendingImport.created < cutoff)
+    if keep:
+        expired = expired.filter(~PendingImport.token.in_(keep))
+    expired.delete(synchronize_session=False)
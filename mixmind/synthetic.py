@@ -0,0 +1,330 @@
+""" Deterministic synthetic data for scale testing
+Generates recipes as json (see recipe_schema.json), a barstock csv with the
+columns of display_name_mappings, and bars, users, bartenders, per-bar
+ingredients and orders loaded into a database, all from one seed.
+
+Ingredient types come in families like the real ones, e.g. spirits, citrus
+juices, syrups, and both the number of bottles of a type and how often
+recipes call for it follow the type's popularity. Popular types end up with
+many bottles and in many recipes, which is what makes the kind combinations
+in DrinkRecipe.generate_examples expensive at a real bar.
+"""
+import csv
+import datetime
+import itertools
+import json
+import random
+import uuid
+from collections import OrderedDict
+
+from . import util
+
+# category: (types, ABV range, price range, bottle sizes in mL)
+# types are roughly in order of popularity
+FAMILIES = OrderedDict([
+    ('Spirit', (['dry gin', 'vodka', 'white rum', 'bourbon whiskey', 'rye whiskey', 'tequila', 'amber rum',
+        'dark rum', 'cognac', 'scotch whisky', 'mezcal', 'brandy', 'irish whiskey', 'old tom gin', 'genever',
+        'calvados', 'pisco', 'cachaca', 'absinthe', 'aquavit'], (37.5, 60.0), (14.0, 80.0), [750, 1000, 1750])),
+    ('Liqueur', (['orange liqueur', 'campari', 'maraschino liqueur', 'coffee liqueur', 'amaretto', 'aperol',
+        'elderflower liqueur', 'green chartreuse', 'apricot brandy', 'creme de cassis', 'creme de cacao',
+        'benedictine', 'peach liqueur', 'raspberry liqueur', 'galliano', 'falernum', 'banana liqueur',
+        'creme de violette', 'cherry liqueur', 'yellow chartreuse'], (15.0, 55.0), (12.0, 45.0), [375, 750])),
+    ('Vermouth', (['sweet vermouth', 'dry vermouth', 'blanc vermouth', 'lillet blanc', 'amaro', 'fino sherry',
+        'cocchi americano', 'punt e mes'], (15.0, 20.0), (8.0, 35.0), [375, 750, 1000])),
+    ('Bitters', (['aromatic bitters', 'orange bitters', 'peychaud bitters', 'chocolate bitters', 'celery bitters',
+        'grapefruit bitters', 'mole bitters', 'cardamom bitters'], (35.0, 48.0), (6.0, 22.0), [118, 148, 200])),
+    ('Syrup', (['simple syrup', 'rich simple syrup', 'honey syrup', 'grenadine', 'orgeat', 'ginger syrup',
+        'demerara syrup', 'agave syrup', 'cinnamon syrup', 'raspberry syrup', 'vanilla syrup'],
+        (0.0, 0.0), (2.0, 14.0), [500, 750, 1000])),
+    ('Juice', (['lime juice', 'lemon juice', 'orange juice', 'pineapple juice', 'grapefruit juice',
+        'cranberry juice', 'tomato juice', 'apple juice', 'passion fruit juice'], (0.0, 0.0), (1.0, 6.0), [250, 500, 1000])),
+    ('Mixer', (['soda water', 'tonic water', 'ginger beer', 'cola', 'ginger ale', 'water'],
+        (0.0, 0.0), (1.0, 4.0), [200, 355, 1000])),
+    ('Wine', (['champagne', 'prosecco', 'dry white wine', 'red wine', 'port'], (11.0, 20.0), (9.0, 40.0), [750])),
+    ('Dry', (['sugar', 'sugar cube', 'salt'], (0.0, 0.0), (1.0, 5.0), [500])),
+    ])
+# prefixes for variations of the types when a big catalog needs more of them
+TYPE_QUALIFIERS = ['aged', 'spiced', 'smoked', 'barrel aged', 'overproof', 'small batch', 'infused', 'house']
+
+BRAND_PARTS = ['Old', 'Royal', 'Black', 'Silver', 'Copper', 'Grand', 'Saint', 'North', 'Red', 'Hidden',
+        'Crown', 'Iron', 'Golden', 'Wild', 'Harbor', 'Twin', 'Lone', 'Stone', 'River', 'Fox']
+BRAND_NAMES = ['Oak', 'Anchor', 'Heron', 'Meadow', 'Lantern', 'Barrel', 'Compass', 'Thistle', 'Falcon',
+        'Orchard', 'Summit', 'Harvest', 'Raven', 'Willow', 'Beacon', 'Cellar', 'Tide', 'Ember', 'Canyon', 'Mill']
+BRAND_STYLES = ['Reserve', 'Select', 'Classic', 'Original', 'No. 3', 'Single Barrel', 'Export', 'Estate', 'Special', '']
+
+NAME_ADJECTIVES = ['Bitter', 'Velvet', 'Midnight', 'Jungle', 'Gilded', 'Smoky', 'Last', 'Lucky', 'Paper', 'Scarlet',
+        'Blue', 'Hanky', 'Rusty', 'Brown', 'Naked', 'Broken', 'Corpse', 'Final', 'Hidden', 'Southern']
+NAME_NOUNS = ['Word', 'Bird', 'Plane', 'Derby', 'Reviver', 'Sling', 'Smash', 'Sour', 'Flip', 'Rickey',
+        'Collins', 'Cobbler', 'Daisy', 'Fix', 'Julep', 'Punch', 'Toddy', 'Crusta', 'Cocktail', 'Swizzle']
+
+GARNISHES = ['Lemon twist', 'Orange twist', 'Lime wheel', 'Cherry', 'Mint sprig', 'Olive', 'Nutmeg', '']
+PROFILES = ['strong', 'tangy', 'citrusy', 'sweet', 'fruity', 'herbal']
+
+# recipe shapes: weight, then the parts as (category, amount range in oz or a
+# literal amount), style, prep, ice, glasses
+TEMPLATES = [
+    (35, 'sour', [('Spirit', (1.5, 2.0)), ('Juice', (0.75, 1.0)), ('Syrup', (0.5, 0.75))],
+        'All Day Cocktail', 'shake', 'cubed', ['cocktail', 'coupe', 'rocks']),
+    (25, 'stirred', [('Spirit', (1.5, 2.5)), ('Vermouth', (0.5, 1.0)), ('Bitters', 'dash')],
+        'Before Dinner Cocktail', 'stir', 'cubed', ['martini', 'cocktail', 'coupe', 'rocks']),
+    (15, 'highball', [('Spirit', (1.5, 2.0)), ('Mixer', 'Top with')],
+        'Longdrink', 'build', 'cubed', ['highball', 'collins', 'copper mug']),
+    (10, 'sparkling', [('Spirit', (1.0, 1.5)), ('Juice', (0.5, 0.75)), ('Syrup', (0.25, 0.5)), ('Wine', 'Top with')],
+        'Sparkling Cocktail', 'shake', 'neat', ['flute', 'coupe']),
+    (10, 'equal parts', [('Spirit', (0.75, 1.0)), ('Liqueur', (0.75, 1.0)), ('Vermouth', (0.75, 1.0))],
+        'Before Dinner Cocktail', 'stir', 'cubed', ['rocks', 'cocktail']),
+    (5, 'after dinner', [('Spirit', (1.0, 1.5)), ('Liqueur', (0.75, 1.0)), ('Liqueur', (0.25, 0.5))],
+        'After Dinner Cocktail', 'shake', 'cubed', ['cocktail', 'coupe']),
+    ]
+
+def _rng(seed, section):
+    """ Separate generator per section, so e.g. more orders keep the same recipes """
+    return random.Random("{}:{}".format(seed, section))
+
+def _zipf(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n+1)]
+
+class ScaleData(object):
+    """ Synthetic data at a given scale, the same for the same seed and sizes
+
+    :param int recipes: number of recipes
+    :param int bottles: number of bottles in the barstock catalog
+    :param int bars: number of bars, each stocking a sample of the catalog
+    :param int users: number of users, some of them bar owners and bartenders
+    :param int orders: number of orders across all the bars
+    :param int bar_bottles: bottles stocked by each bar
+    :param int max_kinds: most bottles of a single type
+    :param int days: orders are spread over this many days before `until`
+    """
+    def __init__(self, seed=0, recipes=1000, bottles=500, bars=10, users=200, orders=10000,
+            bar_bottles=200, max_kinds=12, days=90, until=datetime.datetime(2026, 1, 1)):
+        self.seed = seed
+        self.n_recipes = recipes
+        self.n_bottles = bottles
+        self.n_bars = bars
+        self.n_users = max(users, bars)
+        self.n_orders = orders
+        self.bar_bottles = min(bar_bottles, bottles)
+        self.max_kinds = max_kinds
+        self.days = days
+        self.until = until
+        self._types = None
+        self._catalog = None
+        self._recipes = None
+
+    def types(self):
+        """ :returns: list of (category, type, weight) for every ingredient type """
+        if self._types is None:
+            # enough types for the bottles at half of max_kinds each, the extra
+            # types are variations of the spirits and liqueurs
+            needed = -(-2 * self.n_bottles // max(1, self.max_kinds))
+            extra = max(0, needed - sum(len(family[0]) for family in FAMILIES.values())) // 2
+            self._types = []
+            for category, (names, _, _, _) in FAMILIES.items():
+                if category in ('Spirit', 'Liqueur'):
+                    names = names + list(itertools.islice(self._variations(names), extra))
+                for name, weight in zip(names, _zipf(len(names))):
+                    self._types.append((category, name, weight))
+        return self._types
+
+    @staticmethod
+    def _variations(names):
+        """ e.g. "aged dry gin", then "smoked aged dry gin" once those run out """
+        for depth in itertools.count(1):
+            for qualifiers in itertools.permutations(TYPE_QUALIFIERS, depth):
+                for name in names:
+                    yield ' '.join(qualifiers + (name,))
+
+    def catalog(self):
+        """ Every bottle, as dicts with model field names, most popular types first """
+        if self._catalog is None:
+            rng = _rng(self.seed, 'catalog')
+            types = self.types()
+            counts = self._bottle_counts([weight for _, _, weight in types])
+            self._catalog = []
+            brands = set()
+            for (category, type_, _), count in zip(types, counts):
+                _, abv, price, sizes = FAMILIES[category]
+                for _ in range(count):
+                    kind = self._brand(rng, brands)
+                    self._catalog.append(OrderedDict([
+                        ('Category', category),
+                        ('Type', type_.title()),
+                        ('Kind', kind),
+                        ('In_Stock', rng.random() < 0.92),
+                        ('ABV', round(rng.uniform(*abv), 1)),
+                        ('Size_mL', float(rng.choice(sizes))),
+                        ('Price_Paid', round(rng.uniform(*price), 2)),
+                        ]))
+        return self._catalog
+
+    def _bottle_counts(self, weights):
+        """ Bottles per type in proportion to the weights, at least one and at
+        most max_kinds each, adding up to about n_bottles
+        """
+        def counts(scale):
+            return [min(self.max_kinds, max(1, int(round(scale * weight)))) for weight in weights]
+        low, high = 0.0, float(self.n_bottles) / min(weights)
+        for _ in range(50):
+            middle = (low + high) / 2
+            if sum(counts(middle)) < self.n_bottles:
+                low = middle
+            else:
+                high = middle
+        return counts(high)
+
+    @staticmethod
+    def _brand(rng, taken):
+        for _ in range(20):
+            name = ' '.join(part for part in (rng.choice(BRAND_PARTS), rng.choice(BRAND_NAMES), rng.choice(BRAND_STYLES)) if part)
+            if name not in taken:
+                break
+        else:
+            name = "{} {}".format(name, len(taken))
+        taken.add(name)
+        return name
+
+    def recipes(self):
+        """ :returns: OrderedDict of recipe name -> recipe dict, valid for recipe_schema.json """
+        if self._recipes is None:
+            rng = _rng(self.seed, 'recipes')
+            by_category = {}
+            for category, type_, weight in self.types():
+                names, weights = by_category.setdefault(category, ([], []))
+                names.append(type_)
+                weights.append(weight)
+            template_weights = [template[0] for template in TEMPLATES]
+            self._recipes = OrderedDict()
+            for i in range(self.n_recipes):
+                _, _, parts, style, prep, ice, glasses = rng.choices(TEMPLATES, template_weights)[0]
+                unit = 'cL' if rng.random() < 0.2 else 'oz'
+                ingredients = OrderedDict()
+                for category, amount in parts:
+                    names, weights = by_category[category]
+                    type_ = rng.choices(names, weights)[0]
+                    if type_ in ingredients:
+                        continue
+                    if not isinstance(amount, str):
+                        amount = round(rng.uniform(*amount) * 4) / 4.0 # nearest quarter oz
+                        if unit == 'cL':
+                            amount = round(amount * 3 * 2) / 2.0 # nearest half cL
+                    ingredients[type_] = amount
+                recipe = OrderedDict([
+                    ('unit', unit), ('prep', prep), ('ice', ice), ('glass', rng.choice(glasses)),
+                    ('style', style), ('ingredients', ingredients),
+                    ('profile', rng.sample(PROFILES, rng.randint(1, 2))),
+                    ])
+                if rng.random() < 0.2:
+                    recipe['optional'] = {rng.choice(by_category['Bitters'][0][:3]): 'dash'}
+                garnish = rng.choice(GARNISHES)
+                if garnish:
+                    recipe['garnish'] = garnish
+                if rng.random() < 0.1:
+                    recipe['tag'] = 'core'
+                if rng.random() < 0.3:
+                    recipe['info'] = "A {} with {}".format(style.lower(), ' and '.join(list(ingredients)[:2]))
+                if rng.random() < 0.05:
+                    recipe['variants'] = ["Swap the {} for another".format(next(iter(ingredients)))]
+                self._recipes[self._recipe_name(rng, i)] = recipe
+        return self._recipes
+
+    def _recipe_name(self, rng, i):
+        name = "{} {}".format(rng.choice(NAME_ADJECTIVES), rng.choice(NAME_NOUNS))
+        if name in self._recipes:
+            name = "{} No. {}".format(name, i)
+        return name
+
+    def write_recipes(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self.recipes(), fp, indent=2)
+
+    def write_barstock(self, filename, bottles=None):
+        """ Barstock csv, of the whole catalog or the given bottles """
+        with open(filename, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['Category', 'Type', 'Kind', 'In Stock', 'ABV', 'Size (mL)', 'Price Paid'])
+            for row in self.catalog() if bottles is None else bottles:
+                writer.writerow([row['Category'], row['Type'], row['Kind'], int(row['In_Stock']),
+                    row['ABV'], row['Size_mL'], row['Price_Paid']])
+
+    def bar_stock(self, bar_id):
+        """ The bottles a bar stocks, always with the most popular types """
+        rng = _rng(self.seed, 'bar-{}'.format(bar_id))
+        catalog = self.catalog()
+        first = catalog[:self.bar_bottles // 2]
+        return first + rng.sample(catalog[len(first):], self.bar_bottles - len(first))
+
+    def users(self):
+        for user_id in range(1, self.n_users+1):
+            yield {'id': user_id, 'email': "user{}@example.com".format(user_id),
+                    'first_name': "User", 'last_name': str(user_id), 'active': True, 'login_count': 0}
+
+    def bars(self):
+        for bar_id in range(1, self.n_bars+1):
+            yield {'id': bar_id, 'cname': "bar{}".format(bar_id), 'name': "Bar {}".format(bar_id),
+                    'is_public': True, 'is_default': bar_id == 1, 'owner_id': bar_id,
+                    'bartender_on_duty': bar_id, 'stock_version': 0}
+
+    def orders(self):
+        """ Orders over the days before `until`, mostly in the evening, and
+        weighted toward each bar's favorite recipes
+        """
+        rng = _rng(self.seed, 'orders')
+        names = list(self.recipes())
+        hours = [1.0 / (1 + min(abs(hour - 20), 24 - abs(hour - 20))) ** 1.5 for hour in range(24)] # busiest at 20:00
+        favorites = _zipf(len(names), 0.8)
+        for order_id in range(1, self.n_orders+1):
+            bar_id = rng.randint(1, self.n_bars)
+            user_id = rng.randint(1, self.n_users)
+            day = self.until - datetime.timedelta(days=rng.randint(1, self.days))
+            timestamp = day + datetime.timedelta(hours=rng.choices(range(24), hours)[0], seconds=rng.randint(0, 3599))
+            confirmed = None
+            if rng.random() < 0.9:
+                confirmed = timestamp + datetime.timedelta(seconds=rng.lognormvariate(4.5, 0.6))
+            yield {'id': order_id, 'bar_id': bar_id, 'user_id': user_id, 'bartender_id': bar_id,
+                    'timestamp': timestamp, 'confirmed': confirmed, 'user_email': "user{}@example.com".format(user_id),
+                    'recipe_name': rng.choices(names, favorites)[0]}
+
+    def ingredient_rows(self, bar_id):
+        for row in self.bar_stock(bar_id):
+            row = dict(row, bar_id=bar_id, type_=row['Type'].lower(), change_seq=0,
+                    uuid=uuid.uuid5(uuid.NAMESPACE_URL, "{}:{}:{}:{}".format(self.seed, bar_id, row['Type'], row['Kind'])))
+            row['Size_oz'] = util.convert_units(row['Size_mL'], 'mL', 'oz')
+            row['Cost_per_mL'] = row['Price_Paid'] / row['Size_mL']
+            row['Cost_per_cL'] = row['Price_Paid'] * 10 / row['Size_mL']
+            row['Cost_per_oz'] = row['Price_Paid'] / row['Size_oz']
+            yield row
+
+    def load_database(self, url, batch=5000, progress=None):
+        """ Create the tables at the database url and fill them with the
+        bars, users, bartenders, ingredients, and orders
+        :param progress: called as progress(table, rows) after each table
+        """
+        from sqlalchemy import create_engine
+        from .database import db
+        from .models import User, Bar, Bartenders, Order
+        from .ingredient import Ingredient
+
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        def insert(table, rows):
+            count = 0
+            chunk = []
+            with engine.begin() as conn:
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) >= batch:
+                        conn.execute(table.insert(), chunk)
+                        count += len(chunk)
+                        chunk = []
+                if chunk:
+                    conn.execute(table.insert(), chunk)
+                    count += len(chunk)
+            if progress:
+                progress(table.name, count)
+
+        insert(User.__table__, self.users())
+        insert(Bar.__table__, self.bars())
+        insert(Bartenders.__table__, ({'user_id': bar_id, 'bar_id': bar_id} for bar_id in range(1, self.n_bars+1)))
+        insert(Ingredient.__table__, (row for bar_id in range(1, self.n_bars+1) for row in self.ingredient_rows(bar_id)))
+        insert(Order.__table__, self.orders())
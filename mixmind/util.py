@@ -45,16 +45,27 @@ class IntersectionResultRecipes(ResultRecipes):
     def get_items(self):
         return self.container
 
-def filter_recipes(all_recipes, filter_options, union_results=False):
+def filter_recipes(all_recipes, filter_options, union_results=False, search_index=None):
     """Filters the recipe list based on a FilterOptions bundle of parameters
     :param list[Recipe] all_recipes: list of recipe object to filter
     :param FilterOptions filter_options: bundle of filtering parameters
         search str: search an arbitrary string against the ingredients and attributes
     :param bool union_results: for each attributes searched against, combine results
         with set intersection by default, or union if True
+    :param TrigramIndex search_index: if given, the search string is matched
+        with the fuzzy index instead, the rest of the filters narrow down its
+        hits, and results are ordered best match first
     """
     result_recipes = UnionResultRecipes() if union_results else IntersectionResultRecipes()
     recipes = [recipe for recipe in all_recipes if filter_options.all_ or recipe.can_make]
+    if filter_options.search and search_index is not None:
+        available = {recipe.name: recipe for recipe in recipes}
+        hits = [available[name] for name, _ in search_index.search(filter_options.search)
+                if name in available]
+        narrowed, _ = filter_recipes(hits, filter_options._replace(search=""))
+        keep = {recipe.name for recipe in narrowed}
+        result_recipes = [recipe for recipe in hits if recipe.name in keep]
+        return result_recipes, excluded_names(all_recipes, result_recipes)
     if filter_options.search:
         include_list = [filter_options.search.lower()]
     else:
@@ -73,12 +84,14 @@ def filter_recipes(all_recipes, filter_options, union_results=False):
         result_recipes.add_items(filter_on_attribute(recipes, filter_options, attr))
 
     result_recipes = result_recipes.get_items()
+    return result_recipes, excluded_names(all_recipes, result_recipes)
 
+def excluded_names(all_recipes, result_recipes):
     def get_names(items):
         return set([i.name for i in items])
     excluded = sorted(list(get_names(all_recipes) - get_names(result_recipes)))
     log.debug("Excluded: {}\n".format(', '.join(excluded)))
-    return result_recipes, excluded
+    return excluded
 
 def filter_on_attribute(recipes, filter_options, attribute):
     attr_value = getattr(filter_options, attribute).lower()
@@ -4,27 +4,42 @@ Application main for the mixmind app
 import os
 import random
 import datetime
-import tempfile
 import urllib.request, urllib.parse, urllib.error
 import codecs
+import base64
+import uuid
+import json
 
 import pendulum
 from functools import wraps
+from collections import defaultdict
 
-from flask import g, render_template, flash, request, send_file, jsonify, redirect, url_for, after_this_request
+from sqlalchemy import and_, or_, func, case
+from sqlalchemy.orm import aliased, load_only
+from flask import g, render_template, flash, request, send_file, jsonify, redirect, url_for, stream_with_context
 from flask_security import login_required, roles_required, roles_accepted
 from flask_security.decorators import _get_unauthorized_view
 from flask_login import current_user
+from werkzeug.utils import secure_filename
 
-from .notifier import send_mail
+from .notifier import enqueue_mail, outbox
 from .forms import DrinksForm, OrderForm, OrderFormAnon, RecipeForm, RecipeListSelector, BarstockForm, UploadBarstockForm, LoginForm, CreateBarForm, EditBarForm, EditUserForm, SetBarOwnerForm
 from .authorization import user_datastore
-from .barstock import Barstock_SQL, Ingredient, _update_computed_fields
-from .formatted_menu import filename_from_options, generate_recipes_pdf
-from .compose_html import recipe_as_html, users_as_table, orders_as_table, bars_as_table
+from .barstock import Barstock_SQL, Ingredient, stock_version, next_stock_version, mark_changed, mark_deleted, edit_ingredient
+from .ingredient import Categories, IngredientTombstone
+from .formatted_menu import filename_from_options, menu_key
+from .compose_html import recipe_as_html
+from .datatables import DataTablesRequest
+from .stock_import import parse_csv, plan_import, save_pending, load_pending, discard_pending
+from .jobs import job_runner, active_job, menu_dir
+from .order_events import order_events, order_stream, pending_orders
+from .analytics import GRAINS, record_order, record_confirm, recipe_stats, timeline
+from .similarity import NEIGHBOURS
+from .library import RecipeLibrary
 from .util import filter_recipes, DisplayOptions, FilterOptions, PdfOptions, load_recipe_json, report_stats, convert_units
 from .database import db
-from .models import User, Order, Bar
+from .models import User, Order, Bar, Role, RolesUsers, Job, OutboxMail
+from .configuration_management import invalidate_bar_config
 from . import app, mms, current_bar
 from .logger import get_logger
 log = get_logger(__name__)
@@ -45,6 +60,8 @@ NOTES:
 """
 @app.before_request
 def initialize_shared_data():
+    if request.endpoint == 'static':
+        return
     g.bar_id = current_bar.id
 
 def get_form(form_class):
@@ -57,6 +74,51 @@ def get_form(form_class):
 def bundle_options(tuple_class, args):
     return tuple_class(*(getattr(args, field).data for field in tuple_class._fields))
 
+BROWSE_PAGE_SIZE = 24 # fills whole rows of the 2 and 3 column layouts
+MAX_PAGE_SIZE = 120
+
+# filter for current recipes that can be made on the core list
+DEFAULT_BROWSE_FILTER = FilterOptions(search="",all_=False,include="",exclude="",include_use_or=False,exclude_use_or=False,style="",glass="",prep="",ice="",tag="core")
+
+def select_recipes(filter_options, sorting=None):
+    """ First stages of the recipe pipeline: filter, then sort,
+    the current bar's recipes without converting or rendering any of them
+    """
+    library = mms.library(current_bar)
+    recipes, excluded = filter_recipes(library.recipes, filter_options,
+            union_results=bool(filter_options.search), search_index=mms.search_index())
+    if sorting and sorting != 'None': # TODO this is weird
+        recipes = library.sort(recipes, sorting.rstrip('X'), reverse='X' in sorting)
+    return recipes, excluded
+
+def label_facets(form, recipes):
+    """ Add the number of matching recipes to each option of the form's selects
+    e.g. "shake (12)", counted over the current filter results
+    """
+    facets = ('style', 'glass', 'prep', 'ice')
+    counts = RecipeLibrary.facet_counts(recipes,
+            choices={facet: [value for value, _ in getattr(form, facet).choices] for facet in facets})
+    for facet in facets:
+        field = getattr(form, facet)
+        field.choices = [(value, "{} ({})".format(label, counts[facet][value.lower()]) if value else label)
+                for value, label in field.choices]
+    return counts
+
+def render_recipes(recipes, display_options, to_html=False, order_link=False, convert_to=None, **kwargs_for_html):
+    """ Last stages of the recipe pipeline: unit conversion and html
+    Only give this the recipes that will actually be displayed
+    """
+    if convert_to:
+        [r.convert(convert_to) for r in recipes]
+    if to_html:
+        if order_link:
+            recipes = [recipe_as_html(recipe, display_options,
+                order_link=order_url(recipe.name),
+                **kwargs_for_html) for recipe in recipes]
+        else:
+            recipes = [recipe_as_html(recipe, display_options, **kwargs_for_html) for recipe in recipes]
+    return recipes
+
 def recipes_from_options(form, display_opts=None, filter_opts=None, to_html=False, order_link=False, convert_to=None, **kwargs_for_html):
     """ Apply display formmatting, filtering, sorting to
     the currently loaded recipes.
@@ -66,42 +128,90 @@ def recipes_from_options(form, display_opts=None, filter_opts=None, to_html=Fals
     """
     display_options = bundle_options(DisplayOptions, form) if not display_opts else display_opts
     filter_options = bundle_options(FilterOptions, form) if not filter_opts else filter_opts
-    recipes, excluded = filter_recipes(mms.processed_recipes(current_bar), filter_options, union_results=bool(filter_options.search))
-    if form.sorting.data and form.sorting.data != 'None': # TODO this is weird
-        reverse = 'X' in form.sorting.data
-        attr = 'avg_{}'.format(form.sorting.data.rstrip('X'))
-        recipes = sorted(recipes, key=lambda r: getattr(r.stats, attr), reverse=reverse)
-    if convert_to:
-        [r.convert(convert_to) for r in recipes]
+    recipes, excluded = select_recipes(filter_options, form.sorting.data)
     if display_options.stats and recipes:
         stats = report_stats(recipes, as_html=True)
     else:
         stats = None
-    # TODO this can certainly be cached
-    if to_html:
-        if order_link:
-            recipes = [recipe_as_html(recipe, display_options,
-                order_link="/order/{}".format(urllib.parse.quote_plus(recipe.name)),
-                **kwargs_for_html) for recipe in recipes]
-        else:
-            recipes = [recipe_as_html(recipe, display_options, **kwargs_for_html) for recipe in recipes]
+    recipes = render_recipes(recipes, display_options, to_html=to_html, order_link=order_link,
+            convert_to=convert_to, **kwargs_for_html)
     return recipes, excluded, stats
 
-def get_tmp_file():
-    """ Get a temporary file that will be removed by a callback after
-    the current request
-    :returns: file name as a string
-    """
-    _, tmp_filename = tempfile.mkstemp()
+def browse_display_options():
+    return DisplayOptions(
+                        prices=current_bar.prices,
+                        stats=False,
+                        examples=current_bar.examples,
+                        all_ingredients=False,
+                        markup=current_bar.markup,
+                        prep_line=current_bar.prep_line,
+                        origin=current_bar.origin,
+                        info=current_bar.info,
+                        variants=current_bar.variants)
 
-    @after_this_request
-    def rm_tempfile(response):
-        try:
-            os.remove(tmp_filename)
-        except OSError as e:
-            log.warning("OSError: Failed to rm tmp file {}: {}".format(tmp_filename, e))
-        return response
-    return tmp_filename
+def render_browse_page(recipes):
+    return render_recipes(recipes, browse_display_options(), to_html=True, order_link=True,
+            convert_to=current_bar.convert, condense_ingredients=current_bar.summarize)
+
+def encode_cursor(**state):
+    """ Opaque pagination cursor, carries everything needed for the next page """
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+
+def browse_cursor(filter_options, sorting, offset):
+    return encode_cursor(bar=current_bar.id, offset=offset, sorting=sorting, filter=filter_options._asdict())
+
+ORDERS_PAGE_SIZE = 25
+CURSOR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# the orders listed in each kind of order table, by user id or bar id
+ORDER_SCOPES = {
+        'history': lambda user_id: Order.query.filter(Order.user_id == user_id),
+        'served': lambda user_id: Order.query.filter(Order.bartender_id == user_id, Order.confirmed != None),
+        'bar': lambda bar_id: Order.query.filter(Order.bar_id == bar_id),
+        }
+
+def orders_page(scope, key, after=None, limit=ORDERS_PAGE_SIZE):
+    """ One page of orders, newest first, with keyset pagination on
+    (timestamp, id) so later pages cost the same as the first
+    Orders without a timestamp come last, paged by id alone
+    :param string scope: one of ORDER_SCOPES
+    :param int key: the user or bar id for the scope
+    :param tuple after: (timestamp or None, id) of the last order already shown
+    :returns: (orders, cursor for the next page or None)
+    """
+    query = ORDER_SCOPES[scope](key)
+    if after:
+        timestamp, order_id = after
+        if timestamp is None:
+            query = query.filter(Order.timestamp == None, Order.id < order_id)
+        else:
+            query = query.filter(or_(Order.timestamp < timestamp, Order.timestamp == None,
+                and_(Order.timestamp == timestamp, Order.id < order_id)))
+    # "IS NULL" sorts the same everywhere, unlike NULLS LAST which MySQL lacks
+    orders = query.order_by(Order.timestamp == None, Order.timestamp.desc(), Order.id.desc()).limit(limit+1).all()
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        next_cursor = encode_cursor(scope=scope, key=key, id=last.id,
+                timestamp=last.timestamp.strftime(CURSOR_TIME_FORMAT) if last.timestamp else None)
+    return orders, next_cursor
+
+def order_table_context():
+    """ Extra template variables used by _order_rows.html """
+    return dict(bar_names={bar.id: bar.name for bar in g.bar_list},
+            human_timestamp=mms.time_human_formatter, human_timediff=mms.time_diff_formatter,
+            timestamp=mms.timestamp_formatter)
+
+def order_url(recipe_name):
+    """Canonical url of a recipe's order page, using its slug"""
+    return "/order/{}".format(urllib.parse.quote(mms.recipe_slug(recipe_name)))
 
 ################################################################################
 # Customer routes
@@ -111,31 +221,20 @@ def get_tmp_file():
 @app.route("/", methods=['GET', 'POST'])
 def browse():
     form = get_form(DrinksForm)
-    filter_options = None
-
     if request.method == 'GET':
-        # filter for current recipes that can be made on the core list
-        filter_options = FilterOptions(search="",all_=False,include="",exclude="",include_use_or=False,exclude_use_or=False,style="",glass="",prep="",ice="",tag="core")
-
-    display_opts = DisplayOptions(
-                        prices=current_bar.prices,
-                        stats=False,
-                        examples=current_bar.examples,
-                        all_ingredients=False,
-                        markup=current_bar.markup,
-                        prep_line=current_bar.prep_line,
-                        origin=current_bar.origin,
-                        info=current_bar.info,
-                        variants=current_bar.variants)
-    recipes, _, _ = recipes_from_options(form, display_opts=display_opts, filter_opts=filter_options,
-                            to_html=True, order_link=True, convert_to=current_bar.convert, condense_ingredients=current_bar.summarize)
+        filter_options = DEFAULT_BROWSE_FILTER
+    else:
+        filter_options = bundle_options(FilterOptions, form)
+    recipes, _ = select_recipes(filter_options, form.sorting.data)
+    n_results = len(recipes)
+    label_facets(form, recipes)
 
+    surprise = False
     if request.method == 'POST':
         if form.validate():
-            n_results = len(recipes)
             if n_results > 0:
                 if 'surprise-menu' in request.form:
-                    recipes = [random.choice(recipes)]
+                    surprise = True
                     flash("Bartender's choice! Just try again if you want something else!")
                 else:
                     flash("Filters applied. Showing {} available recipes".format(n_results), 'success')
@@ -144,7 +243,17 @@ def browse():
         else:
             flash("Error in form validation", 'danger')
 
-    return render_template('browse.html', form=form, recipes=recipes)
+    # only the recipes on the first page get converted and rendered,
+    # the rest are fetched by the page from /api/recipes as it scrolls
+    next_cursor = None
+    if surprise:
+        recipes = [random.choice(recipes)]
+    elif n_results > BROWSE_PAGE_SIZE:
+        recipes = recipes[:BROWSE_PAGE_SIZE]
+        next_cursor = browse_cursor(filter_options, form.sorting.data, BROWSE_PAGE_SIZE)
+    recipes = render_browse_page(recipes)
+
+    return render_template('browse.html', form=form, recipes=recipes, next_cursor=next_cursor)
 
 @app.route("/order/<recipe_name>", methods=['GET', 'POST'])
 def order(recipe_name):
@@ -158,11 +267,14 @@ def order(recipe_name):
     heading = "Order:"
 
     recipe = mms.find_recipe(current_bar, recipe_name)
-    recipe.convert('oz')
     if not recipe:
         flash('Error: unknown recipe "{}"'.format(recipe_name), 'danger')
         return render_template('result.html', heading=heading)
+    if request.method == 'GET' and recipe_name != mms.recipe_slug(recipe.name):
+        # old style links by name, or different case
+        return redirect(order_url(recipe.name), code=301)
     else:
+        recipe.convert('oz')
         recipe_html = recipe_as_html(recipe, DisplayOptions(
                             prices=current_bar.prices,
                             stats=False,
@@ -174,9 +286,12 @@ def order(recipe_name):
                             info=True,
                             variants=True), convert_to=current_bar.convert)
 
+    similar = [{'name': r.name, 'url': order_url(r.name)}
+            for r, _ in mms.similar_recipes(current_bar, recipe.name)]
+
     if not recipe.can_make:
         flash('Ingredients to make this are out of stock :(', 'warning')
-        return render_template('order.html', form=form, recipe=recipe_html, show_form=False)
+        return render_template('order.html', form=form, recipe=recipe_html, show_form=False, similar=similar)
 
     if request.method == 'GET':
         show_form = True
@@ -218,17 +333,21 @@ def order(recipe_name):
                 if current_user.is_authenticated:
                     order.user_id = current_user.id
                 db.session.add(order)
-                db.session.commit()
+                record_order(order)
+                db.session.flush() # for the order id, the order and its mail are committed together
 
                 subject = "{} for {} at {}".format(recipe.name, user_name, current_bar.name)
                 confirmation_link = "https://{}{}".format(request.host,
                         url_for('confirm_order',
                             order_id=order.id))
-                send_mail(subject, current_bar.bartender.email, "order_submitted",
+                enqueue_mail(subject, current_bar.bartender.email, "order_submitted",
                         confirmation_link=confirmation_link,
                         name=user_name,
                         notes=form.notes.data,
                         recipe_html=email_recipe_html)
+                db.session.commit()
+                # only once it's committed, so the queue never shows an order that was rolled back
+                order_events.publish(current_bar.id, 'order', order.id, render_queue_order(order))
 
                 flash("Your order has been submitted, and you'll receive a confirmation email once the bartender acknowledges it", 'success')
                 if not current_user.is_authenticated:
@@ -244,19 +363,18 @@ def order(recipe_name):
 
     # either provide the recipe and the form,
     # or after the post show the result
-    return render_template('order.html', form=form, recipe=recipe_html, heading=heading, show_form=show_form)
+    return render_template('order.html', form=form, recipe=recipe_html, heading=heading, show_form=show_form, similar=similar)
 
-@app.route('/confirm_order')
-def confirm_order():
-    # TODO this needs a security token
-    order_id = request.args.get('order_id')
-    order = Order.query.filter_by(id=order_id).one_or_none()
-    if not order:
-        flash("Error: Invalid order_id", 'danger')
-        return render_template("result.html", heading="Invalid confirmation link")
-    if order.confirmed:
-        flash("Error: Order has already been confirmed", 'danger')
-        return render_template("result.html", heading="Invalid confirmation link")
+def confirm(order):
+    """Mark the order confirmed, and email the customer
+    :returns: (user who ordered or None, error message or None)
+    """
+    user = User.query.filter_by(email=order.user_email).one_or_none()
+    if user and order.user_id and order.user_id != user.id:
+        return user, "Order was created with different id than confirming user!"
+    bar = Bar.query.filter_by(id=order.bar_id).one_or_none()
+    if bar is None:
+        return user, "Invalid bar id with order"
 
     bartender = user_datastore.find_user(id=order.bartender_id)
     if bartender and bartender.venmo_id:
@@ -265,37 +383,58 @@ def confirm_order():
         venmo_link = None
 
     order.confirmed = datetime.datetime.utcnow()
-
-    # update users db
-    user = User.query.filter_by(email=order.user_email).one_or_none()
+    record_confirm(order)
     if user:
         greeting = "{}, you".format(user.get_name(short=True))
-        if order.user_id and order.user_id != user.id:
-            flash("Order was created with different id than confirming user!", 'danger')
-            return render_template('result.html', heading="Invalid request")
         user.orders.append(order)
-        user_datastore.put(user)
-        user_datastore.commit()
     else:
         greeting = "You"
-
-    bar = Bar.query.filter_by(id=order.bar_id).one_or_none()
-    if bar is None:
-        flash("Invalid bar id with order", 'danger')
-        return render_template('result.html', heading="Invalid request")
-    subject = "[Mix-Mind] Your {} Confirmation".format(current_bar.name)
-    sent = send_mail(subject, order.user_email, "order_confirmation",
+    subject = "[Mix-Mind] Your {} Confirmation".format(bar.name)
+    enqueue_mail(subject, order.user_email, "order_confirmation",
             greeting=greeting,
             recipe_name=order.recipe_name,
             recipe_html=order.recipe_html,
             venmo_link=venmo_link)
-    if sent:
-        flash('Confirmation sent')
-    else:
-        flash('Confimration email failed', 'danger')
+    db.session.commit()
+    order_events.publish(order.bar_id, 'confirmed', order.id)
+    return user, None
+
+@app.route('/confirm_order')
+def confirm_order():
+    # TODO this needs a security token
+    order_id = request.args.get('order_id')
+    order = Order.query.filter_by(id=order_id).one_or_none()
+    if not order:
+        flash("Error: Invalid order_id", 'danger')
+        return render_template("result.html", heading="Invalid confirmation link")
+    if order.confirmed:
+        flash("Error: Order has already been confirmed", 'danger')
+        return render_template("result.html", heading="Invalid confirmation link")
+
+    user, error = confirm(order)
+    if error:
+        flash(error, 'danger')
+        return render_template('result.html', heading="Invalid request")
+    flash('Confirmation sent')
     return render_template('result.html', heading="{} for {}".format(order.recipe_name, user.get_name(short=True) if user else order.user_email),
             body=order.recipe_html)
 
+def tends_bar():
+    """ The current user is working the current bar, as bartender, owner, or admin """
+    return current_bar.is_bartender(current_user) or current_bar.is_owner(current_user) or current_user.has_role('admin')
+
+@app.route('/bartender/queue', methods=['GET'])
+@login_required
+def order_queue():
+    """Live list of the orders waiting at the current bar, for the bartender"""
+    if not tends_bar():
+        flash("Only the bartender on duty can see the order queue", 'danger')
+        return render_template('result.html', heading="Not Authorized")
+    orders = pending_orders(current_bar.id)
+    return render_template('order_queue.html', orders=orders)
+
+def render_queue_order(order):
+    return render_template('_queue_order.html', order=order, timestamp=mms.time_human_formatter)
 
 @app.route('/user', methods=['GET', 'POST'])
 @login_required
@@ -330,13 +469,12 @@ def user_profile():
             this_user.nickname = form.nickname.data
             this_user.venmo_id = form.venmo_id.data
             user_datastore.commit()
+            invalidate_bar_config() # bars show their owner's and bartender's names
             flash("Profile updated", 'success')
             return redirect(request.url)
         else:
             flash("Error in form validation", 'danger')
-            return render_template('user_profile.html', this_user=this_user, edit_user=form,
-                    human_timestamp=mms.time_human_formatter, human_timediff=mms.time_diff_formatter,
-                    timestamp=mms.timestamp_formatter)
+            return render_user_profile(this_user, form)
 
 
 
@@ -345,22 +483,27 @@ def user_profile():
     for attr in 'first_name,last_name,nickname,venmo_id'.split(','):
         setattr(getattr(form, attr), 'data', getattr(this_user, attr))
 
-    return render_template('user_profile.html', this_user=this_user, edit_user=form,
-                human_timestamp=mms.time_human_formatter, human_timediff=mms.time_diff_formatter,
-                timestamp=mms.timestamp_formatter)
+    return render_user_profile(this_user, form)
+
 
+def render_user_profile(this_user, form):
+    history, history_cursor = orders_page('history', this_user.id)
+    served, served_cursor = orders_page('served', this_user.id)
+    return render_template('user_profile.html', this_user=this_user, edit_user=form,
+            history=history, history_cursor=history_cursor,
+            served=served, served_cursor=served_cursor,
+            **order_table_context())
 
 @app.route("/user_post_login", methods=['GET'])
 @login_required
 def post_login_redirect():
     # assign any orders with this user's email to the actual user ID
     # these could be from before they registered or ordered while logged out
-    orders = Order.query.filter_by(user_email=current_user.email).all()
-    for order in orders:
-        if not order.user_id:
-            order.user_id = current_user.id
-            log.info("Attributing order {} to user {}".format(order.id, current_user.id))
+    attributed = Order.query.filter(Order.user_email == current_user.email, Order.user_id == None) \
+            .update({Order.user_id: current_user.id}, synchronize_session=False)
     db.session.commit()
+    if attributed:
+        log.info("Attributing {} orders to user {}".format(attributed, current_user.id))
     return redirect(url_for('browse'))
 
 
@@ -381,7 +524,7 @@ def check_ownership(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.has_role('admin') and current_user != current_bar.owner:
+        if not current_user.has_role('admin') and not current_bar.is_owner(current_user):
             flash("You do not have permission to view this resource. This could have been an attempt to switch to a different bar when editing a bar of which you had control.", 'danger')
             return render_template('result.html', heading="Not Authorized")
         return f(*args, **kwargs)
@@ -406,7 +549,7 @@ def bar_settings():
             # unassign previous bartender
             if bar.bartender_on_duty:
                 old_bartender = user_datastore.find_user(id=bar.bartender_on_duty)
-                send_mail("[Mix-Mind] Bartender Duty Unassigned", old_bartender.email, 'simple',
+                enqueue_mail("[Mix-Mind] Bartender Duty Unassigned", old_bartender.email, 'simple',
                         heading="No longer bartending at {}".format(bar.name),
                         message="You have been unassigned as the bartender-on-duty at {}.".format(bar.name))
             # add bartender on duty
@@ -416,7 +559,7 @@ def bar_settings():
                 user_datastore.add_role_to_user(user, bartender)
                 bar.bartenders.append(user)
                 bar.bartender_on_duty = user.id
-                send_mail("[Mix-Mind] Bartender Duty Assigned", user.email, 'simple',
+                enqueue_mail("[Mix-Mind] Bartender Duty Assigned", user.email, 'simple',
                         heading="Bartending at {}".format(bar.name),
                         message="You have been assigned as the bartender-on-duty at {}.".format(bar.name))
             else:
@@ -427,6 +570,7 @@ def bar_settings():
             for attr in BAR_BULK_ATTRS:
                 setattr(bar, attr, getattr(edit_bar_form, attr).data)
             db.session.commit()
+            invalidate_bar_config()
             flash("Successfully updated config for {}".format(bar.cname))
             return redirect(request.url)
         else:
@@ -439,9 +583,9 @@ def bar_settings():
         setattr(getattr(edit_bar_form, attr), 'data', getattr(current_bar, attr))
     if edit_bar_form is None:
         return redirect(request.url)
-    orders = Order.query.filter_by(bar_id=current_bar.id)
-    order_table = orders_as_table(orders)
-    return render_template('bar_settings.html', edit_bar_form=edit_bar_form, order_table=order_table)
+    orders, orders_cursor = orders_page('bar', current_bar.id)
+    return render_template('bar_settings.html', edit_bar_form=edit_bar_form,
+            orders=orders, orders_cursor=orders_cursor, **order_table_context())
 
 @app.route("/manage/ingredients", methods=['GET','POST'])
 @login_required
@@ -451,6 +595,7 @@ def ingredient_stock():
     form = get_form(BarstockForm)
     upload_form = get_form(UploadBarstockForm)
     form_open = False
+    import_plan = import_errors = import_token = None
     log.debug("Form errors: {}".format(form.errors))
 
     if request.method == 'POST':
@@ -476,24 +621,59 @@ def ingredient_stock():
                 flash("Error in form validation", 'danger')
 
         elif 'upload-csv' in request.form:
-            # TODO handle files < 500 kb by keeping in mem
+            # parsed straight from the upload and previewed before anything is written
             csv_file = request.files['upload_csv']
             if not csv_file or csv_file.filename == '':
                 flash('No selected file', 'danger')
                 return redirect(request.url)
 
-            tmp_filename = get_tmp_file()
-            csv_file.save(tmp_filename)
-            Barstock_SQL(current_bar.id).load_from_csv([tmp_filename], current_bar.id,
-                    replace_existing=upload_form.replace_existing.data)
-            mms.generate_recipes(current_bar)
-            msg = "Ingredients database {} {} for {}".format(
-                    "replaced by" if upload_form.replace_existing.data else "added to from",
-                    csv_file.filename, current_bar.cname)
-            log.info(msg)
-            flash(msg, 'success')
+            replace_existing = upload_form.replace_existing.data
+            rows, import_errors, n_errors = parse_csv(csv_file.stream)
+            if not rows:
+                flash("No valid ingredients found in {}".format(csv_file.filename), 'danger')
+            else:
+                import_plan = plan_import(current_bar.id, rows, replace_existing, mms.processed_recipes(current_bar))
+                import_plan['filename'] = csv_file.filename
+                import_plan['replace_existing'] = replace_existing
+                import_plan['n_errors'] = n_errors
+                import_token = save_pending(current_bar.id, rows, replace_existing, csv_file.filename,
+                        stock_version(current_bar.id))
+            for error in import_errors:
+                log.info("{} upload: {}".format(current_bar.cname, error))
+
+        elif 'confirm-import' in request.form:
+            token = request.form.get('import_token', '')
+            pending = load_pending(token)
+            if pending is None or pending['bar_id'] != current_bar.id:
+                flash("That upload has expired, please upload the file again", 'danger')
+            elif pending['stock_version'] != stock_version(current_bar.id):
+                discard_pending(token)
+                flash("The ingredients changed since the preview, please upload the file again", 'warning')
+            elif active_job(current_bar.id, kind='import'):
+                flash("Another upload is still being imported, please wait for it to finish", 'warning')
+            else:
+                # applied in the background, the page follows the job's progress
+                # the job refers to the saved upload and discards it once the rows are in
+                job = job_runner.submit('import', current_bar.id, user_id=current_user.id, payload={
+                    'token': token, 'n_rows': len(pending['rows']), 'replace_existing': pending['replace_existing'],
+                    'filename': pending['filename'], 'stock_version': pending['stock_version']})
+                msg = "Ingredients database {} {} for {}".format(
+                        "being replaced by" if pending['replace_existing'] else "being added to from",
+                        pending['filename'], current_bar.cname)
+                log.info("{} (job {})".format(msg, job.id))
+                flash(msg, 'info')
+            return redirect(request.url)
+
+        elif 'cancel-import' in request.form:
+            discard_pending(request.form.get('import_token', ''))
+            flash("Upload discarded", 'info')
+            return redirect(request.url)
 
-    return render_template('ingredients.html', form=form, upload_form=upload_form, form_open=form_open)
+    # big inventories are paged and searched on the server instead of all sent at once
+    server_side = Ingredient.query.filter_by(bar_id=current_bar.id).count() > app.config.get('MIXMIND_INGREDIENTS_CLIENT_SIDE_MAX', 500)
+    return render_template('ingredients.html', form=form, upload_form=upload_form, form_open=form_open,
+            server_side=server_side, import_plan=import_plan, import_errors=import_errors, import_token=import_token,
+            job=active_job(current_bar.id))
 
 
 ################################################################################
@@ -520,7 +700,7 @@ def set_bar_owner():
         if user and user != bar.owner:
             user_datastore.add_role_to_user(user, owner)
             bar.owner = user
-            send_mail("[Mix-Mind] Bar Ownership Granted", user.email, 'simple',
+            enqueue_mail("[Mix-Mind] Bar Ownership Granted", user.email, 'simple',
                     heading="{}, you now own {}".format(user.get_name(), bar.name),
                     message="You have been assigned as the owner of {}</p><p>The bar can now be managed from the site. Switch to your bar, and then navigate to the management settings.".format(bar.name))
             flash("{} is now the proud owner of {}".format(user.get_name(), bar.cname))
@@ -532,10 +712,11 @@ def set_bar_owner():
             if not old_owner.owns:
                 user_datastore.remove_role_from_user(old_owner, owner)
         if old_owner:
-            send_mail("[Mix-Mind] Bar Ownership Revoked", old_owner.email, 'simple',
+            enqueue_mail("[Mix-Mind] Bar Ownership Revoked", old_owner.email, 'simple',
                     heading="{}, you no longer own {}".format(old_owner.get_name(), bar.name),
                     message="You have been unassigned as the owner of {}.".format(bar.name))
         user_datastore.commit()
+        invalidate_bar_config()
     else:
         flash("Error in form validation", 'warning')
 
@@ -563,6 +744,7 @@ def admin_dashboard():
                 new_bar = Bar(**bar_args)
                 db.session.add(new_bar)
                 db.session.commit()
+                invalidate_bar_config()
                 flash("Created a new bar", 'success')
             else:
                 flash("Error in form validation", 'warning')
@@ -580,25 +762,103 @@ def admin_dashboard():
             for bar in bars:
                 bar.is_default = (bar.id == bar_id)
             db.session.commit()
+            invalidate_bar_config()
             flash("Bar ID: {} is now the default".format(bar_id), 'success')
             return redirect(request.url)
 
     set_owner_form.owner.data = '' if not current_bar.owner else current_bar.owner.email
-    bars = Bar.query.all()
-    users = User.query.all()
-    orders = Order.query.all()
-    #bar_table = bars_as_table(bars)
-    user_table = users_as_table(users)
-    order_table = orders_as_table(orders)
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=ANALYTICS_DAYS)
     return render_template('dashboard.html', new_bar_form=new_bar_form,
-            set_owner_form=set_owner_form, users=users, orders=orders,
-            bars=bars, user_table=user_table, order_table=order_table)
+            set_owner_form=set_owner_form, bars=bar_summaries(),
+            popular=recipe_stats(None, since), analytics_days=ANALYTICS_DAYS)
+
+ANALYTICS_DAYS = 30 # default range of the order reports
+
+def bar_summaries():
+    """ Every bar with its order count and bartender, in two queries """
+    bartender = aliased(User)
+    bars = db.session.query(Bar, bartender).outerjoin(bartender, bartender.id == Bar.bartender_on_duty) \
+            .order_by(Bar.id).all()
+    counts = dict(db.session.query(Order.bar_id, func.count(Order.id)).group_by(Order.bar_id).all())
+    return [{'bar': bar, 'orders': counts.get(bar.id, 0),
+        'bartender': user.get_name_with_email() if user else None} for bar, user in bars]
+
+def role_names(user_ids):
+    """ Comma separated role names for each user id """
+    names = defaultdict(list)
+    for user_id, name in db.session.query(RolesUsers.user_id, Role.name) \
+            .join(Role, Role.id == RolesUsers.role_id) \
+            .filter(RolesUsers.user_id.in_(user_ids)).order_by(RolesUsers.user_id, Role.name):
+        names[user_id].append(name)
+    return {user_id: ', '.join(roles) for user_id, roles in names.items()}
+
+def order_counts(column, keys):
+    """ Number of orders per value of the column, only for the given keys """
+    return dict(db.session.query(column, func.count(Order.id))
+            .filter(column.in_(keys)).group_by(column).all())
+
+def format_datetime(value):
+    return str(value) if value else ''
+
+@app.route("/api/admin/users", methods=['GET'])
+@login_required
+@roles_required('admin')
+def api_admin_users():
+    """DataTables server side source for the dashboard users table,
+    role names and order counts are only looked up for the page shown"""
+    table = DataTablesRequest(request.args,
+            [User.id, User.email, User.first_name, User.last_name, User.nickname,
+                User.login_count, User.last_login_at, User.confirmed_at, None, None],
+            searchable=[User.email, User.first_name, User.last_name, User.nickname])
+    users, total, filtered = table.page(User.query, tiebreak=User.id)
+    ids = [user.id for user in users]
+    roles = role_names(ids) if ids else {}
+    counts = order_counts(Order.user_id, ids) if ids else {}
+    data = [{'id': user.id, 'email': user.email, 'first_name': user.first_name,
+        'last_name': user.last_name, 'nickname': user.nickname, 'login_count': user.login_count,
+        'last_login_at': format_datetime(user.last_login_at), 'confirmed_at': format_datetime(user.confirmed_at),
+        'roles': roles.get(user.id, ''), 'orders': counts.get(user.id, 0)} for user in users]
+    return table.response(data, total, filtered)
+
+@app.route("/api/admin/orders", methods=['GET'])
+@login_required
+@roles_required('admin')
+def api_admin_orders():
+    """DataTables server side source for the dashboard orders table"""
+    table = DataTablesRequest(request.args,
+            [Order.id, Order.timestamp, Order.confirmed, Order.user_id, Order.bar_id, Order.recipe_name],
+            searchable=[Order.recipe_name, Order.user_email])
+    orders, total, filtered = table.page(Order.query, tiebreak=Order.id.desc())
+    data = [{'id': order.id, 'timestamp': format_datetime(order.timestamp),
+        'confirmed': 'yes' if order.confirmed else 'no', 'user_id': order.user_id,
+        'bar_id': order.bar_id, 'recipe_name': order.recipe_name} for order in orders]
+    return table.response(data, total, filtered)
+
+@app.route("/api/admin/outbox", methods=['GET'])
+@login_required
+@roles_required('admin')
+def api_admin_outbox():
+    """Mail outbox health, counts by status and the most recent dead letters"""
+    counts = dict(db.session.query(OutboxMail.status, func.count(OutboxMail.id)).group_by(OutboxMail.status))
+    dead = OutboxMail.query.filter_by(status='dead').order_by(OutboxMail.id.desc()).limit(50)
+    data = [{'id': item.id, 'subject': item.subject, 'recipient': item.recipient, 'template': item.template,
+        'attempts': item.attempts, 'last_error': item.last_error, 'created': format_datetime(item.created)}
+        for item in dead]
+    return api_success(data, counts=counts)
+
+@app.route("/api/admin/outbox/<int:mail_id>/retry", methods=['POST'])
+@login_required
+@roles_required('admin')
+def api_admin_outbox_retry(mail_id):
+    """Queue a dead letter to be sent again"""
+    if not outbox.retry(mail_id):
+        return api_error("No dead letter {}".format(mail_id))
+    return api_success(None, message="Mail {} queued again".format(mail_id))
 
 @app.route("/admin/menu_generator", methods=['GET', 'POST'])
 @login_required
 @roles_required('admin')
 def menu_generator():
-    return render_template('result.html', heading="Still under construction...")
     form = get_form(DrinksForm)
     log.debug("Form errors: {}".format(form.errors))
     recipes = []
@@ -616,28 +876,71 @@ def menu_generator():
     return render_template('menu_generator.html', form=form, recipes=recipes, excluded=excluded, stats=stats)
 
 
+def menu_download_name(pdf_filename, output):
+    name = secure_filename(pdf_filename or '') or 'drinks'
+    return name + os.path.splitext(output)[1]
+
+def send_menu(output, download_name):
+    mimetype = 'application/pdf' if output.endswith('.pdf') else 'application/x-tex'
+    return send_file(os.path.abspath(output), mimetype, as_attachment=True, attachment_filename=download_name)
+
 @app.route("/admin/menu_generator/download/", methods=['POST'])
 @login_required
 @roles_required('admin')
 def menu_download():
+    """ Send the menu for the form's options, generating it in the background
+    unless it was already generated for the same recipes, stock, and options
+    """
     form = get_form(DrinksForm)
-    raise NotImplementedError
-
-    if form.validate():
-        log.info(request)
-        recipes, _, _ = recipes_from_options(form)
-
-        display_options = bundle_options(DisplayOptions, form)
-        form.pdf_filename.data = 'menus/{}'.format(filename_from_options(bundle_options(PdfOptions, form), display_options))
-        pdf_options = bundle_options(PdfOptions, form)
-        pdf_file = '{}.pdf'.format(pdf_options.pdf_filename)
-
-        generate_recipes_pdf(recipes, pdf_options, display_options, mms.barstock.df)
-        return send_file(os.path.abspath(pdf_file), 'application/pdf', as_attachment=True, attachment_filename=pdf_file.lstrip('menus/'))
-
-    else:
+    if not form.validate():
         flash("Error in form validation", 'danger')
-        return render_template('application_main.html', form=form, recipes=[], excluded=None)
+        return render_template('menu_generator.html', form=form, recipes=[], excluded=None)
+
+    log.info(request)
+    recipes, _ = select_recipes(bundle_options(FilterOptions, form), form.sorting.data)
+    display_options = bundle_options(DisplayOptions, form)
+    pdf_options = bundle_options(PdfOptions, form)
+    tex_only = form.tex_only.data or app.config.get('MIXMIND_MENU_TEX_ONLY', False)
+    version = stock_version(current_bar.id)
+    names = [recipe.name for recipe in recipes]
+    key = menu_key(current_bar.id, names, version, pdf_options, display_options, tex_only)
+
+    # cached under a name from the options, the user's filename is only the download name
+    filename = filename_from_options(pdf_options, display_options, base_name=current_bar.cname, digest=key)
+    pdf_options = pdf_options._replace(pdf_filename=os.path.join(menu_dir(app), secure_filename(filename)))
+    output = "{}.{}".format(pdf_options.pdf_filename, 'tex' if tex_only else 'pdf')
+    download_name = menu_download_name(form.pdf_filename.data, output)
+    if os.path.isfile(output):
+        return send_menu(output, download_name)
+
+    for job in Job.query.filter(Job.bar_id == current_bar.id, Job.kind == 'menu', Job.status.in_(('queued', 'running'))):
+        if json.loads(job.payload).get('key') == key:
+            break
+    else:
+        job = job_runner.submit('menu', current_bar.id, user_id=current_user.id, payload={'key': key,
+            'recipes': names, 'stock_version': version, 'tex_only': tex_only, 'download_name': download_name,
+            'pdf_options': pdf_options._asdict(), 'display_options': display_options._asdict()})
+    return redirect(url_for('menu_job', job_id=job.id))
+
+@app.route("/admin/menu_generator/download/<int:job_id>", methods=['GET'])
+@login_required
+@roles_required('admin')
+def menu_job(job_id):
+    """ Wait for a menu job, then send what it generated """
+    job = Job.query.filter_by(id=job_id, bar_id=current_bar.id, kind='menu').one_or_none()
+    if job is None:
+        flash("No menu is being generated with that id", 'danger')
+        return redirect(url_for('menu_generator'))
+    if job.status == 'done':
+        result = json.loads(job.result)
+        if os.path.isfile(result['output']):
+            return send_menu(result['output'], result['download_name'])
+        flash("The generated menu was removed, please generate it again", 'warning')
+        return redirect(url_for('menu_generator'))
+    if job.status == 'failed':
+        flash("Menu generation failed: {}".format(job.message), 'danger')
+        return redirect(url_for('menu_generator'))
+    return render_template('menu_job.html', job=job, recipes=len(json.loads(job.payload)['recipes']))
 
 
 @app.route("/admin/recipes", methods=['GET','POST'])
@@ -675,14 +978,148 @@ def api_error(message, **kwargs):
 def api_success(data, message="", **kwargs):
     return jsonify(status="success", message=message, data=data, **kwargs)
 
+@app.route("/api/recipes", methods=['GET'])
+def api_recipes():
+    """Page through the browse results, rendered for the current bar
+
+    :param string cursor: from a previous response, carries the filters and position
+    :param int limit: max number of recipes to return
+    The response has the total and the facet counts (recipes per style, glass,
+    prep, ice, and tag) of all the results, not just this page.
+    Without a cursor, the filters are read from the same fields as the browse
+    form, or the default browse filter if none are given
+    """
+    limit = max(1, min(request.args.get('limit', BROWSE_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    if cursor:
+        state = decode_cursor(cursor)
+        try:
+            if state['bar'] != current_bar.id:
+                return api_error("Cursor is for a different bar, start over")
+            filter_options = FilterOptions(**state['filter'])
+            sorting = state['sorting']
+            offset = int(state['offset'])
+        except (KeyError, TypeError, ValueError):
+            return api_error("Invalid cursor")
+    else:
+        form = DrinksForm(request.args)
+        given = [field for field in FilterOptions._fields if field in request.args]
+        filter_options = DEFAULT_BROWSE_FILTER
+        if given:
+            values = {field: getattr(form, field).data for field in given}
+            values.setdefault('tag', "")
+            filter_options = filter_options._replace(**values)
+        sorting = request.args.get('sorting')
+        offset = 0
+
+    recipes, _ = select_recipes(filter_options, sorting)
+    total = len(recipes)
+    facets = RecipeLibrary.facet_counts(recipes)
+    recipes = recipes[offset:offset+limit]
+    names = [recipe.name for recipe in recipes]
+    data = [{'name': name, 'url': order_url(name), 'html': html}
+            for name, html in zip(names, render_browse_page(recipes))]
+    next_cursor = browse_cursor(filter_options, sorting, offset+limit) if offset+limit < total else None
+    return api_success(data, total=total, facets=facets, next_cursor=next_cursor)
+
+@app.route("/api/orders", methods=['GET'])
+@login_required
+def api_orders():
+    """Next page of an order table, as rendered table rows
+    :param string cursor: from the page or a previous response
+    """
+    state = decode_cursor(request.args.get('cursor', ''))
+    try:
+        scope, key = state['scope'], int(state['key'])
+        timestamp = state['timestamp'] and datetime.datetime.strptime(state['timestamp'], CURSOR_TIME_FORMAT)
+        after = (timestamp or None, int(state['id']))
+        if scope not in ORDER_SCOPES:
+            raise ValueError(scope)
+    except (KeyError, TypeError, ValueError):
+        return api_error("Invalid cursor")
+    if not current_user.has_role('admin'):
+        if scope == 'bar' and not (key == current_bar.id and current_bar.is_owner(current_user)):
+            return api_error("Not authorized to view orders for this bar")
+        if scope != 'bar' and key != current_user.id:
+            return api_error("Not authorized to view orders for this user")
+    orders, next_cursor = orders_page(scope, key, after=after)
+    html = render_template('_order_rows.html', orders=orders, scope=scope, **order_table_context())
+    return api_success({'html': html}, next_cursor=next_cursor)
+
+@app.route("/api/similar/<recipe_name>", methods=['GET'])
+def api_similar_recipes(recipe_name):
+    """Drinks like the given recipe, from the precomputed similarity index
+    :param int k: max number of results, at most similarity.NEIGHBOURS
+    :param bool all: include recipes that can't be made at the current bar
+    """
+    name = mms.resolve_recipe_name(urllib.parse.unquote_plus(recipe_name))
+    if name is None:
+        return api_error("Unknown recipe '{}'".format(recipe_name))
+    recipe_name = name
+    k = request.args.get('k', 4, type=int)
+    if not 1 <= k <= NEIGHBOURS:
+        return api_error("k must be between 1 and {}".format(NEIGHBOURS))
+    only_available = not request.args.get('all', 0, type=int)
+    similar = mms.similar_recipes(current_bar, recipe_name, k=k, only_available=only_available)
+    data = [{'name': recipe.name, 'score': round(score, 4), 'can_make': recipe.can_make, 'url': order_url(recipe.name)}
+            for recipe, score in similar]
+    return api_success(data)
+
 @app.route("/api/ingredients", methods=['GET'])
 @login_required
 @roles_accepted('admin', 'owner')
 @check_ownership
 def api_ingredients():
-    ingredients = Ingredient.query.filter_by(bar_id=current_bar.id).order_by(Ingredient.Category, Ingredient.Type).all()
-    ingredients = [i.as_dict() for i in ingredients]
-    return api_success(ingredients)
+    """All of the bar's ingredients, or with the DataTables server side
+    parameters (draw, start, length, search, order, columns) just one page
+    of them, searched and sorted in SQL, with only the requested columns
+
+    :param int since: a stock version from an earlier response, returns
+        only the ingredients changed and the iids deleted after it, or all of
+        them flagged with reset when it is ahead of the bar's version, e.g.
+        after the database was restored
+    The full and delta responses carry the current stock version, and an
+    ETag so unchanged stock is answered with 304 Not Modified
+    """
+    if 'draw' not in request.args:
+        version = stock_version(current_bar.id)
+        since = request.args.get('since', None, type=int)
+        etag = "ingredients-{}-{}-{}".format(current_bar.id, version, 'all' if since is None else since)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        elif since is None or since > version:
+            ingredients = Ingredient.query.filter_by(bar_id=current_bar.id).order_by(Ingredient.Category, Ingredient.Type).all()
+            ingredients = [i.as_dict() for i in ingredients]
+            if since is None:
+                response = api_success(ingredients, version=version)
+            else:
+                # the copy is from a version this bar never reached, it can't be patched
+                response = api_success(ingredients, version=version, reset=True)
+        else:
+            changed, deleted = [], []
+            if since < version:
+                changed = [i.as_dict() for i in Ingredient.query.filter(
+                    Ingredient.bar_id == current_bar.id, Ingredient.change_seq > since)]
+                deleted = [t.iid() for t in IngredientTombstone.query.filter(
+                    IngredientTombstone.bar_id == current_bar.id, IngredientTombstone.change_seq > since)]
+            response = api_success({'changed': changed, 'deleted': deleted}, version=version, since=since)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    # same order as the columns in ingredient_table.js, the first two are buttons
+    category_order = case({category: i for i, category in enumerate(Categories)}, value=Ingredient.Category)
+    table = DataTablesRequest(request.args,
+            [None, None, Ingredient.In_Stock, Ingredient.Kind, Ingredient.Type, category_order, Ingredient.ABV,
+                Ingredient.Size_mL, Ingredient.Size_oz, Ingredient.Price_Paid, Ingredient.Cost_per_oz],
+            searchable=[Ingredient.Kind, Ingredient.Type, Ingredient.Category])
+    fields = {request.args.get('columns[{}][data]'.format(i)) for i in range(len(table.columns))}
+    fields = [field for field in Ingredient._dict_fields if field in fields] or None
+    query = Ingredient.query.filter_by(bar_id=current_bar.id)
+    if fields:
+        query = query.options(load_only(*(['uuid'] + fields)))
+    ingredients, total, filtered = table.page(query, tiebreak=[Ingredient.Type, Ingredient.Kind])
+    return table.response([i.as_dict(fields) for i in ingredients], total, filtered)
 
 @app.route("/api/ingredient", methods=['POST', 'GET', 'PUT', 'DELETE'])
 @login_required
@@ -735,44 +1172,26 @@ def api_ingredient():
         field = request.form.get('field')
         if not field:
             return api_error("'field' is a required parameter")
-        elif field not in "Category,Type,Kind,In_Stock,ABV,Size_mL,Size_oz,Price_Paid".split(','):
-            return api_error("'{}' is not allowed to be edited via the API".format(field))
-        value = request.form.get('value')
-        if not value:
-            return api_error("'value' is a required parameter")
-
-        # TODO value constraints
+        old_type = ingredient.type_
         try:
-            # the toggle switches return 'on'/'off'
-            # but that is their current state, so toggle value here
-            if field == 'In_Stock':
-                value = {'on': False, 'off': True}[value]
-            else:
-                value = type(ingredient[field])(value)
+            edit_ingredient(ingredient, field, request.form.get('value'))
         except AttributeError:
             return api_error("Invalid field '{}' for an Ingredient".format(field))
         except ValueError as e:
             return api_error(str(e))
-
-        # special handling
-        if field == 'Size_oz':
-            # convert to mL because that's how everything works
-            ingredient['Size_mL'] = convert_units(value, 'oz', 'mL')
-        else:
-            ingredient[field] = value
-        if field in ['Size_mL', 'Size_oz', 'Price_Paid', 'Type']:
-            _update_computed_fields(ingredient)
         try:
+            mark_changed(ingredient)
             db.session.commit()
         except Exception as e:
             return api_error("{}: {}".format(e.__class__.__name__, e))
 
         data = ingredient.as_dict()
-        mms.regenerate_recipes(current_bar, ingredient=ingredient.type_)
+        mms.regenerate_recipes(current_bar, ingredients={old_type, ingredient.type_})
         return api_success(data, message='Successfully updated "{}" for "{}"'.format(field, ingredient.iid()))
 
     # delete
     elif request.method == 'DELETE':
+        mark_deleted(ingredient)
         db.session.delete(ingredient)
         db.session.commit()
         mms.regenerate_recipes(current_bar, ingredient=ingredient.type_)
@@ -780,18 +1199,183 @@ def api_ingredient():
 
     return api_error("Unknwon method")
 
+MAX_BATCH_EDITS = 500
+
+@app.route("/api/ingredients/batch", methods=['POST'])
+@login_required
+@roles_accepted('admin', 'owner')
+@check_ownership
+def api_ingredients_batch():
+    """Apply many ingredient edits in one transaction, then regenerate
+    the recipes for all the affected ingredient types once
+
+    JSON body:
+    :param list edits: of {"iid": ..., "field": ..., "value": ...}, same
+        fields and values as a PUT to /api/ingredient
+    Invalid edits are skipped and reported, the rest are applied
+    :returns: data is a list with a result per edit, in order,
+        {"iid", "field", "status", "message"} and the updated row on success
+    """
+    body = request.get_json(silent=True) or {}
+    edits = body.get('edits')
+    if not isinstance(edits, list) or not edits:
+        return api_error("'edits' must be a non-empty list")
+    if len(edits) > MAX_BATCH_EDITS:
+        return api_error("At most {} edits per batch".format(MAX_BATCH_EDITS))
+
+    # load every ingredient in the batch with one query
+    uuids = set()
+    for edit in edits:
+        try:
+            uuids.add(uuid.UUID(str(edit.get('iid', ''))[len(Ingredient._iid_prefix):]))
+        except (AttributeError, ValueError):
+            pass
+    ingredients = {i.iid(): i for i in Ingredient.query.filter(
+        Ingredient.bar_id == current_bar.id, Ingredient.uuid.in_(uuids))} if uuids else {}
+
+    results = []
+    changed = {}
+    types = set()
+    for edit in edits:
+        iid = edit.get('iid') if isinstance(edit, dict) else None
+        field = edit.get('field') if isinstance(edit, dict) else None
+        result = {'iid': iid, 'field': field, 'status': "error"}
+        results.append(result)
+        ingredient = ingredients.get(iid)
+        if ingredient is None:
+            result['message'] = "Ingredient not found"
+            continue
+        old_type = ingredient.type_
+        try:
+            edit_ingredient(ingredient, field, edit.get('value'))
+        except AttributeError:
+            result['message'] = "Invalid field '{}' for an Ingredient".format(field)
+            continue
+        except (ValueError, TypeError) as e:
+            result['message'] = str(e)
+            continue
+        result.update(status="success", message="")
+        changed[iid] = ingredient
+        types.update((old_type, ingredient.type_))
+
+    if changed:
+        version = next_stock_version(current_bar.id)
+        for ingredient in changed.values():
+            mark_changed(ingredient, version)
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # nothing was saved, including the edits that checked out
+            message = "{}: {}".format(e.__class__.__name__, e)
+            for result in results:
+                if result['status'] == "success":
+                    result.update(status="error", message="Not saved, {}".format(message))
+            return api_error(message, data=results)
+        mms.regenerate_recipes(current_bar, ingredients=types)
+        for result in results:
+            if result['status'] == "success":
+                result['data'] = changed[result['iid']].as_dict()
+
+    n_ok = sum(1 for result in results if result['status'] == "success")
+    return api_success(results, message="Applied {} of {} edits".format(n_ok, len(results)))
+
+@app.route("/api/orders/stream", methods=['GET'])
+@login_required
+def api_order_stream():
+    """Server-Sent Events of the orders placed and confirmed at the current bar
+    A "pending" event first lists the ids of all the orders waiting,
+    "order" events carry the id and the rendered html of an order,
+    "confirmed" events the id of one that no longer needs making
+    """
+    if not tends_bar():
+        return api_error("Only the bartender on duty can follow the order queue")
+    stream = order_stream(current_bar.id, render_queue_order,
+            poll_seconds=app.config.get('MIXMIND_QUEUE_POLL_SECONDS', 2),
+            lifetime=app.config.get('MIXMIND_QUEUE_STREAM_SECONDS', 300))
+    return app.response_class(stream_with_context(stream), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route("/api/orders/<int:order_id>/confirm", methods=['POST'])
+@login_required
+def api_order_confirm(order_id):
+    """One click confirm from the order queue"""
+    if not tends_bar():
+        return api_error("Only the bartender on duty can confirm orders")
+    order = Order.query.filter_by(id=order_id, bar_id=current_bar.id).one_or_none()
+    if order is None:
+        return api_error("Order {} not found".format(order_id))
+    if order.confirmed:
+        return api_success({'id': order.id}, message="Already confirmed")
+    _, error = confirm(order)
+    if error:
+        return api_error(error)
+    return api_success({'id': order.id}, message="Confirmed {} for {}".format(order.recipe_name, order.user_email))
+
+@app.route("/api/analytics/orders", methods=['GET'])
+@login_required
+@roles_accepted('admin', 'owner')
+@check_ownership
+def api_order_analytics():
+    """Order counts and time to confirm at the current bar, from the rollups
+
+    :param int days: how far back to look, default 30
+    :param string grain: "hour" or "day" for the timeline
+    :param string bar: "all" for every bar, admins only
+    :returns: data has "recipes", the most ordered recipes, and "timeline",
+        the totals per bucket, oldest first
+    """
+    days = request.args.get('days', ANALYTICS_DAYS, type=int)
+    grain = request.args.get('grain', 'day')
+    if grain not in GRAINS:
+        return api_error("grain must be one of {}".format(', '.join(GRAINS)))
+    if not 0 < days <= 366:
+        return api_error("days must be between 1 and 366")
+    bar_id = current_bar.id
+    if request.args.get('bar') == 'all':
+        if not current_user.has_role('admin'):
+            return api_error("Only admins can see every bar")
+        bar_id = None
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    return api_success({'recipes': recipe_stats(bar_id, since, limit=min(max(request.args.get('limit', 20, type=int), 1), 100)),
+        'timeline': timeline(bar_id, since, grain=grain)})
+
+@app.route("/api/jobs/<int:job_id>", methods=['GET'])
+@login_required
+@roles_accepted('admin', 'owner')
+@check_ownership
+def api_job(job_id):
+    """Status and progress of a background job at the current bar
+    :returns: data has id, kind, status, stage, message, and done and
+        total while it is running
+    """
+    job = Job.query.filter_by(id=job_id, bar_id=current_bar.id).one_or_none()
+    if job is None:
+        return api_error("Job {} not found".format(job_id))
+    return api_success(job_runner.status(job))
+
+@app.route("/api/jobs/regenerate", methods=['POST'])
+@login_required
+@roles_accepted('admin', 'owner')
+@check_ownership
+def api_regenerate():
+    """Regenerate every recipe at the current bar in the background
+    :returns: data is the status of the job, an already queued one is reused
+    """
+    job = active_job(current_bar.id, kind='regenerate') or \
+            job_runner.submit('regenerate', current_bar.id, user_id=current_user.id)
+    return api_success(job_runner.status(job), message="Regenerating recipes for {}".format(current_bar.cname))
+
 @app.route("/api/ingredients/download", methods=['GET'])
 @login_required
 @roles_accepted('admin', 'owner')
 @check_ownership
 def api_ingredients_download():
-    ingredients = Ingredient.query.filter_by(bar_id=current_bar.id).order_by(Ingredient.Category, Ingredient.Type).all()
-    ingredients = [Ingredient.csv_heading()] + [i.as_csv() for i in ingredients]
+    """Stream the bar's ingredients as a CSV that can be uploaded again"""
     filename = "{}_ingredients_{}.csv".format(current_bar.cname.replace(' ','_'), pendulum.now().int_timestamp)
-    tmp_filename = get_tmp_file()
-    with open(tmp_filename, 'w') as fp:
-        fp.writelines((i for i in ingredients))
-    return send_file(tmp_filename, 'text/csv', as_attachment=True, attachment_filename=filename)
+    rows = Barstock_SQL(current_bar.id).iter_csv(Ingredient._csv_labels)
+    return app.response_class(stream_with_context(rows), mimetype='text/csv',
+            headers={'Content-Disposition': "attachment; filename*=UTF-8''{}".format(urllib.parse.quote(filename))})
 
 @app.route("/api/user_current_bar", methods=['POST', 'GET', 'PUT', 'DELETE'])
 @login_required
@@ -867,10 +1451,10 @@ def dev_debug_error_handler_page():
 @app.route('/api/json/<recipe_name>')
 def recipe_json(recipe_name):
     recipe_name = urllib.parse.unquote_plus(recipe_name)
-    try:
-        return jsonify(mms.base_recipes[recipe_name])
-    except KeyError:
+    name = mms.resolve_recipe_name(recipe_name)
+    if name is None:
         return "{} not found".format(recipe_name)
+    return jsonify(mms.base_recipes[name])
 
 
 @app.errorhandler(500)
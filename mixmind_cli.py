@@ -4,19 +4,34 @@ Turn recipes json into a readable menu
 """
 
 import argparse
-import pickle as pickle
-from collections import Counter, defaultdict
+import copy
+import hashlib
+import math
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import json
 import jsonschema
 
 import pandas as pd
 
 import mixmind.recipe as drink_recipe
-from mixmind.barstock import Barstock
+from mixmind.barstock import Barstock_DF, Barstock_SQL
+from mixmind.compose_html import recipe_as_html
 import mixmind.formatted_menu as formatted_menu
+from mixmind.synthetic import ScaleData
 import mixmind.util as util
 
 
+BENCH_STAGES = ['load_recipe_json', 'construct', 'generate_examples_df', 'generate_examples_sql',
+        'filter_recipes', 'report_stats', 'recipe_as_html', 'tex']
+BENCH_NOISE_SECONDS = 0.001 # smaller differences from the baseline are never regressions
+
 def get_parser():
     p = argparse.ArgumentParser(description="""
 MixMind Drink Menu Generator by twschum
@@ -103,8 +118,8 @@ Example usage:
     p.add_argument('-v', '--verbose', action='store_true')
     p.add_argument('-b', '--barstock', help="Barstock csv filename")
     p.add_argument('-r', '--recipes', nargs='+', default=['recipes_schubar.json'], help="Recipes json filename(s)")
-    p.add_argument('--save_cache', action='store_true', help="Pickle the generated recipes to cache them for later use (e.g. a quicker build of the pdf)")
-    p.add_argument('--load_cache', action='store_true', help="Load the generated recipes from cache for use")
+    p.add_argument('--cache-dir', default='.mixmind_cache', help="Directory to cache the generated recipe examples in, reused while the recipe and barstock files are unchanged")
+    p.add_argument('--no-cache', action='store_true', help="Generate the recipe examples again, without reading or writing the cache")
 
     # display options
     p.add_argument('-$', '--prices', action='store_true', help="Display prices for drinks based on stock")
@@ -148,6 +163,47 @@ Example usage:
     pdf_parser.add_argument('--title', default=None, help="Title to use")
     pdf_parser.add_argument('--tagline', default=None, help="Tagline to use below the title")
 
+    # many pdf variants from one load of the recipes
+    batch_parser = subparsers.add_parser('batch', help='Generate several menu variants from a YAML or JSON spec file')
+    batch_parser.add_argument('spec', help="""Spec file with a list of variants, each an "output" basename and
+any display, filtering, or pdf options (named like the arguments) that
+differ from the command line and the spec's "defaults", e.g.
+    defaults: {prices: true, examples: true}
+    variants:
+      - {output: menu_2col, ncols: 2}
+      - {output: gin_drinks, include: [gin], liquor_list: true}""")
+    batch_parser.add_argument('-o', '--output-dir', default='.', help="Directory for the generated files")
+    batch_parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes, defaults to the number of CPUs")
+    batch_parser.add_argument('--tex-only', action='store_true', help="Only write the .tex files, skip compiling the pdfs")
+
+    # synthetic data for scale testing
+    synth_parser = subparsers.add_parser('synth', help='Generate synthetic recipes, barstock, and database fixtures for scale testing')
+    synth_parser.add_argument('output_dir', help="Directory for synthetic_recipes.json and synthetic_barstock.csv")
+    synth_parser.add_argument('--seed', type=int, default=0, help="Same seed and sizes give the same data")
+    synth_parser.add_argument('--recipes', dest='n_recipes', type=int, default=1000, help="Number of recipes")
+    synth_parser.add_argument('--bottles', type=int, default=500, help="Number of bottles in the barstock")
+    synth_parser.add_argument('--max-kinds', type=int, default=12, help="Most bottles of any one ingredient type")
+    synth_parser.add_argument('--db', default=None, help="Database url to create the tables in and load bars, users, ingredients, and orders into, e.g. sqlite:///scale.db")
+    synth_parser.add_argument('--bars', type=int, default=10, help="Number of bars loaded into the database")
+    synth_parser.add_argument('--bar-bottles', type=int, default=200, help="Bottles stocked by each bar")
+    synth_parser.add_argument('--users', type=int, default=200, help="Number of users loaded into the database")
+    synth_parser.add_argument('--orders', type=int, default=10000, help="Number of orders loaded into the database")
+    synth_parser.add_argument('--days', type=int, default=90, help="Days the orders are spread over")
+
+    # timings of the recipe pipeline
+    bench_parser = subparsers.add_parser('bench', help='Time the stages of the recipe pipeline, and compare them to a baseline')
+    bench_parser.add_argument('--synthetic', action='store_true', help="Benchmark synthetic data instead of the -r and -b files")
+    bench_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    bench_parser.add_argument('--recipes', dest='n_recipes', type=int, default=1000, help="Number of synthetic recipes")
+    bench_parser.add_argument('--bottles', type=int, default=500, help="Number of synthetic bottles")
+    bench_parser.add_argument('--max-kinds', type=int, default=12, help="Most synthetic bottles of any one ingredient type")
+    bench_parser.add_argument('--stages', nargs='+', choices=BENCH_STAGES, default=BENCH_STAGES, help="Only run these stages")
+    bench_parser.add_argument('-n', '--repeat', type=int, default=5, help="Timed runs of each stage")
+    bench_parser.add_argument('-o', '--output', default=None, help="Write the results to this json file")
+    bench_parser.add_argument('--baseline', default=None, help="Results json to compare against, fails on a regression")
+    bench_parser.add_argument('--threshold', type=float, default=0.2, help="Fraction slower than the baseline p50 that counts as a regression")
+    bench_parser.add_argument('--update-baseline', action='store_true', help="Write the results to the --baseline file instead of comparing")
+
     # Do alternate things
     test_parser = subparsers.add_parser('test', help='whatever I need it to be')
 
@@ -159,10 +215,395 @@ Example usage:
 def bundle_options(tuple_class, args):
     return tuple_class(*(getattr(args, field) for field in tuple_class._fields))
 
+def filter_options_from(opts):
+    """ FilterOptions from the command line's filtering arguments, as a dict """
+    return util.FilterOptions(
+            search=opts.get('name') or '',
+            all_=bool(opts.get('all_')),
+            include=opts.get('include') or [],
+            exclude=opts.get('exclude') or [],
+            include_use_or=bool(opts.get('use_or')),
+            exclude_use_or=bool(opts.get('use_or')),
+            style=opts.get('style') or '',
+            glass=opts.get('glass') or '',
+            prep=opts.get('prep') or '',
+            ice=opts.get('ice') or '',
+            tag=opts.get('tag') or '')
+
+CACHE_VERSION = 1 # bump when what is cached, or how examples are generated, changes
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def library_cache_key(args):
+    """ Hash of the inputs to generating the library, so any change to
+    them gets a different cache file
+    """
+    parts = {'version': CACHE_VERSION,
+            'example_limit': drink_recipe.EXAMPLE_LIMIT,
+            'recipes': [file_digest(filename) for filename in args.recipes],
+            'barstock': file_digest(args.barstock) if args.barstock else None,
+            'all': bool(args.all_ and args.barstock)}
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def dump_generated(recipe):
+    """ What generate_examples computed for a recipe, as json types """
+    Example = drink_recipe.DrinkRecipe.RecipeExample
+    stats = None
+    if recipe.stats:
+        stats = {field: value._asdict() if isinstance(value, Example) else value
+                for field, value in recipe.stats._asdict().items()}
+    return {'max_cost': recipe.max_cost, 'examples': [example._asdict() for example in recipe.examples], 'stats': stats}
+
+def load_generated(recipe, generated):
+    Example = drink_recipe.DrinkRecipe.RecipeExample
+    recipe.max_cost = generated['max_cost']
+    recipe.examples = [Example(**example) for example in generated['examples']]
+    if generated['stats']:
+        recipe.stats = drink_recipe.DrinkRecipe.RecipeStats(**{field: Example(**value) if isinstance(value, dict) else value
+            for field, value in generated['stats'].items()})
+    return recipe
+
+def read_library_cache(filename, key, base_recipes):
+    """ :returns: (recipes, liquors) from the cache file, or None if it is missing or stale """
+    try:
+        with open(filename, encoding='utf-8') as fp:
+            cached = json.load(fp)
+        if cached.get('version') != CACHE_VERSION or cached.get('key') != key:
+            return None
+        recipes = [load_generated(drink_recipe.DrinkRecipe(name, recipe), cached['recipes'][name])
+                for name, recipe in base_recipes.items()]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    liquors = [tuple(row) for row in cached['liquors']] if cached['liquors'] is not None else None
+    return recipes, liquors
+
+def write_library_cache(filename, key, recipes, liquors):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    tmp = "{}.{}".format(filename, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump({'version': CACHE_VERSION, 'key': key, 'liquors': liquors,
+            'recipes': {recipe.name: dump_generated(recipe) for recipe in recipes}}, fp)
+    os.replace(tmp, filename)
+
+def load_library(args):
+    """ Load the recipes, and the barstock if given, generating examples
+    The generated examples are cached by the content of the input files,
+    so unchanged inputs skip generating them on later runs
+    :returns: (recipes, liquors) where liquors is the (Kind, Type) list for
+        the menu's liquor list, or None without a barstock
+    """
+    base_recipes = util.load_recipe_json(args.recipes)
+    if not args.no_cache:
+        key = library_cache_key(args)
+        cache_file = os.path.join(args.cache_dir, "library-{}.json".format(key[:16]))
+        cached = read_library_cache(cache_file, key, base_recipes)
+        if cached:
+            if args.verbose:
+                print("Loaded {} generated recipes from {}".format(len(cached[0]), cache_file))
+            return cached
+
+    if args.barstock:
+        barstock = Barstock_DF.load(args.barstock, args.all_)
+        recipes = [drink_recipe.DrinkRecipe(name, recipe).generate_examples(barstock)
+            for name, recipe in base_recipes.items()]
+        liquors = formatted_menu.liquor_rows(barstock.df)
+    else:
+        recipes = [drink_recipe.DrinkRecipe(name, recipe) for name, recipe in base_recipes.items()]
+        liquors = None
+    if not args.no_cache:
+        write_library_cache(cache_file, key, recipes, liquors)
+    return recipes, liquors
+
+BATCH_OPTIONS = set(util.DisplayOptions._fields) | set(util.PdfOptions._fields) - {'pdf_filename'} | \
+        {'convert', 'all_', 'include', 'exclude', 'use_or', 'name', 'tag', 'style', 'glass', 'prep', 'ice', 'output'}
+
+def load_batch_spec(filename):
+    """ Read a batch spec, YAML unless the file ends in .json
+    :returns: (defaults, variants)
+    """
+    with open(filename) as fp:
+        if filename.endswith('.json'):
+            spec = json.load(fp)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("PyYAML is needed for YAML specs, install it or use a .json spec")
+            spec = yaml.safe_load(fp)
+    defaults = spec.get('defaults') or {}
+    variants = spec.get('variants') or []
+    outputs = set()
+    for i, variant in enumerate(variants, 1):
+        unknown = set(variant) - BATCH_OPTIONS
+        if unknown:
+            raise SystemExit("Variant {}: unknown options {}".format(i, ', '.join(sorted(unknown))))
+        if not variant.get('output'):
+            raise SystemExit("Variant {}: an output name is required".format(i))
+        if variant['output'] in outputs:
+            raise SystemExit("Variant {}: output '{}' is used twice".format(i, variant['output']))
+        outputs.add(variant['output'])
+    return defaults, variants
+
+# recipes and liquor list loaded once, shared with each batch worker
+_batch = {}
+
+def _init_batch_worker(recipes, liquors):
+    _batch['recipes'] = recipes
+    _batch['liquors'] = liquors
+
+def render_variant(opts, tex_only=False):
+    """ Filter, convert, and render one variant in a batch worker
+    :returns: dict of the output, number of recipes, and timings in seconds
+    """
+    start = time.time()
+    recipes, _ = util.filter_recipes(_batch['recipes'], filter_options_from(opts))
+    if opts.get('convert'):
+        recipes = copy.deepcopy(recipes) # workers render several variants
+        [r.convert(opts['convert']) for r in recipes]
+    selected = time.time()
+    display_options = util.DisplayOptions(**{field: opts.get(field) for field in util.DisplayOptions._fields})
+    pdf_options = util.PdfOptions(**{field: opts.get(field) for field in util.PdfOptions._fields})
+    output = formatted_menu.generate_recipes_pdf(recipes, pdf_options, display_options, _batch['liquors'], tex_only=tex_only)
+    return {'output': output, 'recipes': len(recipes), 'select': selected - start, 'render': time.time() - selected}
+
+def run_batch(args):
+    defaults, variants = load_batch_spec(args.spec)
+    if not variants:
+        print("No variants in {}".format(args.spec))
+        return
+    base = {field: getattr(args, field, None) for field in BATCH_OPTIONS}
+    base.update(ncols=2, liquor_list=False, liquor_list_own_page=False, debug=False, align=False, title=None, tagline=None)
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for variant in variants:
+        opts = dict(base, **defaults)
+        opts.update(variant)
+        opts['pdf_filename'] = os.path.join(args.output_dir, variant['output'])
+        if not args.barstock and (opts['liquor_list'] or opts['liquor_list_own_page'] or opts['examples'] or opts['prices']):
+            raise SystemExit("Variant '{}' needs a barstock file for its options".format(variant['output']))
+        jobs.append(opts)
+
+    start = time.time()
+    recipes, liquors = load_library(args)
+    loaded = time.time()
+    print("Loaded {} recipes in {:.2f}s".format(len(recipes), loaded - start))
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_batch_worker, initargs=(recipes, liquors or [])) as pool:
+        futures = [(opts['output'], pool.submit(render_variant, opts, args.tex_only)) for opts in jobs]
+        for output, future in futures:
+            try:
+                results[output] = future.result()
+            except Exception as e:
+                results[output] = {'error': "{}: {}".format(e.__class__.__name__, e)}
+
+    width = max(len(output) for output in results)
+    print("{:<{w}}  {:>7}  {:>8}  {:>8}  {}".format("variant", "recipes", "select", "render", "file", w=width))
+    for opts in jobs:
+        result = results[opts['output']]
+        if 'error' in result:
+            print("{:<{w}}  failed: {}".format(opts['output'], result['error'], w=width))
+            continue
+        print("{:<{w}}  {:>7}  {:>7.2f}s  {:>7.2f}s  {}".format(opts['output'], result['recipes'],
+            result['select'], result['render'], result['output'], w=width))
+    failed = sum('error' in result for result in results.values())
+    print("{} variants in {:.2f}s ({:.2f}s rendering in total){}".format(len(jobs), time.time() - loaded,
+        sum(result.get('render', 0) for result in results.values()), ", {} failed".format(failed) if failed else ""))
+    if failed:
+        raise SystemExit(1)
+
+def run_synth(args):
+    data = ScaleData(seed=args.seed, recipes=args.n_recipes, bottles=args.bottles, bars=args.bars, users=args.users,
+            orders=args.orders, bar_bottles=args.bar_bottles, max_kinds=args.max_kinds, days=args.days)
+    os.makedirs(args.output_dir, exist_ok=True)
+    recipes_file = os.path.join(args.output_dir, 'synthetic_recipes.json')
+    barstock_file = os.path.join(args.output_dir, 'synthetic_barstock.csv')
+    data.write_recipes(recipes_file)
+    data.write_barstock(barstock_file)
+    print("Wrote {} recipes to {}".format(len(data.recipes()), recipes_file))
+    print("Wrote {} bottles of {} types to {}".format(len(data.catalog()), len(data.types()), barstock_file))
+    if args.db:
+        start = time.time()
+        data.load_database(args.db, progress=lambda table, rows: print("Loaded {} rows into {}".format(rows, table)))
+        print("Loaded {} in {:.1f}s, run `flask rollup-backfill` there for the order analytics".format(args.db, time.time() - start))
+
+def percentile(values, fraction):
+    """ Nearest rank percentile """
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(fraction * len(ordered))) - 1)]
+
+def time_stage(run, setup=None, repeat=5):
+    """ Time run(setup()) repeat times, then once more traced for memory
+    :returns: (seconds of each run, peak traced memory in bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+@contextmanager
+def sqlite_barstock(barstock_file, include_all=False):
+    """ Barstock_SQL over the csv loaded into an in-memory SQLite database,
+    in an app of its own so the configured database is left alone
+    """
+    from flask import Flask
+    from mixmind.database import db
+    from mixmind.models import Bar
+    from mixmind.ingredient import Ingredient
+    bench_app = Flask('mixmind_bench')
+    bench_app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(bench_app)
+    with bench_app.app_context():
+        db.create_all()
+        db.session.add(Bar(id=1, cname='bench', name="Bench"))
+        db.session.commit()
+        barstock = Barstock_SQL(1)
+        barstock.load_from_csv([barstock_file], 1, replace_existing=False)
+        if include_all:
+            Ingredient.query.update({'In_Stock': True})
+            db.session.commit()
+        try:
+            yield barstock
+        finally:
+            db.session.remove()
+
+def bench_inputs(args, directory):
+    """ :returns: (recipe files, barstock file), written to the directory if synthetic """
+    if not args.synthetic:
+        if not args.barstock:
+            raise SystemExit("bench needs a barstock file (-b), or --synthetic")
+        return args.recipes, args.barstock
+    data = ScaleData(seed=args.seed, recipes=args.n_recipes, bottles=args.bottles, max_kinds=args.max_kinds)
+    recipes_file = os.path.join(directory, 'synthetic_recipes.json')
+    barstock_file = os.path.join(directory, 'synthetic_barstock.csv')
+    data.write_recipes(recipes_file)
+    data.write_barstock(barstock_file)
+    return [recipes_file], barstock_file
+
+def run_stages(args, recipe_files, barstock_file, directory):
+    """ :returns: OrderedDict of stage -> (seconds of each run, peak memory) """
+    base_recipes = util.load_recipe_json(recipe_files)
+    def construct(_=None):
+        return [drink_recipe.DrinkRecipe(name, recipe) for name, recipe in base_recipes.items()]
+    def generate(barstock):
+        def run(recipes):
+            for recipe in recipes:
+                recipe.generate_examples(barstock)
+        return run
+    barstock = Barstock_DF.load(barstock_file, args.all_)
+    generated = construct()
+    generate(barstock)(generated)
+    common = Counter(i.specifier.ingredient for recipe in generated for i in recipe._get_quantized_ingredients()).most_common(1)
+    filters = [filter_options_from({}), filter_options_from({'include': [name for name, _ in common]}),
+            filter_options_from({'style': 'longdrink', 'all_': True})]
+    can_make = [recipe for recipe in generated if recipe.can_make]
+    display_options = util.DisplayOptions(prices=True, stats=False, examples=True, all_ingredients=False,
+            markup=1.1, prep_line=True, origin=False, info=True, variants=True)
+    pdf_options = util.PdfOptions(pdf_filename=os.path.join(directory, 'bench_menu'), ncols=2, liquor_list=True,
+            liquor_list_own_page=False, debug=False, align=False, title="Benchmark", tagline="")
+    liquors = formatted_menu.liquor_rows(barstock.df)
+    def reset_stats():
+        for recipe in generated:
+            recipe.stats = None
+        return generated
+
+    stages = {
+        'load_recipe_json': lambda: time_stage(lambda _: util.load_recipe_json(recipe_files), repeat=args.repeat),
+        'construct': lambda: time_stage(construct, repeat=args.repeat),
+        'generate_examples_df': lambda: time_stage(generate(barstock), construct, repeat=args.repeat),
+        'filter_recipes': lambda: time_stage(lambda _: [util.filter_recipes(generated, options) for options in filters],
+            repeat=args.repeat),
+        'report_stats': lambda: time_stage(util.report_stats, reset_stats, repeat=args.repeat),
+        'recipe_as_html': lambda: time_stage(lambda _: [recipe_as_html(recipe, display_options) for recipe in can_make],
+            repeat=args.repeat),
+        'tex': lambda: time_stage(lambda _: formatted_menu.generate_recipes_pdf(can_make, pdf_options, display_options,
+            liquors, tex_only=True), repeat=args.repeat),
+        }
+    results = OrderedDict()
+    for stage in BENCH_STAGES:
+        if stage not in args.stages:
+            continue
+        print("Running {}...".format(stage))
+        if stage == 'generate_examples_sql':
+            with sqlite_barstock(barstock_file, args.all_) as sql_barstock:
+                results[stage] = time_stage(generate(sql_barstock), construct, repeat=args.repeat)
+        else:
+            results[stage] = stages[stage]()
+    return results
+
+def compare_to_baseline(results, baseline, threshold):
+    """ :returns: dict of stage -> change of the p50 from the baseline's,
+        and the list of stages that regressed
+    """
+    changes, regressions = {}, []
+    for stage, result in results['stages'].items():
+        base = baseline['stages'].get(stage)
+        if not base:
+            continue
+        changes[stage] = (result['p50'] - base['p50']) / base['p50'] if base['p50'] else 0.0
+        if changes[stage] > threshold and result['p50'] - base['p50'] > BENCH_NOISE_SECONDS:
+            regressions.append(stage)
+    return changes, regressions
+
+def run_bench(args):
+    with tempfile.TemporaryDirectory(prefix='mixmind-bench-') as directory:
+        recipe_files, barstock_file = bench_inputs(args, directory)
+        inputs = {'recipes': [file_digest(filename) for filename in recipe_files], 'barstock': file_digest(barstock_file),
+                'all': bool(args.all_)}
+        stages = run_stages(args, recipe_files, barstock_file, directory)
+    results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'repeat': args.repeat,
+                'synthetic': {'seed': args.seed, 'recipes': args.n_recipes, 'bottles': args.bottles,
+                    'max_kinds': args.max_kinds} if args.synthetic else None,
+                'inputs': hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'stages': OrderedDict((stage, {'p50': percentile(times, 0.5), 'p95': percentile(times, 0.95),
+                'mean': sum(times) / len(times), 'runs': len(times), 'peak_kib': peak // 1024})
+                for stage, (times, peak) in stages.items())}
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    baseline = None
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        print("Saved the baseline to {}".format(args.baseline))
+    elif args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if baseline['meta'].get('inputs') != results['meta']['inputs']:
+            print("Warning: the baseline was run on different inputs, timings may not be comparable")
+    changes, regressions = compare_to_baseline(results, baseline, args.threshold) if baseline else ({}, [])
+
+    width = max(len(stage) for stage in results['stages'])
+    print("{:<{w}}  {:>10}  {:>10}  {:>10}  {:>8}".format("stage", "p50 ms", "p95 ms", "peak KiB", "vs base", w=width))
+    for stage, result in results['stages'].items():
+        change = "{:+.0%}".format(changes[stage]) if stage in changes else ""
+        print("{:<{w}}  {:>10.2f}  {:>10.2f}  {:>10}  {:>8}{}".format(stage, result['p50'] * 1000, result['p95'] * 1000,
+            result['peak_kib'], change, "  REGRESSION" if stage in regressions else "", w=width))
+    if regressions:
+        print("{} stage(s) more than {:.0%} slower than {}".format(len(regressions), args.threshold, args.baseline))
+        raise SystemExit(1)
+
 def main():
     args = get_parser().parse_args()
     display_options = bundle_options(util.DisplayOptions, args)
-    filter_options = bundle_options(util.FilterOptions, args)
+    filter_options = filter_options_from(vars(args))
     pd.set_option('display.expand_frame_repr', False)
 
     if args.command == 'test':
@@ -204,32 +645,23 @@ def main():
             print("{} passes schema")
         return
 
-    RECIPES_CACHE_FILE = 'cache_recipes.pkl'
-    BARSTOCK_CACHE_FILE = 'cache_barstock.pkl'
-    if args.load_cache:
-        barstock = Barstock(pd.read_pickle(BARSTOCK_CACHE_FILE))
-        with open(CACHE_FILE) as fp:
-            recipes, filter_options = pickle.load(fp)
-            print("Loaded {} recipes from cache file with options:\n{}\n{}".format(len(recipes), filter_options))
+    if args.command == 'batch':
+        run_batch(args)
+        return
 
-    else:
-        base_recipes = util.load_recipe_json(args.recipes)
-        if args.barstock:
-            barstock = Barstock.load(args.barstock, args.all_)
-            recipes = [drink_recipe.DrinkRecipe(name, recipe).generate_examples(barstock)
-                for name, recipe in base_recipes.items()]
-        else:
-            recipes = [drink_recipe.DrinkRecipe(name, recipe) for name, recipe in base_recipes.items()]
-        if args.convert:
-            print("Converting recipes to unit: {}".format(args.convert))
-            [r.convert(args.convert) for r in recipes]
-        recipes, excluded = util.filter_recipes(recipes, filter_options)
-
-    if args.save_cache:
-        barstock.df.to_pickle(BARSTOCK_CACHE_FILE)
-        with open(RECIPE_CACHE_FILE, 'w') as fp:
-            pickle.dump((recipes, filter_options), fp)
-            print("Saved recipes and barstock to cache file".format(len(recipes)))
+    if args.command == 'synth':
+        run_synth(args)
+        return
+
+    if args.command == 'bench':
+        run_bench(args)
+        return
+
+    recipes, liquors = load_library(args)
+    if args.convert:
+        print("Converting recipes to unit: {}".format(args.convert))
+        [r.convert(args.convert) for r in recipes]
+    recipes, excluded = util.filter_recipes(recipes, filter_options)
 
     if args.stats and recipes:
         stats = util.report_stats(recipes)
@@ -242,11 +674,8 @@ def main():
             if args.liquor_list or args.liquor_list_own_page or args.examples or args.prices:
                 print("Must have a barstock file for these options")
                 return
-            barstock_df = None
-        else:
-            barstock_df = barstock.df
         pdf_options = bundle_options(util.PdfOptions, args)
-        formatted_menu.generate_recipes_pdf(recipes, pdf_options, display_options, barstock_df)
+        formatted_menu.generate_recipes_pdf(recipes, pdf_options, display_options, liquors)
         return
 
     if args.command == 'txt':
@@ -0,0 +1,6 @@
+""" The app is created with the 'testing' environment of instance/config.py,
+see instance/config_example.py, before any test module imports it
+"""
+import os
+
+os.environ['FLASK_ENV'] = 'testing'
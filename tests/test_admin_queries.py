@@ -0,0 +1,55 @@
+""" The admin dashboard's aggregate queries: order counts per bar and per
+user, and role names, each looked up in one query
+"""
+import pytest
+
+from mixmind import app, db
+from mixmind.models import Bar, Order, Role, RolesUsers, User
+from mixmind.views import bar_summaries, order_counts, role_names
+
+@pytest.fixture
+def ctx():
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+@pytest.fixture
+def user(ctx):
+    user = User(email='admin-queries@example.com')
+    db.session.add(user)
+    db.session.commit()
+    yield user
+    Order.query.filter_by(user_id=user.id).delete()
+    RolesUsers.query.filter_by(user_id=user.id).delete()
+    Role.query.filter(Role.name.in_(['test-barback', 'test-closer'])).delete(synchronize_session=False)
+    User.query.filter_by(id=user.id).delete()
+    db.session.commit()
+
+def summary_counts():
+    return {summary['bar'].id: summary['orders'] for summary in bar_summaries()}
+
+def test_bar_summaries_count_orders(user):
+    bar = Bar.query.order_by(Bar.id).first()
+    before = summary_counts()
+    assert set(before) == {bar.id for bar in Bar.query}
+    db.session.add_all([Order(bar_id=bar.id, user_id=user.id, recipe_name="Negroni") for _ in range(3)])
+    db.session.commit()
+    after = summary_counts()
+    assert after[bar.id] == before[bar.id] + 3
+    assert {id_: n for id_, n in after.items() if id_ != bar.id} == \
+            {id_: n for id_, n in before.items() if id_ != bar.id}
+
+def test_order_counts_only_for_given_keys(user):
+    bar = Bar.query.order_by(Bar.id).first()
+    db.session.add_all([Order(bar_id=bar.id, user_id=user.id, recipe_name="Negroni") for _ in range(2)])
+    db.session.commit()
+    assert order_counts(Order.user_id, [user.id]) == {user.id: 2}
+    assert order_counts(Order.user_id, [-1]) == {}
+
+def test_role_names(user):
+    roles = [Role(name='test-closer'), Role(name='test-barback')]
+    db.session.add_all(roles)
+    db.session.commit()
+    db.session.add_all([RolesUsers(user_id=user.id, role_id=role.id) for role in roles])
+    db.session.commit()
+    assert role_names([user.id, -1]) == {user.id: 'test-barback, test-closer'}
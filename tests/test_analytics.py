@@ -0,0 +1,121 @@
+""" Order rollups: counted as orders are placed and confirmed, rebuilt from
+the order history by backfill, and summed into the analytics reports
+"""
+import datetime
+import importlib.util
+import os
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+import mixmind
+from mixmind import app, db
+from mixmind.analytics import backfill, bucket_start, recipe_stats, record_confirm, record_order, timeline
+from mixmind.models import Order, OrderRollup
+
+BAR_ID = 9045 # no such bar, keeps these orders apart from any others
+START = datetime.datetime(2026, 3, 6, 21, 15)
+
+# recipe, minutes after START it was ordered, seconds to confirm or None
+ORDERS = [('Negroni', 0, 60), ('Negroni', 10, 120), ('Martini', 20, None),
+        ('Negroni', 50, 30), ('Martini', 24*60, 90), ('Daiquiri', 26*60, None)]
+
+@pytest.fixture
+def ctx():
+    with app.app_context():
+        yield
+        db.session.rollback()
+        Order.query.filter_by(bar_id=BAR_ID).delete()
+        OrderRollup.query.filter_by(bar_id=BAR_ID).delete()
+        db.session.commit()
+
+def place_orders():
+    """ The way the order views record them, one transaction each """
+    for name, minutes, seconds in ORDERS:
+        order = Order(bar_id=BAR_ID, recipe_name=name, timestamp=START + datetime.timedelta(minutes=minutes))
+        db.session.add(order)
+        record_order(order)
+        db.session.commit()
+        if seconds is not None:
+            order.confirmed = order.timestamp + datetime.timedelta(seconds=seconds)
+            record_confirm(order)
+            db.session.commit()
+
+def rollups():
+    columns = 'recipe_name grain bucket orders confirmed confirm_seconds min_confirm_seconds max_confirm_seconds'.split()
+    return sorted(tuple(getattr(row, column) for column in columns)
+            for row in OrderRollup.query.filter_by(bar_id=BAR_ID))
+
+def test_bucket_start():
+    assert bucket_start(START, 'hour') == datetime.datetime(2026, 3, 6, 21)
+    assert bucket_start(START, 'day') == datetime.datetime(2026, 3, 6)
+
+def test_record_order_and_confirm(ctx):
+    place_orders()
+    negroni = OrderRollup.query.filter_by(bar_id=BAR_ID, recipe_name='Negroni', grain='hour',
+            bucket=bucket_start(START, 'hour')).one()
+    assert (negroni.orders, negroni.confirmed, negroni.confirm_seconds) == (2, 2, 180)
+    assert (negroni.min_confirm_seconds, negroni.max_confirm_seconds) == (60, 120)
+    negroni = OrderRollup.query.filter_by(bar_id=BAR_ID, recipe_name='Negroni', grain='day').one()
+    assert (negroni.orders, negroni.confirmed, negroni.confirm_seconds) == (3, 3, 210)
+    assert (negroni.min_confirm_seconds, negroni.max_confirm_seconds) == (30, 120)
+    martini = OrderRollup.query.filter_by(bar_id=BAR_ID, recipe_name='Martini', grain='day', bucket=bucket_start(START, 'day')).one()
+    assert (martini.orders, martini.confirmed, martini.min_confirm_seconds) == (1, 0, None)
+    assert OrderRollup.query.filter_by(bar_id=BAR_ID, grain='hour').count() == 5
+
+def test_backfill_matches_recorded(ctx):
+    place_orders()
+    recorded = rollups()
+    db.session.add(Order(bar_id=BAR_ID, recipe_name='Negroni')) # no timestamp, not counted
+    db.session.commit()
+    OrderRollup.query.filter_by(bar_id=BAR_ID).update({'orders': 99})
+    db.session.commit()
+    assert backfill(BAR_ID, batch=2) == len(ORDERS)
+    assert rollups() == recorded
+
+def test_recipe_stats(ctx):
+    place_orders()
+    stats = recipe_stats(BAR_ID, START)
+    assert [(row['recipe_name'], row['orders'], row['confirmed']) for row in stats] == \
+            [('Negroni', 3, 3), ('Martini', 2, 1), ('Daiquiri', 1, 0)]
+    assert stats[0]['mean_confirm_seconds'] == 70.0
+    assert stats[2]['mean_confirm_seconds'] is None
+    assert [row['recipe_name'] for row in recipe_stats(BAR_ID, START, limit=1)] == ['Negroni']
+    first_day = recipe_stats(BAR_ID, START, until=datetime.datetime(2026, 3, 7))
+    assert [(row['recipe_name'], row['orders']) for row in first_day] == [('Negroni', 3), ('Martini', 1)]
+
+def test_timeline(ctx):
+    place_orders()
+    days = timeline(BAR_ID, START)
+    assert [(row['bucket'], row['orders'], row['confirmed']) for row in days] == \
+            [('2026-03-06T00:00:00', 4, 3), ('2026-03-07T00:00:00', 2, 1)]
+    hours = timeline(BAR_ID, START, grain='hour')
+    assert [row['orders'] for row in hours] == [3, 1, 1, 1]
+    assert hours[0]['mean_confirm_seconds'] == 90.0
+
+def test_migration_fills_rollups(ctx):
+    """ The a3c7e5b9d614 migration rolls up the existing orders the same as backfill """
+    place_orders()
+    expected = rollups()
+    OrderRollup.query.filter_by(bar_id=BAR_ID).delete()
+    db.session.commit()
+    if OrderRollup.query.count():
+        pytest.skip("the migration only fills an empty order_rollup table")
+    path = os.path.join(os.path.dirname(mixmind.__file__), 'migrations', 'a3c7e5b9d614_order_rollups.py')
+    spec = importlib.util.spec_from_file_location('order_rollups_migration', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    def upgrade():
+        with db.engine.begin() as connection:
+            with Operations.context(MigrationContext.configure(connection)):
+                migration.upgrade()
+    try:
+        upgrade()
+        assert rollups() == expected
+        upgrade() # the table has rows now, they aren't counted twice
+        assert rollups() == expected
+    finally:
+        OrderRollup.query.delete() # including other bars' orders it rolled up
+        db.session.commit()
@@ -0,0 +1,59 @@
+""" Paging through the browse results with /api/recipes: cursors carry the
+filters and position, and the total and facets cover all of the results
+"""
+import pytest
+
+from mixmind import app
+from mixmind.views import encode_cursor
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+def get(client, **args):
+    response = client.get('/api/recipes', query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+def names(result):
+    return [recipe['name'] for recipe in result['data']]
+
+def test_cursor_pages_through_all_results(client):
+    everything = get(client, search='gin', limit=100)
+    assert everything['status'] == 'success'
+    assert everything['next_cursor'] is None
+    assert everything['total'] == len(everything['data']) > 2
+
+    seen = []
+    result = get(client, search='gin', limit=2)
+    while True:
+        assert result['total'] == everything['total']
+        assert len(result['data']) <= 2
+        seen += names(result)
+        if not result['next_cursor']:
+            break
+        result = get(client, cursor=result['next_cursor'], limit=2)
+    assert seen == names(everything)
+
+def test_facets_count_all_results(client):
+    result = get(client, search='gin', limit=1)
+    assert len(result['data']) == 1
+    assert sum(result['facets']['glass'].values()) == result['total']
+
+def test_filter_fields_without_the_csv_fields(client):
+    result = get(client, glass='rocks', limit=100)
+    assert result['status'] == 'success'
+    assert all('rocks' in glass for glass in result['facets']['glass'])
+
+def test_rendered_with_order_links(client):
+    recipe = get(client, search='gin', limit=1)['data'][0]
+    assert recipe['url'].startswith('/order/')
+    assert recipe['html']
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor(offset=0)])
+def test_invalid_cursor(client, cursor):
+    assert get(client, cursor=cursor)['message'] == "Invalid cursor"
+
+def test_cursor_for_another_bar(client):
+    cursor = encode_cursor(bar=-1, offset=1, sorting=None, filter={})
+    assert get(client, cursor=cursor)['message'] == "Cursor is for a different bar, start over"
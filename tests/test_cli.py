@@ -0,0 +1,127 @@
+""" The command line's library cache, keyed by the content of the recipe and
+barstock files, and its batch spec files
+"""
+import json
+import os
+import shutil
+
+import pytest
+
+import mixmind_cli
+from mixmind.barstock import Barstock_DF
+from mixmind.recipe import DrinkRecipe
+
+RECIPES = {
+    'Manhattan': {'ingredients': {'rye whiskey': 2, 'sweet vermouth': 1, 'aromatic bitters': '2 dashes'}, 'prep': 'stir'},
+    'Daiquiri': {'ingredients': {'white rum': 2, 'lime juice': 0.75, 'simple syrup': 0.5}},
+    'Last Word': {'ingredients': {'dry gin': 0.75, 'green chartreuse': 0.75, 'maraschino liqueur': 0.75, 'lime juice': 0.75}},
+    }
+BARSTOCK = """Category,Type,Kind,In Stock,ABV,Size (mL),Price Paid
+Spirit,Rye Whiskey,Rittenhouse,1,50,750,$28.00
+Spirit,White Rum,Plantation 3 Stars,1,41.2,750,$22.00
+Spirit,Dry Gin,Beefeater,1,44,750,$20.00
+Vermouth,Sweet Vermouth,Cocchi,1,16,750,$18.00
+Bitters,Aromatic Bitters,Angostura,1,44.7,118,$9.00
+Juice,Lime Juice,Fresh,1,0,45,$0.80
+Syrup,Simple Syrup,Homemade,1,0,1000,$1.00
+Liqueur,Maraschino Liqueur,Luxardo,0,32,750,$30.00
+"""
+
+def write_json(path, data):
+    with open(str(path), 'w') as fp:
+        json.dump(data, fp)
+    return str(path)
+
+@pytest.fixture
+def args(tmpdir):
+    recipes = write_json(tmpdir.join('recipes.json'), RECIPES)
+    barstock = tmpdir.join('barstock.csv')
+    barstock.write(BARSTOCK)
+    return mixmind_cli.get_parser().parse_args(['-r', recipes, '-b', str(barstock),
+        '--cache-dir', str(tmpdir.join('cache')), 'txt'])
+
+def generated(recipes):
+    return {recipe.name: mixmind_cli.dump_generated(recipe) for recipe in recipes}
+
+def test_library_cache_round_trip(args, monkeypatch):
+    recipes, liquors = mixmind_cli.load_library(args)
+    assert len(os.listdir(args.cache_dir)) == 1
+    assert [recipe.name for recipe in recipes] == list(RECIPES)
+    by_name = {recipe.name: recipe for recipe in recipes}
+    assert by_name['Manhattan'].examples
+    assert not by_name['Last Word'].examples
+
+    def no_barstock(*args):
+        raise AssertionError("loaded the barstock instead of the cache")
+    monkeypatch.setattr(Barstock_DF, 'load', no_barstock)
+    cached, cached_liquors = mixmind_cli.load_library(args)
+    assert generated(cached) == generated(recipes)
+    assert cached_liquors == [tuple(row) for row in liquors]
+    assert cached[0].examples[0].cost == recipes[0].examples[0].cost
+
+def test_generated_stats_round_trip(args):
+    recipes, _ = mixmind_cli.load_library(args)
+    manhattan = next(recipe for recipe in recipes if recipe.name == 'Manhattan')
+    manhattan.calculate_stats()
+    dumped = json.loads(json.dumps(mixmind_cli.dump_generated(manhattan)))
+    loaded = mixmind_cli.load_generated(DrinkRecipe('Manhattan', RECIPES['Manhattan']), dumped)
+    assert loaded.stats.avg_cost == manhattan.stats.avg_cost
+    assert loaded.stats.min_cost == manhattan.stats.min_cost
+    assert mixmind_cli.dump_generated(loaded) == mixmind_cli.dump_generated(manhattan)
+
+def test_cache_key_follows_file_contents(args, tmpdir):
+    key = mixmind_cli.library_cache_key(args)
+    os.utime(args.barstock, (0, 0)) # only the content counts
+    assert mixmind_cli.library_cache_key(args) == key
+    copy = str(tmpdir.join('copy.json'))
+    shutil.copy(args.recipes[0], copy)
+    args.recipes = [copy]
+    assert mixmind_cli.library_cache_key(args) == key
+
+    with open(args.barstock, 'a') as fp:
+        fp.write("Liqueur,Green Chartreuse,Chartreuse,1,55,750,$60.00\n")
+    assert mixmind_cli.library_cache_key(args) != key
+    args.all_ = True
+    assert len({key, mixmind_cli.library_cache_key(args)}) == 2
+
+def test_stale_or_broken_cache_is_ignored(args, tmpdir):
+    recipes, liquors = mixmind_cli.load_library(args)
+    key = mixmind_cli.library_cache_key(args)
+    cache_file = os.path.join(args.cache_dir, os.listdir(args.cache_dir)[0])
+    base_recipes = mixmind_cli.util.load_recipe_json(args.recipes)
+    assert mixmind_cli.read_library_cache(cache_file, key, base_recipes) is not None
+    assert mixmind_cli.read_library_cache(cache_file, 'other key', base_recipes) is None
+    assert mixmind_cli.read_library_cache(cache_file, key, dict(base_recipes, Sazerac={})) is None
+    assert mixmind_cli.read_library_cache(str(tmpdir.join('missing.json')), key, base_recipes) is None
+    with open(cache_file, 'w') as fp:
+        fp.write('{"version": 1, "key": "')
+    assert mixmind_cli.read_library_cache(cache_file, key, base_recipes) is None
+
+def test_batch_spec(tmpdir):
+    spec = write_json(tmpdir.join('spec.json'), {'defaults': {'prices': True},
+        'variants': [{'output': 'menu', 'ncols': 3}, {'output': 'gin', 'include': ['gin'], 'liquor_list': True}]})
+    defaults, variants = mixmind_cli.load_batch_spec(spec)
+    assert defaults == {'prices': True}
+    assert [variant['output'] for variant in variants] == ['menu', 'gin']
+
+@pytest.mark.parametrize('variants, message', [
+    ([{'output': 'menu', 'colour': 'red'}], "Variant 1: unknown options colour"),
+    ([{'output': 'menu'}, {'ncols': 2}], "Variant 2: an output name is required"),
+    ([{'output': 'menu'}, {'output': 'menu'}], "Variant 2: output 'menu' is used twice"),
+    ])
+def test_bad_batch_spec(tmpdir, variants, message):
+    spec = write_json(tmpdir.join('spec.json'), {'variants': variants})
+    with pytest.raises(SystemExit) as error:
+        mixmind_cli.load_batch_spec(spec)
+    assert str(error.value) == message
+
+def test_render_variant(args, tmpdir):
+    recipes, liquors = mixmind_cli.load_library(args)
+    mixmind_cli._init_batch_worker(recipes, liquors)
+    opts = {field: getattr(args, field, None) for field in mixmind_cli.BATCH_OPTIONS}
+    opts.update(ncols=2, liquor_list=True, liquor_list_own_page=False, debug=False, align=False, title=None,
+            tagline=None, include=['lime juice'], convert='mL', pdf_filename=str(tmpdir.join('lime')))
+    result = mixmind_cli.render_variant(opts, tex_only=True)
+    assert result['recipes'] == 1 # the Daiquiri, the Last Word can't be made
+    assert os.path.exists(result['output'])
+    assert recipes[1].unit == 'oz' # converted copies, the shared recipes are left alone
@@ -0,0 +1,63 @@
+""" DataTables server side requests: paging, ordering, and search applied in
+SQL, with the counts before and after the search
+"""
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from mixmind import app, db
+from mixmind.datatables import MAX_LENGTH, DataTablesRequest
+from mixmind.models import Order
+
+BAR_ID = 9035 # no such bar, keeps these orders apart from any others
+NAMES = ['Negroni', 'Martini', 'Daiquiri', 'Gimlet', '100% Agave', 'Mai_Tai', 'Dry Martini']
+COLUMNS = [Order.id, Order.recipe_name, None]
+
+@pytest.fixture
+def orders():
+    with app.app_context():
+        added = [Order(bar_id=BAR_ID, recipe_name=name) for name in NAMES]
+        db.session.add_all(added)
+        db.session.commit()
+        yield {order.recipe_name: order.id for order in added}
+        Order.query.filter_by(bar_id=BAR_ID).delete()
+        db.session.commit()
+
+def page(args):
+    table = DataTablesRequest(MultiDict(args), COLUMNS, searchable=[Order.recipe_name])
+    rows, total, filtered = table.page(Order.query.filter_by(bar_id=BAR_ID), tiebreak=Order.id)
+    return table, [row.recipe_name for row in rows], total, filtered
+
+def test_paging(orders):
+    table, names, total, filtered = page({'draw': '3', 'start': '2', 'length': '3'})
+    assert table.draw == 3
+    assert names == NAMES[2:5]
+    assert total == filtered == len(NAMES)
+
+def test_length_limits(orders):
+    assert DataTablesRequest(MultiDict({'length': '-1'}), COLUMNS).length == MAX_LENGTH
+    assert DataTablesRequest(MultiDict({'length': '100000'}), COLUMNS).length == MAX_LENGTH
+    assert DataTablesRequest(MultiDict({'start': '-5'}), COLUMNS).start == 0
+
+def test_ordering(orders):
+    _, names, _, _ = page({'order[0][column]': '1', 'order[0][dir]': 'desc'})
+    assert names == sorted(NAMES, reverse=True)
+    # unsortable and unknown columns are ignored, leaving the tiebreak
+    _, names, _, _ = page({'order[0][column]': '2', 'order[1][column]': '9'})
+    assert names == NAMES
+
+def test_search_counts(orders):
+    _, names, total, filtered = page({'search[value]': ' martini ', 'length': '1'})
+    assert names == ['Martini']
+    assert (total, filtered) == (len(NAMES), 2)
+
+@pytest.mark.parametrize('search, found', [('100%', ['100% Agave']), ('_', ['Mai_Tai']), ('%', ['100% Agave'])])
+def test_search_is_literal(orders, search, found):
+    _, names, _, filtered = page({'search[value]': search})
+    assert names == found
+    assert filtered == len(found)
+
+def test_response(orders):
+    with app.test_request_context():
+        table, _, total, filtered = page({'draw': '7'})
+        response = table.response([], total, filtered, extra=1).get_json()
+    assert response == {'draw': 7, 'recordsTotal': len(NAMES), 'recordsFiltered': len(NAMES), 'data': [], 'extra': 1}
@@ -0,0 +1,117 @@
+""" Delta sync of a bar's ingredients with /api/ingredients: responses carry
+the stock version, since= returns only what changed after it, and a whole
+CSV load is a single version
+"""
+import csv
+
+import pytest
+
+from mixmind import app, db
+from mixmind.authorization import user_datastore
+from mixmind.barstock import Barstock_SQL, stock_version
+from mixmind.configuration_management import invalidate_bar_config
+from mixmind.ingredient import Ingredient, IngredientTombstone
+from mixmind.models import Bar, RolesUsers, User
+
+FIELDS = ['Category', 'Type', 'Kind', 'ABV', 'Size (mL)', 'Price Paid']
+STOCK = [['Spirit', 'Dry Gin', 'Beefeater', '44', '750', '20'],
+        ['Vermouth', 'Sweet Vermouth', 'Cocchi', '16', '750', '18']]
+MORE_STOCK = [['Liqueur', 'Campari', 'Campari', '24', '750', '25']]
+
+@pytest.fixture
+def bar():
+    with app.app_context():
+        bar = Bar(cname='sync-test', name='Sync Test')
+        db.session.add(bar)
+        db.session.commit()
+        invalidate_bar_config()
+        yield bar
+        Ingredient.query.filter_by(bar_id=bar.id).delete()
+        IngredientTombstone.query.filter_by(bar_id=bar.id).delete()
+        Bar.query.filter_by(id=bar.id).delete()
+        db.session.commit()
+        invalidate_bar_config()
+
+@pytest.fixture
+def client(bar):
+    """ Logged in as an admin whose current bar is the test bar """
+    user = user_datastore.create_user(email='sync-test@example.com', active=True, current_bar_id=bar.id,
+            roles=[user_datastore.find_role('admin')])
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    yield client
+    RolesUsers.query.filter_by(user_id=user.id).delete()
+    User.query.filter_by(id=user.id).delete()
+    db.session.commit()
+
+def write_csv(tmpdir, rows, name='stock.csv'):
+    path = tmpdir.join(name)
+    with open(str(path), 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+    return str(path)
+
+def load(bar, *paths, replace_existing=True):
+    Barstock_SQL(bar.id).load_from_csv(list(paths), bar.id, replace_existing=replace_existing)
+
+def get(client, **args):
+    response = client.get('/api/ingredients', query_string=args)
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+def kinds(ingredients):
+    return sorted(ingredient['Kind'] for ingredient in ingredients)
+
+def test_csv_load_is_one_version(bar, tmpdir):
+    before = stock_version(bar.id)
+    load(bar, write_csv(tmpdir, STOCK), write_csv(tmpdir, MORE_STOCK, 'more.csv'))
+    assert stock_version(bar.id) == before + 1
+    assert {i.change_seq for i in Ingredient.query.filter_by(bar_id=bar.id)} == {before + 1}
+    load(bar, write_csv(tmpdir, STOCK))
+    assert stock_version(bar.id) == before + 2
+    assert {t.change_seq for t in IngredientTombstone.query.filter_by(bar_id=bar.id)} == {before + 2}
+
+def test_full_and_delta_responses(bar, client, tmpdir):
+    load(bar, write_csv(tmpdir, STOCK))
+    full = get(client)
+    version = full['version']
+    assert version == stock_version(bar.id)
+    assert kinds(full['data']) == ['Beefeater', 'Cocchi']
+
+    delta = get(client, since=version)
+    assert delta['data'] == {'changed': [], 'deleted': []}
+    assert (delta['version'], delta['since']) == (version, version)
+
+    load(bar, write_csv(tmpdir, MORE_STOCK), replace_existing=False)
+    delta = get(client, since=version)
+    assert delta['version'] == version + 1
+    assert kinds(delta['data']['changed']) == ['Campari']
+    assert delta['data']['deleted'] == []
+    before_replace = full['data'] + delta['data']['changed']
+
+    load(bar, write_csv(tmpdir, MORE_STOCK))
+    delta = get(client, since=version + 1)
+    assert kinds(delta['data']['changed']) == ['Campari']
+    assert sorted(delta['data']['deleted']) == sorted(i['iid'] for i in before_replace)
+
+def test_reset_when_ahead_of_the_bar(bar, client, tmpdir):
+    load(bar, write_csv(tmpdir, STOCK))
+    version = stock_version(bar.id)
+    ahead = get(client, since=version + 10)
+    assert ahead['reset'] is True
+    assert ahead['version'] == version
+    assert kinds(ahead['data']) == ['Beefeater', 'Cocchi']
+
+def test_etag(bar, client, tmpdir):
+    load(bar, write_csv(tmpdir, STOCK))
+    response = client.get('/api/ingredients', query_string={'since': 0})
+    etag = response.headers['ETag']
+    assert client.get('/api/ingredients', query_string={'since': 0},
+            headers={'If-None-Match': etag}).status_code == 304
+    load(bar, write_csv(tmpdir, MORE_STOCK), replace_existing=False)
+    assert client.get('/api/ingredients', query_string={'since': 0},
+            headers={'If-None-Match': etag}).status_code == 200
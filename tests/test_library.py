@@ -0,0 +1,92 @@
+""" Presorted stat orders and facet counts of a bar's RecipeLibrary, and
+recipe lookup by name or slug
+"""
+import unicodedata
+
+import pytest
+
+from mixmind.library import RecipeLibrary, RecipeNameIndex
+from mixmind.recipe import DrinkRecipe
+
+COSTS = {'Negroni': 3.0, 'Martini': 2.5, 'Daiquiri': 1.5, 'Gimlet': 2.0, 'Sazerac': None, 'Aviation': None,
+        'Margarita': 1.0, 'Mai Tai': 4.0, 'Sidecar': 3.5}
+ATTRIBUTES = {
+    'Negroni': {'glass': 'rocks', 'prep': 'stir'},
+    'Martini': {'glass': 'cocktail', 'prep': 'stir'},
+    'Sazerac': {'glass': 'rocks glass', 'prep': 'stir', 'ice': 'neat'},
+    'Mai Tai': {'glass': 'double rocks', 'ice': 'crushed', 'tag': 'tiki'},
+    }
+
+def make_recipe(name, cost):
+    recipe = DrinkRecipe(name, dict(ATTRIBUTES.get(name, {}), ingredients={'gin': 2}))
+    if cost is not None:
+        recipe.stats = DrinkRecipe.RecipeStats()
+        recipe.stats.avg_cost = cost
+        recipe.stats.avg_abv = 20
+        recipe.stats.avg_std_drinks = cost / 2
+    return recipe
+
+@pytest.fixture
+def library():
+    return RecipeLibrary([make_recipe(name, cost) for name, cost in COSTS.items()])
+
+def names(recipes):
+    return [recipe.name for recipe in recipes]
+
+def expected(recipes, reverse=False):
+    """ The order a plain sort on the stat gives, those without stats last """
+    with_stats = sorted((r for r in recipes if r.stats), key=lambda r: r.stats.avg_cost, reverse=reverse)
+    return names(with_stats) + [r.name for r in recipes if not r.stats]
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_sort_dense_subset(library, reverse):
+    subset = [r for r in library if r.name != 'Martini']
+    assert len(subset) * 4 > len(library)
+    assert names(library.sort(subset, 'cost', reverse=reverse)) == expected(subset, reverse)
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_sort_sparse_subset(library, reverse):
+    subset = [library.by_name['Sazerac'], library.by_name['Mai Tai']]
+    assert len(subset) * 4 <= len(library)
+    assert names(library.sort(subset, 'cost', reverse=reverse)) == ['Mai Tai', 'Sazerac']
+    subset = [library.by_name['Negroni'], library.by_name['Margarita']]
+    assert names(library.sort(subset, 'cost', reverse=reverse)) == expected(subset, reverse)
+
+def test_sort_after_reindex(library):
+    library.by_name['Margarita'].stats.avg_cost = 10.0
+    library.reindex()
+    assert names(library.sort(list(library), 'cost'))[:1] == ['Daiquiri']
+    assert names(library.sort(list(library), 'cost', reverse=True))[:1] == ['Margarita']
+
+def test_facet_counts(library):
+    counts = RecipeLibrary.facet_counts(library)
+    assert counts['prep']['stir'] == 3
+    assert counts['prep']['shake'] == len(library) - 3
+    assert counts['ice']['crushed'] == 1
+    assert counts['tag']['tiki'] == 1
+    # substring match like the filter, "rocks" also counts "rocks glass" and "double rocks"
+    assert counts['glass']['rocks'] == 3
+    assert counts['glass']['rocks glass'] == 1
+
+def test_facet_counts_for_choices(library):
+    counts = RecipeLibrary.facet_counts(library, choices={'glass': ['', 'Rocks', 'Flute']})
+    assert counts['glass'] == {'rocks': 3, 'flute': 0}
+    assert counts['prep']['stir'] == 3
+
+def test_name_index_resolves_names_and_slugs():
+    index = RecipeNameIndex(['Piña Colada', 'Martinez', "Bee's Knees"])
+    assert len(index) == 3
+    assert index.resolve('Martinez') == 'Martinez'
+    assert index.resolve('  MARTINEZ ') == 'Martinez'
+    assert index.resolve('pina-colada') == 'Piña Colada'
+    assert index.resolve(unicodedata.normalize('NFD', 'Piña Colada')) == 'Piña Colada'
+    assert index.resolve(index.slug("Bee's Knees")) == "Bee's Knees"
+    assert index.resolve('Manhattan') is None
+    assert 'martinez' in index and 'manhattan' not in index
+
+def test_name_index_unique_slugs():
+    index = RecipeNameIndex(['Pina Colada', 'Piña Colada', 'PINA COLADA!'])
+    slugs = [index.slug(name) for name in sorted(index.names)]
+    assert len(set(slugs)) == 3
+    for name in index.names:
+        assert index.resolve(index.slug(name)) == name
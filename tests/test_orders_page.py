@@ -0,0 +1,60 @@
+""" Keyset pagination of the order tables: newest first, ties broken by id,
+and orders without a timestamp listed last
+"""
+import datetime
+
+import pytest
+
+from mixmind import app, db
+from mixmind.models import Order
+from mixmind.views import CURSOR_TIME_FORMAT, decode_cursor, orders_page
+
+BAR_ID = 9033 # no such bar, keeps these orders apart from any others
+
+@pytest.fixture
+def orders():
+    with app.app_context():
+        start = datetime.datetime(2026, 1, 1, 18, 30)
+        timestamps = [start, start, start + datetime.timedelta(minutes=5), None,
+                start - datetime.timedelta(days=1), None, start, start + datetime.timedelta(microseconds=1)]
+        added = [Order(bar_id=BAR_ID, timestamp=timestamp, recipe_name="Negroni") for timestamp in timestamps]
+        db.session.add_all(added)
+        db.session.commit()
+        newest_first = sorted(added, key=lambda o: (o.timestamp is None, -(o.timestamp or start).timestamp(), -o.id))
+        yield [order.id for order in newest_first]
+        Order.query.filter_by(bar_id=BAR_ID).delete()
+        db.session.commit()
+
+def after(cursor):
+    """ The (timestamp, id) to continue from, as the /api/orders view reads it """
+    state = decode_cursor(cursor)
+    assert (state['scope'], state['key']) == ('bar', BAR_ID)
+    timestamp = state['timestamp'] and datetime.datetime.strptime(state['timestamp'], CURSOR_TIME_FORMAT)
+    return (timestamp or None, state['id'])
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 5, 8, 20])
+def test_pages_cover_every_order_once(orders, limit):
+    with app.app_context():
+        seen = []
+        page, cursor = orders_page('bar', BAR_ID, limit=limit)
+        seen += [order.id for order in page]
+        while cursor:
+            page, cursor = orders_page('bar', BAR_ID, after=after(cursor), limit=limit)
+            assert 0 < len(page) <= limit
+            seen += [order.id for order in page]
+        assert seen == orders
+
+def test_cursor_from_an_order_without_timestamp(orders):
+    with app.app_context():
+        page, cursor = orders_page('bar', BAR_ID, limit=len(orders) - 1)
+        assert page[-1].timestamp is None
+        assert decode_cursor(cursor)['timestamp'] is None
+        page, cursor = orders_page('bar', BAR_ID, after=after(cursor))
+        assert [order.id for order in page] == orders[-1:]
+        assert cursor is None
+
+def test_last_page_has_no_cursor(orders):
+    with app.app_context():
+        page, cursor = orders_page('bar', BAR_ID, limit=len(orders))
+        assert len(page) == len(orders)
+        assert cursor is None
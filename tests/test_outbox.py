@@ -0,0 +1,140 @@
+""" The mail outbox against a local stand-in SMTP server: queued mail is
+sent when the outbox flushes, failed sends are retried with backoff, and
+mail that keeps failing is kept as a dead letter
+"""
+import datetime
+import os
+import socket
+
+import pytest
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller
+
+os.environ['FLASK_ENV'] = 'testing' # before the app is created, see instance/config_example.py
+from mixmind import app, db, notifier
+from mixmind.models import OutboxMail
+from mixmind.notifier import SMTPPool, enqueue_mail, outbox
+
+RETRY_SECONDS = 30
+
+class Handler(object):
+    """ Accepts mail, or refuses it with a temporary error while failing is set """
+    def __init__(self):
+        self.received = []
+        self.failing = False
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failing:
+            return '451 Try again later'
+        self.received.append(envelope)
+        return '250 OK'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = Handler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    pool = SMTPPool('127.0.0.1', controller.port)
+    monkeypatch.setattr(notifier, 'smtp_pool', pool)
+    yield handler
+    pool.close()
+    controller.stop()
+
+@pytest.fixture
+def ctx(monkeypatch):
+    with app.test_request_context():
+        monkeypatch.setattr(app.extensions['mail'], 'suppress', False)
+        monkeypatch.setattr(outbox, 'max_attempts', 3)
+        monkeypatch.setattr(outbox, 'retry_seconds', RETRY_SECONDS)
+        monkeypatch.setattr(notifier.random, 'uniform', lambda a, b: 1.0) # no jitter
+        OutboxMail.query.delete()
+        db.session.commit()
+        yield
+        db.session.rollback()
+        OutboxMail.query.delete()
+        db.session.commit()
+
+def queue(recipient='guest@example.com'):
+    item = enqueue_mail("[Mix-Mind] Test", recipient, 'simple', heading="Hello", message="Just a test")
+    db.session.commit()
+    return item
+
+def make_due(item):
+    """ Skip waiting for the retry """
+    item.next_attempt = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+
+def assert_retry_in(item, seconds, before):
+    after = datetime.datetime.utcnow()
+    delay = datetime.timedelta(seconds=seconds)
+    assert before + delay <= item.next_attempt <= after + delay
+
+def test_enqueued_mail_is_sent(ctx, smtp_server):
+    item = queue()
+    assert item.status == 'pending'
+    assert smtp_server.received == []
+
+    assert outbox.flush() == 1
+    assert item.status == 'sent'
+    assert item.attempts == 1
+    assert item.sent is not None
+    assert [envelope.rcpt_tos for envelope in smtp_server.received] == [['guest@example.com']]
+    assert "Just a test" in smtp_server.received[0].content.decode('utf-8')
+
+    assert outbox.flush() == 0
+
+def test_failed_send_is_retried_with_backoff(ctx, smtp_server):
+    smtp_server.failing = True
+    item = queue()
+
+    before = datetime.datetime.utcnow()
+    outbox.flush()
+    assert item.status == 'pending'
+    assert item.attempts == 1
+    assert '451' in item.last_error
+    assert_retry_in(item, RETRY_SECONDS, before)
+
+    # not due yet
+    assert outbox.flush() == 0
+
+    make_due(item)
+    before = datetime.datetime.utcnow()
+    outbox.flush()
+    assert item.status == 'pending'
+    assert item.attempts == 2
+    assert_retry_in(item, RETRY_SECONDS * 2, before)
+
+    smtp_server.failing = False
+    make_due(item)
+    outbox.flush()
+    assert item.status == 'sent'
+    assert item.attempts == 3
+    assert len(smtp_server.received) == 1
+
+def test_dead_letter_after_max_attempts(ctx, smtp_server):
+    smtp_server.failing = True
+    item = queue()
+    for attempt in range(outbox.max_attempts):
+        make_due(item)
+        outbox.flush()
+    assert item.status == 'dead'
+    assert item.attempts == outbox.max_attempts
+    assert '451' in item.last_error
+
+    # left alone, however long it waits
+    make_due(item)
+    assert outbox.flush() == 0
+    assert smtp_server.received == []
+
+    # until it is put back in the queue
+    smtp_server.failing = False
+    assert outbox.retry(item.id)
+    outbox.flush()
+    assert item.status == 'sent'
+    assert len(smtp_server.received) == 1
+    assert not outbox.retry(item.id)
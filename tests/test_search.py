@@ -0,0 +1,60 @@
+""" Fuzzy recipe search with the trigram index, and the browse filters
+applied on top of its hits
+"""
+from mixmind.recipe import DrinkRecipe
+from mixmind.search import TrigramIndex, normalize
+from mixmind.util import FilterOptions, filter_recipes
+
+RECIPES = {
+    'Negroni': {'ingredients': {'gin': 1, 'campari': 1, 'sweet vermouth': 1}, 'glass': 'rocks', 'prep': 'stir'},
+    'Martini': {'ingredients': {'gin': 2, 'dry vermouth': 0.5}, 'glass': 'cocktail', 'prep': 'stir'},
+    'Daiquiri': {'ingredients': {'white rum': 2, 'lime juice': 0.75, 'simple syrup': 0.5}},
+    'Gin Fizz': {'ingredients': {'gin': 2, 'lemon juice': 1, 'club soda': 2}, 'glass': 'highball'},
+    }
+
+def recipes():
+    return [DrinkRecipe(name, recipe) for name, recipe in RECIPES.items()]
+
+def names(results):
+    return [name for name, _ in results]
+
+def filter_options(**kwargs):
+    options = dict(search='', all_=True, include=[], exclude=[], include_use_or=False, exclude_use_or=False,
+            style='', glass='', prep='', ice='', tag='')
+    options.update(kwargs)
+    return FilterOptions(**options)
+
+def test_normalize():
+    assert normalize("Crème de Cassis!") == "creme de cassis"
+
+def test_name_match_ranks_first():
+    index = TrigramIndex(recipes())
+    assert names(index.search("gin"))[0] == 'Gin Fizz'
+    assert set(names(index.search("gin"))) == {'Gin Fizz', 'Negroni', 'Martini'}
+
+def test_more_query_words_matched_ranks_higher():
+    index = TrigramIndex(recipes())
+    assert names(index.search("gin campari"))[0] == 'Negroni'
+
+def test_typos_and_prefixes():
+    index = TrigramIndex(recipes())
+    assert names(index.search("negorni"))[:1] == ['Negroni']
+    assert names(index.search("daiquri"))[:1] == ['Daiquiri']
+    assert set(names(index.search("vermo"))) == {'Negroni', 'Martini'}
+    assert index.search("xylophone") == []
+    assert index.search("  ") == []
+
+def test_search_limit():
+    index = TrigramIndex(recipes())
+    assert len(index.search("gin", limit=2)) == 2
+
+def test_filters_apply_to_search_hits():
+    all_recipes = recipes()
+    index = TrigramIndex(all_recipes)
+    found, excluded = filter_recipes(all_recipes, filter_options(search="gin", glass="rocks"), search_index=index)
+    assert [recipe.name for recipe in found] == ['Negroni']
+    assert excluded == ['Daiquiri', 'Gin Fizz', 'Martini']
+
+    found, _ = filter_recipes(all_recipes, filter_options(search="gin", exclude=['campari']), search_index=index)
+    ranked = [name for name in names(index.search("gin")) if name != 'Negroni']
+    assert [recipe.name for recipe in found] == ranked
@@ -0,0 +1,59 @@
+""" The "drinks like this" index: neighbours are ranked by cosine similarity
+of the recipe profiles, and only k of them are kept per recipe
+"""
+import pytest
+
+from mixmind.recipe import DrinkRecipe
+from mixmind.similarity import SimilarityIndex, recipe_profile
+
+RECIPES = {
+    'Negroni': {'ingredients': {'gin': 1, 'campari': 1, 'sweet vermouth': 1}, 'glass': 'rocks', 'prep': 'stir'},
+    'Boulevardier': {'ingredients': {'bourbon': 1.5, 'campari': 1, 'sweet vermouth': 1}, 'glass': 'rocks', 'prep': 'stir'},
+    'Americano': {'ingredients': {'campari': 1, 'sweet vermouth': 1, 'club soda': 2}, 'glass': 'highball', 'prep': 'build'},
+    'Daiquiri': {'ingredients': {'white rum': 2, 'lime juice': 0.75, 'simple syrup': 0.5}},
+    'Gimlet': {'ingredients': {'gin': 2, 'lime juice': 0.75, 'simple syrup': 0.5}},
+    'Water': {'ingredients': {}, 'glass': 'pint', 'prep': 'pour'},
+    }
+
+def recipes():
+    return [DrinkRecipe(name, recipe) for name, recipe in RECIPES.items()]
+
+def names(results):
+    return [name for name, _ in results]
+
+def test_profile_proportions():
+    profile = recipe_profile(DrinkRecipe('Negroni', RECIPES['Negroni']))
+    assert profile['campari'] == pytest.approx(1/3)
+    assert sum(weight for feature, weight in profile.items() if ':' not in feature) == pytest.approx(1)
+    assert 'glass:rocks' in profile and 'prep:stir' in profile
+
+def test_neighbours_best_first():
+    index = SimilarityIndex(recipes())
+    assert len(index) == len(RECIPES)
+    assert names(index.similar('Negroni'))[0] == 'Boulevardier'
+    assert names(index.similar('Daiquiri'))[0] == 'Gimlet'
+    scores = [score for _, score in index.similar('Negroni')]
+    assert scores == sorted(scores, reverse=True)
+    assert all(0 < score <= 1 for score in scores)
+
+def test_never_own_neighbour():
+    index = SimilarityIndex(recipes())
+    for name in RECIPES:
+        assert name not in names(index.similar(name))
+
+def test_unrelated_recipes_are_not_neighbours():
+    index = SimilarityIndex(recipes())
+    assert 'Daiquiri' not in names(index.similar('Negroni'))
+    assert index.similar('Water') == []
+    assert index.similar('Not A Drink') == []
+
+def test_k_limits():
+    index = SimilarityIndex(recipes(), k=2)
+    assert len(index.similar('Negroni')) == 2
+    assert len(index.similar('Negroni', k=1)) == 1
+    with pytest.raises(ValueError):
+        index.similar('Negroni', k=3)
+
+def test_single_recipe():
+    index = SimilarityIndex(recipes()[:1])
+    assert index.similar('Negroni') == []
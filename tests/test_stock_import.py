@@ -0,0 +1,167 @@
+""" Ingredient CSV uploads: row by row validation, the preview diff against
+the bar's stock, and applying a confirmed upload from an import job
+"""
+import io
+import json
+
+import pytest
+
+from mixmind import app, db
+from mixmind.barstock import Barstock_Memory, stock_version
+from mixmind.ingredient import Ingredient, IngredientTombstone
+from mixmind.jobs import JobError, run_import
+from mixmind.models import Bar, Job, PendingImport
+from mixmind.recipe import DrinkRecipe
+from mixmind.stock_import import (MAX_ERRORS, apply_import, discard_pending, load_pending, parse_csv, plan_import,
+        save_pending)
+
+HEADING = "Category,Ingredient,Kind,In Stock,ABV,Size (mL),Price Paid\n"
+STOCK = HEADING + """Spirit,Dry Gin,Beefeater,1,44,750,$20
+Vermouth,Sweet Vermouth,Cocchi,1,16,750,18
+Liqueur,Campari,Campari,0,24,750,25
+"""
+
+def parse(text):
+    return parse_csv(io.BytesIO(text.encode('utf-8')))
+
+@pytest.fixture
+def bar():
+    with app.app_context():
+        bar = Bar(cname='import-test', name='Import Test')
+        db.session.add(bar)
+        db.session.commit()
+        yield bar
+        db.session.rollback()
+        Ingredient.query.filter_by(bar_id=bar.id).delete()
+        IngredientTombstone.query.filter_by(bar_id=bar.id).delete()
+        PendingImport.query.filter_by(bar_id=bar.id).delete()
+        Job.query.filter_by(bar_id=bar.id).delete()
+        Bar.query.filter_by(id=bar.id).delete()
+        db.session.commit()
+
+def stocked(bar, text=STOCK):
+    rows, _, _ = parse(text)
+    apply_import(bar.id, rows, replace_existing=True)
+    return rows
+
+def negroni(bar):
+    """ The recipe as the live library has it, with can_make for the bar's stock """
+    recipe = DrinkRecipe('Negroni', {'ingredients': {'dry gin': 1, 'campari': 1, 'sweet vermouth': 1}})
+    return recipe.generate_examples(Barstock_Memory(bar.id, Ingredient.query.filter_by(bar_id=bar.id)))
+
+def test_parse_rows():
+    rows, errors, n_errors = parse('\ufeff' + STOCK) # with a byte order mark
+    assert (errors, n_errors) == ([], 0)
+    assert sorted(rows) == [('Campari', 'Campari'), ('Dry Gin', 'Beefeater'), ('Sweet Vermouth', 'Cocchi')]
+    gin = rows[('Dry Gin', 'Beefeater')]
+    assert gin == {'Category': 'Spirit', 'Type': 'Dry Gin', 'Kind': 'Beefeater', 'In_Stock': True,
+            'ABV': 44.0, 'Size_mL': 750.0, 'Price_Paid': 20.0}
+    assert rows[('Campari', 'Campari')]['In_Stock'] is False
+
+def test_parse_later_rows_win():
+    rows, _, _ = parse(STOCK + "Spirit,Dry Gin,Beefeater,1,40,1000,30\n")
+    assert len(rows) == 3
+    assert rows[('Dry Gin', 'Beefeater')]['ABV'] == 40.0
+
+def test_parse_errors():
+    rows, errors, n_errors = parse(HEADING + """Spirit,Dry Gin,,1,44,750,20
+Spirit,Dry Gin,Beefeater,1,strong,750,20
+Potion,Dry Gin,Beefeater,1,44,750,20
+Spirit,Dry Gin,Tanqueray,1,47,750,25
+""")
+    assert list(rows) == [('Dry Gin', 'Tanqueray')]
+    assert n_errors == 3
+    assert errors[0] == "Line 2: Ingredient and Kind are required"
+    assert errors[1].startswith("Line 3: invalid value")
+    assert errors[2] == "Line 4: unknown Category 'Potion'"
+
+def test_parse_unknown_columns_are_not_errors():
+    rows, errors, n_errors = parse("Ingredient,Kind,Notes\nDry Gin,Beefeater,house pour\n")
+    assert list(rows) == [('Dry Gin', 'Beefeater')]
+    assert n_errors == 0
+    assert errors == ["Line 1: unknown columns ignored: Notes"]
+
+def test_parse_error_limit():
+    rows, errors, n_errors = parse(HEADING + "Spirit,Dry Gin,,1,44,750,20\n" * (MAX_ERRORS + 10))
+    assert rows == {}
+    assert (len(errors), n_errors) == (MAX_ERRORS, MAX_ERRORS + 10)
+
+def test_parse_unreadable_file():
+    rows, errors, n_errors = parse_csv(io.BytesIO(b"Ingredient,Kind\n\xff\xfe\xfa,x\n"))
+    assert n_errors == 1
+    assert "could not read file" in errors[0]
+
+def test_plan_merge(bar):
+    stocked(bar)
+    rows, _, _ = parse(HEADING + """Spirit,Dry Gin,Beefeater,1,44,750,20.00
+Liqueur,Campari,Campari,1,24,750,25
+Spirit,Dry Gin,Tanqueray,1,47,750,25
+""")
+    recipes = [negroni(bar)]
+    assert not recipes[0].can_make
+    plan = plan_import(bar.id, rows, False, recipes)
+    assert [row['Kind'] for row in plan['inserts']] == ['Tanqueray']
+    assert plan['updates'] == [{'Type': 'Campari', 'Kind': 'Campari', 'changes': {'In_Stock': (False, True)}}]
+    assert plan['unchanged'] == 1
+    assert plan['deletes'] == []
+    assert (plan['gained'], plan['lost']) == (['Negroni'], [])
+    # only a preview
+    assert not Ingredient.query.filter_by(bar_id=bar.id, Type='Campari').one().In_Stock
+
+def test_plan_replace(bar):
+    stocked(bar, STOCK.replace('Liqueur,Campari,Campari,0', 'Liqueur,Campari,Campari,1'))
+    rows, _, _ = parse(HEADING + "Spirit,Dry Gin,Beefeater,1,44,750,20\n")
+    recipes = [negroni(bar)]
+    assert recipes[0].can_make
+    plan = plan_import(bar.id, rows, True, recipes)
+    assert sorted(row['Kind'] for row in plan['deletes']) == ['Campari', 'Cocchi']
+    assert (plan['gained'], plan['lost']) == ([], ['Negroni'])
+
+def test_apply_is_one_version(bar):
+    before = stock_version(bar.id)
+    stocked(bar)
+    rows, _, _ = parse(HEADING + "Spirit,Dry Gin,Tanqueray,1,47,750,25\n")
+    types = apply_import(bar.id, rows, replace_existing=True)
+    assert stock_version(bar.id) == before + 2
+    assert types == {'dry gin', 'sweet vermouth', 'campari'}
+    assert [i.Kind for i in Ingredient.query.filter_by(bar_id=bar.id)] == ['Tanqueray']
+    assert {t.change_seq for t in IngredientTombstone.query.filter_by(bar_id=bar.id)} == {before + 2}
+
+def test_pending_round_trip(bar):
+    rows, _, _ = parse(STOCK)
+    token = save_pending(bar.id, rows, True, 'stock.csv', 7)
+    pending = load_pending(token)
+    assert pending == {'bar_id': bar.id, 'replace_existing': True, 'filename': 'stock.csv',
+            'stock_version': 7, 'rows': rows}
+    discard_pending(token)
+    assert load_pending(token) is None
+    assert load_pending('not a token') is None
+
+def import_job(bar, token, version):
+    job = Job(kind='import', bar_id=bar.id, status='running', attempts=1,
+            payload=json.dumps({'token': token, 'replace_existing': True, 'stock_version': version,
+                'filename': 'stock.csv', 'n_rows': 3}))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def test_import_job(bar):
+    rows, _, _ = parse(STOCK)
+    token = save_pending(bar.id, rows, True, 'stock.csv', stock_version(bar.id))
+    job = import_job(bar, token, stock_version(bar.id))
+    stages = set()
+    result = run_import(job, lambda stage, done, total: stages.add(stage))
+    assert result == {'filename': 'stock.csv', 'ingredients': 3, 'types': ['campari', 'dry gin', 'sweet vermouth']}
+    assert stages == {'import', 'regenerate'}
+    assert job.stage == 'regenerate'
+    assert Ingredient.query.filter_by(bar_id=bar.id).count() == 3
+    assert load_pending(token) is None
+
+def test_import_job_after_the_stock_changed(bar):
+    rows, _, _ = parse(STOCK)
+    token = save_pending(bar.id, rows, True, 'stock.csv', stock_version(bar.id))
+    job = import_job(bar, token, stock_version(bar.id))
+    stocked(bar)
+    with pytest.raises(JobError):
+        run_import(job, lambda stage, done, total: None)
+    assert load_pending(token) is not None